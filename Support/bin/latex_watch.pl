@@ -451,7 +451,7 @@ sub parse_log {
         # An error occurred during typesetting
 
         $typesetting_errors = 1;
-        my $texparser_command = "texparser.py '$logname' "
+        my $texparser_command = "texparser.py -tail '$logname' "
           . "'$wd/$name' -notify $notification_token";
         my $output = `$texparser_command`;
         $output =~ /.*Notification\ Token:\ \|(\d+)\|/;
@@ -467,7 +467,8 @@ sub parse_log {
 
         $typesetting_errors = 0;
         close_notification_window();
-        fail_unless_system( "texparser.py", "$logname", "$wd/$name" );
+        fail_unless_system( "texparser.py", "-tail", "$logname",
+            "$wd/$name" );
 
     }
     elsif ($typesetting_errors) {
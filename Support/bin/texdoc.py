@@ -45,7 +45,8 @@ sys.path.insert(
 
 from io import open
 from os import chdir, getenv, mkdir
-from os.path import basename, exists, expanduser, getmtime, splitext
+from os.path import (basename, exists, expanduser, getmtime, isfile, join,
+                     splitext)
 from pickle import load, dump
 from pipes import quote as shellquote
 from subprocess import check_output
@@ -54,7 +55,9 @@ try:
 except ImportError:
     from urllib import quote  # Python 2
 
-from tex import (find_tex_packages, find_tex_directives, find_file_to_typeset)
+from kpathsea import Database
+from project import ProjectGraph
+from tex import find_tex_directives, find_file_to_typeset
 
 # -- Functions ----------------------------------------------------------------
 
@@ -63,9 +66,10 @@ def get_documentation_files(texmf_directory):
     """Get a dictionary containing tex documentation files.
 
     This function searches all directories under the ``texmf`` root for dvi or
-    pdf files that might be documentation. It returns a dictionary containing
-    file-paths. The dictionary uses the filenames without their extensions as
-    keys.
+    pdf files that might be documentation. If the root contains a ``ls-R``
+    database, then we search the database instead of the directories. It
+    returns a dictionary containing file-paths. The dictionary uses the
+    filenames without their extensions as keys.
 
     Arguments:
 
@@ -85,6 +89,14 @@ def get_documentation_files(texmf_directory):
         /.../scrguide.pdf
 
     """
+    # Read the database of the tree instead of searching the whole tree
+    database = join(texmf_directory, 'ls-R')
+    if isfile(database):
+        return {
+            basename(splitext(path)[0]): path
+            for path in Database([database]).files(texmf_directory,
+                                                   ('.pdf', '.dvi'))
+        }
     doc_files = check_output(
         r"find -E {} -regex '.*\.(pdf|dvi)' -type f".format(
             shellquote(texmf_directory)),
@@ -234,7 +246,9 @@ if __name__ == '__main__':
     master_file, master_dir = find_file_to_typeset(
         find_tex_directives(getenv("TM_FILEPATH")))
     chdir(master_dir)
-    packages = find_tex_packages(master_file)
+    project = ProjectGraph(master_file)
+    project.update()
+    packages = project.packages()
 
     texmf_directory = check_output("kpsewhich --expand-path '$TEXMFMAIN'",
                                    shell=True,
@@ -42,28 +42,42 @@ sys.path.insert(
     path.dirname(path.dirname(path.abspath(__file__))) + "/lib/Python")
 
 from argparse import ArgumentParser, ArgumentTypeError
+from atexit import register
 from glob import glob
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from io import open
 from os import chdir, getenv, putenv, remove
-from os.path import (basename, dirname, exists, getmtime, isfile, normpath,
-                     realpath, splitext)
+from os.path import (basename, dirname, exists, getmtime, isfile, join,
+                     normpath, realpath, relpath, splitext)
 from pickle import load, dump
 from pipes import quote as shellquote
 from re import match, search
-from subprocess import (call, CalledProcessError, check_output, Popen, PIPE,
-                        STDOUT)
+from shutil import rmtree
+from subprocess import call, CalledProcessError, check_output
 from sys import exit, version_info
 from textwrap import dedent
+from timeit import default_timer
 try:
     from urllib.parse import quote  # Python 3
 except ImportError:
     from urllib import quote  # Python 2
 
 from auxiliary import remove_auxiliary_files
+from builddir import (get_build_directory, prepare_build_directory, sync_back,
+                      working_directory)
+from events import BufferedOutput, EventList, HTMLRenderer, PassAggregator
 from gutter import update_marks
+from manifest import (Manifest, bibtex_hash, biber_hash, fingerprint,
+                      makeglossaries_hash, makeindex_hash, makeindex_style,
+                      uses_bibtex)
 from parsing import (BibTexParser, BiberParser, ChkTexParser, LaTexParser,
                      MakeGlossariesParser, MakeIndexParser, LaTexMkParser)
-from tex import (find_file_to_typeset, find_tex_directives, find_tex_packages)
+from pipeline import FailFast, read_command, run_command, Watchdog
+from preamble import PreambleFormat
+from project import ProjectGraph
+from tex import (EXIT_FILE_ERROR, find_file_to_typeset, find_tex_directives,
+                 find_tex_includes)
 from tmprefs import Preferences
 
 # -- Module Import ------------------------------------------------------------
@@ -84,13 +98,137 @@ EXIT_TEX_ENGINE_NOT_FOUND = 1
 EXIT_DISCARD = 200
 EXIT_SHOW_TOOL_TIP = 206
 
+# -- Global Variables ---------------------------------------------------------
+
+# The locations of the applications ``get_app_path`` already looked up
+APP_PATHS = {}
+
+# The documents ``viewer_has_document`` already checked, for each viewer
+OPEN_DOCUMENTS = {}
+
+# The options that stop an engine from writing its output document. We use
+# them for passes of LaTeX that only need to update the auxiliary files.
+DRAFT_OPTIONS = {
+    'lualatex': '-draftmode',
+    'pdflatex': '-draftmode',
+    'xelatex': '-no-pdf',
+}
+
 # -- Functions ----------------------------------------------------------------
 
 
-def run_bibtex(filename, verbose=False):
+def run_unless_unchanged(program, name, checksum, run, force=False):
+    """Run ``program`` only if its input changed since its last successful run.
+
+    Arguments:
+
+        program
+
+            The name of the program we want to run.
+
+        name
+
+            The name of the tex file without its extension. We store the
+            manifest for this file in ``.name.lbm``.
+
+        checksum
+
+            A function that returns a hash of the input of ``program``. If
+            the hash is ``None``, then we always run ``program``. After a
+            successful run we call the function again: Some programs, such
+            as bibtex, only produce the files the hash covers in their first
+            run.
+
+        run
+
+            A function that runs ``program`` and returns its result.
+
+        force
+
+            Specifies if we should run ``program`` even if its input did not
+            change.
+
+    Returns: ``(int, bool, int, int)``
+
+    Examples:
+
+        >>> from os import remove
+        >>> run = lambda: (0, False, 0, 1)
+        >>> checksum = lambda: 'c0fe'
+        >>> run_unless_unchanged('makeindex', 'test', checksum, run)
+        (0, False, 0, 1)
+        >>> run_unless_unchanged('makeindex', 'test', checksum, run)
+        ... # doctest:+ELLIPSIS
+        <p class="info">Skipped makeindex...
+        (0, False, 0, 1)
+        >>> run_unless_unchanged('makeindex', 'test', checksum, run,
+        ...                      force=True)
+        (0, False, 0, 1)
+
+        Store the hash of the input that exists after the first run
+
+        >>> checksums = iter([None, 'b1b'])
+        >>> run_unless_unchanged('bibtex', 'test', lambda: next(checksums),
+        ...                      run)
+        (0, False, 0, 1)
+        >>> run_unless_unchanged('bibtex', 'test', lambda: 'b1b', run)
+        ... # doctest:+ELLIPSIS
+        <p class="info">Skipped bibtex...
+        (0, False, 0, 1)
+        >>> remove('.test.lbm')
+
+    """
+    manifest = Manifest(join(dirname(name), '.{}.lbm'.format(basename(name))))
+    result = None if force else manifest.lookup(program, checksum())
+    if result is not None:
+        print('<p class="info">Skipped {}, since its input did not change '
+              'since its last successful run</p>'.format(program))
+        return result
+    result = run()
+    manifest.update(program, checksum(), result)
+    return result
+
+
+def find_bibtex_auxfiles(filename):
+    """Return the auxiliary files bibtex processes for ``filename``.
+
+    These are the auxiliary file of ``filename`` and the auxiliary files of
+    ``bibunits`` (``bu1.aux``, ``bu2.aux``, …).
+
+    Arguments:
+
+        filename
+
+            The name of the tex file without its extension.
+
+    Returns: ``[str]``
+
+    Examples:
+
+        >>> chdir('Tests/TeX')
+        >>> for auxfile in find_bibtex_auxfiles('external_bibliography'):
+        ...     print(auxfile)
+        ./external_bibliography.aux
+        >>> chdir('../..')
+
+    """
+    directory = dirname(filename) if dirname(filename) else '.'
+    regex_auxfiles = (r'.*/({}|bu\d+)\.aux$'.format(filename))
+    auxfiles = [
+        f for f in glob("{}/*.aux".format(directory))
+        if match(regex_auxfiles, f)
+    ]
+    return auxfiles
+
+
+def run_bibtex(filename, verbose=False, processes=None, force=False):
     """Run bibtex for a certain file.
 
-    Run bibtex for ``filename`` and return the following values:
+    Run bibtex for ``filename`` and the auxiliary files of ``bibunits``
+    (``bu1.aux``, ``bu2.aux``, …). The bibtex runs are independent of each
+    other, so we start them in parallel. We collect the output of each run
+    and print it in the order of the auxiliary files. The function returns
+    the following values:
 
     - The return value of the bibtex runs done by this function: This value
       will be ``0`` after a successful run. Any other value indicates that
@@ -115,46 +253,83 @@ def run_bibtex(filename, verbose=False):
 
             Specifies if the output by this function should be verbose.
 
+        processes
+
+            The maximum number of bibtex runs at the same time. If this
+            value is ``None``, then we use one run per CPU.
+
+        force
+
+            Specifies if we should run bibtex even if none of the citations
+            and bibliography files changed since the last successful run.
 
     Returns: ``(int, bool, int, int)``
 
     Examples:
 
         >>> chdir('Tests/TeX')
-        >>> run_bibtex('external_bibliography') # doctest:+ELLIPSIS
+        >>> run_bibtex('external_bibliography', force=True)
+        ... # doctest:+ELLIPSIS
+        <h4>Processing: ...
+        ...
+        (0, False, 0, 0)
+
+        Run bibtex for two units of ``bibunits`` in parallel
+
+        >>> from shutil import copy
+        >>> for unit in ['bu1', 'bu2']:
+        ...     _ = copy('external_bibliography.aux', unit + '.aux')
+        >>> run_bibtex('external_bibliography', processes=2, force=True)
+        ... # doctest:+ELLIPSIS
         <h4>Processing: ...
         ...
         (0, False, 0, 0)
+        >>> for unit in ['bu1', 'bu2']:
+        ...     for extension in ['aux', 'bbl', 'blg']:
+        ...         remove('{}.{}'.format(unit, extension))
         >>> chdir('../..')
 
     """
-    directory = dirname(filename) if dirname(filename) else '.'
-    regex_auxfiles = (r'.*/({}|bu\d+)\.aux$'.format(filename))
-    auxfiles = [
-        f for f in glob("{}/*.aux".format(directory))
-        if match(regex_auxfiles, f)
-    ]
-
-    stat, fatal, errors, warnings = 0, False, 0, 0
-    for bib in auxfiles:
-        print('<h4>Processing: {} </h4>'.format(bib))
-        run_object = Popen("bibtex {}".format(shellquote(bib)),
-                           shell=True,
-                           stdout=PIPE,
-                           stdin=PIPE,
-                           stderr=STDOUT,
-                           close_fds=True,
-                           universal_newlines=True)
-        bp = BibTexParser(run_object.stdout, verbose)
-        f, e, w = bp.parse_stream()
-        fatal |= f
-        errors += e
-        warnings += w
-        stat |= run_object.wait()
-    return stat, fatal, errors, warnings
-
-
-def run_biber(filename, verbose=False):
+    auxfiles = find_bibtex_auxfiles(filename)
+
+    def run_single(bib):
+        events = EventList()
+        status, bp, _ = run_command(
+            "bibtex {}".format(shellquote(bib)),
+            lambda stream: BibTexParser(stream, verbose, events))
+        return status, bp, events
+
+    def run():
+        if len(auxfiles) < 2:
+            results = [run_single(auxfile) for auxfile in auxfiles]
+        else:
+            pool = ThreadPool(
+                max(1, min(len(auxfiles),
+                           processes if processes else cpu_count())))
+            try:
+                results = pool.map(run_single, auxfiles)
+            finally:
+                pool.close()
+                pool.join()
+
+        stat, fatal, errors, warnings = 0, False, 0, 0
+        renderer = HTMLRenderer()
+        for bib, (status, bp, events) in zip(auxfiles, results):
+            print('<h4>Processing: {} </h4>'.format(bib))
+            for event in events:
+                renderer.emit(event)
+            renderer.flush()
+            fatal |= bp.fatal_error
+            errors += bp.number_errors
+            warnings += bp.number_warnings
+            stat |= status
+        return stat, fatal, errors, warnings
+
+    return run_unless_unchanged('bibtex', filename,
+                                lambda: bibtex_hash(auxfiles), run, force)
+
+
+def run_biber(filename, verbose=False, force=False):
     """Run biber for a certain file.
 
     The interface for this function is exactly the same as the one for
@@ -168,27 +343,85 @@ def run_biber(filename, verbose=False):
         >>> call('pdflatex external_bibliography_biber.tex > /dev/null',
         ... shell=True)
         0
-        >>> run_biber('external_bibliography_biber') # doctest:+ELLIPSIS
+        >>> run_biber('external_bibliography_biber', force=True)
+        ... # doctest:+ELLIPSIS
         <...
         ...
         (0, False, 0, 0)
         >>> chdir('../..')
 
     """
-    run_object = Popen("biber {}".format(shellquote(filename)),
-                       shell=True,
-                       stdout=PIPE,
-                       stdin=PIPE,
-                       stderr=STDOUT,
-                       close_fds=True,
-                       universal_newlines=True)
-    bp = BiberParser(run_object.stdout, verbose)
-    fatal, errors, warnings = bp.parse_stream()
-    stat = run_object.wait()
-    return stat, fatal, errors, warnings
-
-
-def run_latex(ltxcmd, texfile, cache_filename, verbose=False):
+    def run():
+        stat, bp, _ = run_command("biber {}".format(shellquote(filename)),
+                                  lambda stream: BiberParser(stream, verbose))
+        return stat, bp.fatal_error, bp.number_errors, bp.number_warnings
+
+    return run_unless_unchanged('biber', filename,
+                                lambda: biber_hash(filename), run, force)
+
+
+def get_run_time(cache_filename, command):
+    """Return the duration of the last complete run of ``command``.
+
+    Arguments:
+
+        cache_filename
+
+            The path to the cache file for the current tex project.
+
+        command
+
+            The name of the command, e.g. ``latexmk``.
+
+    Returns: ``float``
+
+        The duration in seconds or ``None``, if we do not know it.
+
+    Examples:
+
+        >>> store_run_time('.test.lb', 'latex', 2.5)
+        >>> get_run_time('.test.lb', 'latex')
+        2.5
+        >>> get_run_time('.test.lb', 'latexmk') # Returns ``None``
+        >>> remove('.test.lb')
+
+    """
+    try:
+        with open(cache_filename, 'rb') as storage:
+            return load(storage).get('run_times', {}).get(command)
+    except (IOError, ValueError, EOFError):
+        return None
+
+
+def store_run_time(cache_filename, command, seconds):
+    """Store the duration of a complete run of ``command``.
+
+    The interface for this function is the same as the one for
+    ``get_run_time``. The argument ``seconds`` specifies the duration.
+
+    """
+    try:
+        with open(cache_filename, 'rb') as storage:
+            typesetting_data = load(storage)
+    except (IOError, ValueError, EOFError):
+        typesetting_data = {}
+    typesetting_data.setdefault('run_times', {})[command] = seconds
+    try:
+        with open(cache_filename, 'wb') as storage:
+            dump(typesetting_data, storage)
+    except IOError:
+        print('<p class="warning"> Could not write cache file!</p>')
+
+
+def run_latex(ltxcmd,
+              texfile,
+              cache_filename,
+              verbose=False,
+              tasks=(),
+              fail_fast=False,
+              preamble_format=False,
+              include_only=None,
+              build_directory=None):
     """Run the flavor of latex specified by ltxcmd on texfile.
 
     This function returns:
@@ -218,6 +451,38 @@ def run_latex(ltxcmd, texfile, cache_filename, verbose=False):
 
             The path of the tex file which should be translated by ``ltxcmd``.
 
+        tasks
+
+            Functions without arguments we call while ``ltxcmd`` runs (see
+            ``pipeline.run_command``).
+
+        fail_fast
+
+            Specifies if we stop ``ltxcmd`` as soon as it reports a fatal
+            error.
+
+        preamble_format
+
+            Specifies if ``ltxcmd`` should start from a precompiled format of
+            the preamble of ``texfile`` (see ``preamble.PreambleFormat``). If
+            the format is missing or out of date, then we rebuild it in the
+            background and use the full preamble for this run. If the run
+            could not load the format (see ``PreambleFormat.failed``), then
+            we stop using the format and typeset the document again without
+            it, unless we stopped the run ourselves.
+
+        include_only
+
+            The names of the files included via ``\\include`` that LaTeX
+            should typeset (see ``get_focus_chapters``). If this value is
+            ``None``, then we typeset the whole document.
+
+        build_directory
+
+            The directory ``ltxcmd`` writes its output to. We also store the
+            format of the preamble there. If this value is ``None``, then we
+            use the directory of ``texfile``.
+
     Returns: ``(int, bool, int, int)``
 
     Examples:
@@ -232,21 +497,325 @@ def run_latex(ltxcmd, texfile, cache_filename, verbose=False):
         >>> chdir('../..')
 
     """
-    run_object = Popen("{} {}".format(ltxcmd, shellquote(texfile)),
-                       shell=True,
-                       stdout=PIPE,
-                       stdin=PIPE,
-                       stderr=STDOUT,
-                       close_fds=True,
-                       universal_newlines=True)
-    lp = LaTexParser(run_object.stdout, verbose, texfile)
-    fatal, errors, warnings = lp.parse_stream()
-    stat = run_object.wait()
+    engine, _, options = ltxcmd.partition(' ')
+    preamble = (PreambleFormat(texfile, engine, options, build_directory)
+                if preamble_format else None)
+    state = preamble.state() if preamble else None
+    if state == 'stale':
+        print('<p class="info">Building a format of the preamble in the '
+              'background</p>')
+        preamble.build()
+    sink = (FailFast(HTMLRenderer(), get_run_time(cache_filename, 'latex'))
+            if fail_fast else None)
+    start = default_timer()
+    source = (shellquote(texfile) if include_only is None else
+              '-jobname={} {}'.format(
+                  shellquote(splitext(texfile)[0]),
+                  shellquote('\\includeonly{{{}}}\\input{{{}}}'.format(
+                      ','.join(include_only), texfile))))
+    watchdog = Watchdog()
+    stat, lp, _ = run_command(
+        "{}{} {}".format(ltxcmd, ' {}'.format(preamble.option())
+                         if state == 'ready' else '', source),
+        lambda stream: LaTexParser(stream, verbose, texfile, sink), tasks,
+        sink, watchdog)
+    stopped = (bool(sink and sink.stopped is not None) or
+               watchdog.reason is not None)
+    if state == 'ready' and preamble.failed(lp, stopped):
+        preamble.invalidate()
+        if not stopped:
+            print('<p class="warning">Typesetting again without the format '
+                  'of the preamble</p>')
+            return run_latex(ltxcmd, texfile, cache_filename, verbose, (),
+                             fail_fast, include_only=include_only,
+                             build_directory=build_directory)
+    if not sink or sink.stopped is None:
+        store_run_time(cache_filename, 'latex', default_timer() - start)
     update_marks(cache_filename, lp.marks)
-    return stat, fatal, errors, warnings
+    return stat, lp.fatal_error, lp.number_errors, lp.number_warnings
+
+
+def helper_tools(name, texfile, verbose=False):
+    """Return the programs that process the output of a pass of LaTeX.
+
+    Arguments:
+
+        name
+
+            The name of the tex file without its extension.
+
+        texfile
+
+            The name of the tex file.
+
+        verbose
+
+            Specifies if the programs should print all of their output.
+
+    Returns: ``[(str, function, function)]``
+
+        The name of each program the document uses, a function that returns
+        a hash of its input and a function that runs it.
+
+    Examples:
+
+        >>> chdir('Tests/TeX')
+        >>> for program, _, _ in helper_tools('makeindex', 'makeindex.tex'):
+        ...     print(program)
+        makeindex
+        >>> chdir('../..')
+
+    """
+    tools = []
+    if exists('{}.bcf'.format(name)):
+        tools.append(('biber', lambda: biber_hash(name),
+                      lambda: run_biber(name, verbose)))
+    elif uses_bibtex(name):
+        tools.append(
+            ('bibtex', lambda: bibtex_hash(find_bibtex_auxfiles(name)),
+             lambda: run_bibtex(name, verbose)))
+    if exists('{}.glo'.format(name)):
+        tools.append(('makeglossaries', lambda: makeglossaries_hash(texfile),
+                      lambda: run_makeglossaries(texfile, verbose)))
+    elif exists('{}.idx'.format(name)):
+        tools.append(('makeindex', lambda: makeindex_hash(texfile),
+                      lambda: run_makeindex(texfile, verbose)))
+    return tools
+
+
+def run_latex_passes(ltxcmd,
+                     texfile,
+                     cache_filename,
+                     verbose=False,
+                     tasks=(),
+                     fail_fast=False,
+                     max_passes=5,
+                     draft_ltxcmd=None,
+                     preamble_format=False,
+                     include_only=None,
+                     build_directory=None):
+    """Run latex and the programs it depends on until the document is stable.
+
+    After each pass of ``ltxcmd`` we run bibtex or biber, and makeindex or
+    makeglossaries, if the document uses them. These programs only run if
+    their input changed (see ``run_unless_unchanged``), and at most once per
+    change of their input. We then fingerprint the files LaTeX reads in the
+    next pass, like the auxiliary file and the table of contents. If the
+    fingerprint did not change since the start of the pass, then the
+    document is finished.
+
+    If we know that a pass will not be the last one, then we use
+    ``draft_ltxcmd`` instead of ``ltxcmd``. This is the case for the first
+    pass of a document without auxiliary file, and for the pass after a new
+    bibliography or index, since LaTeX only writes the labels of the new
+    entries into the auxiliary file in this pass. If a draft pass turns out
+    to be the last one after all, then we repeat it with ``ltxcmd``.
+
+    Arguments:
+
+        max_passes
+
+            The maximum number of passes of ``ltxcmd``. We stop after this
+            number of passes, even if the document did not reach a fixed
+            point, e.g. since a label changes the page it refers to.
+
+        draft_ltxcmd
+
+            The latex command for passes that do not need to produce a PDF
+            or synctex data. If this value is ``None``, then we use
+            ``ltxcmd`` for every pass.
+
+        build_directory
+
+            The directory ``ltxcmd`` writes its output to. We run bibtex and
+            the other programs in this directory and store the format of the
+            preamble there. If this value is ``None``, then we use the
+            current directory.
+
+        For all other arguments, please take a look at ``run_latex``.
+
+    Returns: ``(int, bool, int, int, int)``
+
+        The return values of ``run_latex`` followed by the number of passes.
+        The number of errors and warnings of LaTeX and of each of the other
+        programs are the ones of their last run, since most messages repeat
+        in every run.
+
+    Examples:
+
+        >>> chdir('Tests/TeX')
+        >>> run_latex_passes(ltxcmd='pdflatex',
+        ...                  cache_filename='.external_bibliography.lb',
+        ...                  texfile='external_bibliography.tex',
+        ...                  draft_ltxcmd='pdflatex -draftmode')
+        ... # doctest:+ELLIPSIS
+        <h4>...
+        ...
+        (0, False, 0, 0, ...)
+        >>> chdir('../..')
+
+    """
+    name = splitext(texfile)[0]
+    output = join(build_directory, name) if build_directory else name
+    before = fingerprint(output)
+    draft = draft_ltxcmd is not None and before['aux'] is None
+    total = default_timer()
+    stat, fatal = 0, False
+    # The hash of the input and the latest result of each program we ran
+    # after a pass
+    inputs, results = {}, {}
+    for number in range(1, max_passes + 1):
+        start = default_timer()
+        status, fatal, latex_errors, latex_warnings = run_latex(
+            draft_ltxcmd if draft else ltxcmd, texfile, cache_filename,
+            verbose, tasks if number == 1 else (), fail_fast,
+            preamble_format, include_only, build_directory)
+        print('<p class="info">Pass {} of {}{} took {:.2f} seconds</p>'.
+              format(number, ltxcmd.split()[0], ' (draft)' if draft else '',
+                     default_timer() - start))
+        stat |= status
+        if fatal:
+            break
+
+        with working_directory(build_directory):
+            for program, checksum, run in helper_tools(name, texfile,
+                                                       verbose):
+                # Only run a program again if its input changed in this pass
+                current = checksum()
+                if current is not None and inputs.get(program) == current:
+                    continue
+                results[program] = run()
+                inputs[program] = checksum()
+                fatal |= results[program][1]
+        if fatal:
+            break
+
+        after = fingerprint(output)
+        changed = sorted(suffix for suffix in after
+                         if after[suffix] != before[suffix])
+        if not changed and not draft:
+            break
+        if number < max_passes:
+            print('<p class="info">Rerun {}, since {}</p>'.format(
+                ltxcmd.split()[0], ', '.join(
+                    '{}.{} changed'.format(name, suffix)
+                    for suffix in changed) if changed else
+                'the last pass did not create a PDF'))
+        # Never use draft mode for the last possible pass
+        draft = (draft_ltxcmd is not None and number + 1 < max_passes
+                 and bool({'bbl', 'ind'} & set(changed)))
+        before = after
+    else:
+        print('<p class="warning">Stopped after {} passes, although {} '
+              'still changed</p>'.format(max_passes, ', '.join(
+                  '{}.{}'.format(name, suffix) for suffix in changed)))
+    print('<p class="info">Finished {} pass{} in {:.2f} seconds</p>'.format(
+        number, '' if number == 1 else 'es', default_timer() - total))
+    errors, warnings = latex_errors, latex_warnings
+    for status, _, number_errors, number_warnings in results.values():
+        stat |= status
+        errors += number_errors
+        warnings += number_warnings
+    return stat, fatal, errors, warnings, number
+
+
+def get_focus_chapters(filepath, filename, chapters=None,
+                       build_directory=None):
+    """Return the chapters a focus build of ``filename`` should typeset.
+
+    A focus build only typesets the files included via ``\\include`` that
+    changed since LaTeX last typeset them, together with the file we edit.
+    For all other files LaTeX reads the labels and page numbers from their
+    auxiliary files, so references to them stay valid.
+
+    Arguments:
+
+        filepath
+
+            The path of the file we edit.
+
+        filename
+
+            The name of the master file. This function expects that the
+            current directory is the directory of the master file.
+
+        chapters
+
+            The names of the files the master file includes via
+            ``\\include``. If this value is ``None``, then we search the
+            master file for these names.
+
+        build_directory
+
+            The directory LaTeX writes the auxiliary files to. If this value
+            is ``None``, then we use the current directory.
+
+    Returns: ``[str]``
+
+        The names of the chapters as used in the ``\\include`` commands or
+        ``None``, if we should typeset the whole document. This is the case
+        if we edit the master file or a file it does not include directly,
+        if an auxiliary file is missing, or if all chapters changed.
+
+    Examples:
+
+        >>> chdir('Tests/TeX')
+        >>> names = ['include', 'input/chapter1', 'input/chapter2',
+        ...          'input/chapter3']
+        >>> get_focus_chapters('input/chapter2.tex', 'include.tex')
+        ... # Returns ``None``, since there are no auxiliary files yet
+        >>> for name in names:
+        ...     open('{}.aux'.format(name), 'w').close()
+        >>> for name in get_focus_chapters('input/chapter2.tex',
+        ...                                'include.tex'):
+        ...     print(name)
+        input/chapter2
+        >>> get_focus_chapters('include.tex', 'include.tex')
+        ... # Returns ``None``, since we edit the master file
+        >>> for name in names:
+        ...     remove('{}.aux'.format(name))
+
+        Use the auxiliary files of a build directory
+
+        >>> from shutil import rmtree
+        >>> from tempfile import mkdtemp
+        >>> build_directory = mkdtemp()
+        >>> get_focus_chapters('input/chapter2.tex', 'include.tex',
+        ...                    build_directory=build_directory)
+        ... # Returns ``None``, since there are no auxiliary files yet
+        >>> prepare_build_directory(build_directory, {'input'})
+        >>> for name in names:
+        ...     open(join(build_directory, '{}.aux'.format(name)),
+        ...          'w').close()
+        >>> for name in get_focus_chapters('input/chapter2.tex',
+        ...                                'include.tex',
+        ...                                build_directory=build_directory):
+        ...     print(name)
+        input/chapter2
+        >>> rmtree(build_directory)
+        >>> chdir('../..')
+
+    """
+    if chapters is None:
+        chapters = find_tex_includes(filename)
+    edited = splitext(normpath(relpath(filepath)))[0]
+    if edited not in (normpath(chapter) for chapter in chapters):
+        return None
+    auxfiles = {
+        name: join(build_directory or '', '{}.aux'.format(name))
+        for name in [splitext(filename)[0]] + chapters
+    }
+    if not all(exists(auxfile) for auxfile in auxfiles.values()):
+        return None
+    focus = [
+        chapter for chapter in chapters
+        if normpath(chapter) == edited or not exists('{}.tex'.format(chapter))
+        or getmtime('{}.tex'.format(chapter)) > getmtime(auxfiles[chapter])
+    ]
+    return focus if len(focus) < len(chapters) else None
 
 
-def run_makeindex(filename, verbose=False):
+def run_makeindex(filename, verbose=False, force=False):
     """Run the makeindex command.
 
     Generate the index for the given file returning
@@ -260,38 +829,47 @@ def run_makeindex(filename, verbose=False):
 
         - the number of warnings encountered while processing ``filename``.
 
+    If the directory of ``filename`` contains a style file with the same
+    name, e.g. ``thesis.ist`` for ``thesis.tex``, then makeindex uses it.
+
     Arguments:
 
         filename
 
             The name of the tex file for which we want to generate an index.
 
+        force
+
+            Specifies if we should run ``makeindex`` even if the index
+            entries did not change since its last successful run.
+
     Returns: ``(int, bool, int, int)``
 
     Examples:
 
         >>> chdir('Tests/TeX')
-        >>> run_makeindex('makeindex.tex') # doctest:+ELLIPSIS
+        >>> run_makeindex('makeindex.tex', force=True) # doctest:+ELLIPSIS
         <p class="info">Run...Makeindex...
         (0, False, 0, 0)
         >>> chdir('../..')
 
     """
-    run_object = Popen("makeindex {}".format(
-        shellquote("{}.idx".format(splitext(filename)[0]))),
-                       shell=True,
-                       stdout=PIPE,
-                       stdin=PIPE,
-                       stderr=STDOUT,
-                       close_fds=True,
-                       universal_newlines=True)
-    ip = MakeIndexParser(run_object.stdout, verbose)
-    fatal, errors, warnings = ip.parse_stream()
-    stat = run_object.wait()
-    return stat, fatal, errors, warnings
-
-
-def run_makeglossaries(filename, verbose=False):
+    style = makeindex_style(filename)
+
+    def run():
+        stat, ip, _ = run_command(
+            "makeindex {}{}".format(
+                "-s {} ".format(shellquote(style)) if style else "",
+                shellquote("{}.idx".format(splitext(filename)[0]))),
+            lambda stream: MakeIndexParser(stream, verbose))
+        return stat, ip.fatal_error, ip.number_errors, ip.number_warnings
+
+    return run_unless_unchanged('makeindex', splitext(filename)[0],
+                                lambda: makeindex_hash(filename), run,
+                                force)
+
+
+def run_makeglossaries(filename, verbose=False, force=False):
     """Run makeglossaries for the given file.
 
     The interface of this function is exactly the same as the one for
@@ -310,30 +888,33 @@ def run_makeglossaries(filename, verbose=False):
             (``verbose=True``) or if only significant messages should be
             printed.
 
+        force
+
+            Specifies if we should run ``makeglossaries`` even if the
+            glossary entries did not change since its last successful run.
+
     Examples:
 
         >>> chdir('Tests/TeX')
         >>> call('pdflatex makeglossaries.tex > /dev/null', shell=True)
         0
-        >>> run_makeglossaries('makeglossaries.tex') # doctest:+ELLIPSIS
+        >>> run_makeglossaries('makeglossaries.tex', force=True)
+        ... # doctest:+ELLIPSIS
         <h2>Make Glossaries...
         ...
         (0, False, 0, 0)
         >>> chdir('../..')
 
     """
-    run_object = Popen("makeglossaries {}".format(
-        shellquote(splitext(filename)[0])),
-                       shell=True,
-                       stdout=PIPE,
-                       stdin=PIPE,
-                       stderr=STDOUT,
-                       close_fds=True,
-                       universal_newlines=True)
-    bp = MakeGlossariesParser(run_object.stdout, verbose)
-    fatal, errors, warnings = bp.parse_stream()
-    stat = run_object.wait()
-    return stat, fatal, errors, warnings
+    def run():
+        stat, bp, _ = run_command(
+            "makeglossaries {}".format(shellquote(splitext(filename)[0])),
+            lambda stream: MakeGlossariesParser(stream, verbose))
+        return stat, bp.fatal_error, bp.number_errors, bp.number_warnings
+
+    return run_unless_unchanged('makeglossaries', splitext(filename)[0],
+                                lambda: makeglossaries_hash(filename), run,
+                                force)
 
 
 def get_app_path(application, tm_support_path=getenv("TM_SUPPORT_PATH")):
@@ -360,13 +941,16 @@ def get_app_path(application, tm_support_path=getenv("TM_SUPPORT_PATH")):
         >>> get_app_path('NonExistentApp') # Returns ``None``
 
     """
-    try:
-        return check_output("'{}/bin/find_app' '{}.app'".format(
-            tm_support_path, application),
-                            shell=True,
-                            universal_newlines=True).strip()
-    except CalledProcessError:
-        return None
+    if application not in APP_PATHS:
+        try:
+            APP_PATHS[application] = check_output(
+                "'{}/bin/find_app' '{}.app'".format(tm_support_path,
+                                                    application),
+                shell=True,
+                universal_newlines=True).strip()
+        except CalledProcessError:
+            APP_PATHS[application] = None
+    return APP_PATHS[application]
 
 
 def get_app_path_and_sync_command(viewer, path_pdf, path_tex_file,
@@ -430,6 +1014,45 @@ def get_app_path_and_sync_command(viewer, path_pdf, path_tex_file,
     return path_to_viewer, sync_command
 
 
+def viewer_has_document(viewer,
+                        pdf_path,
+                        tm_bundle_support=getenv('TM_BUNDLE_SUPPORT')):
+    """Check if ``viewer`` shows the PDF file at ``pdf_path``.
+
+    We remember the answer, so we can ask the viewer while the typesetting
+    engine still runs.
+
+    Arguments:
+
+        viewer
+
+            The name of the PDF viewer application.
+
+        pdf_path
+
+            The path to the PDF file.
+
+        tm_bundle_support
+
+            The location of the “LaTeX Bundle” support folder
+
+    Returns: ``bool``
+
+    Examples:
+
+        >>> viewer_has_document('NonExistentApp', 'test.pdf',
+        ...                     tm_bundle_support=realpath('Support'))
+        False
+
+    """
+    if (viewer, pdf_path) not in OPEN_DOCUMENTS:
+        OPEN_DOCUMENTS[viewer, pdf_path] = not bool(
+            call("'{}/bin/check_open' '{}' {} > /dev/null 2>&1".format(
+                tm_bundle_support, viewer, shellquote(pdf_path)),
+                 shell=True))
+    return OPEN_DOCUMENTS[viewer, pdf_path]
+
+
 def refresh_viewer(viewer,
                    pdf_path,
                    tm_bundle_support=getenv('TM_BUNDLE_SUPPORT')):
@@ -550,14 +1173,12 @@ def run_viewer(viewer,
             viewer, pdffile_path, texfile_path, line_number)
         # PDF viewer is installed
         if path_to_viewer:
+            pdf_already_open = viewer_has_document(viewer, pdffile_path,
+                                                   tm_bundle_support)
             if version_info <= (3, 0):
                 # If this is not done, the next line will thrown an encoding
                 # exception when the PDF file contains non-ASCII characters.
                 viewer = viewer.encode('utf-8')
-            pdf_already_open = not (bool(
-                call("'{}/bin/check_open' '{}' {} > /dev/null".format(
-                    tm_bundle_support, viewer, shellquote(pdffile_path)),
-                     shell=True)))
             if pdf_already_open:
                 refresh_viewer(viewer, pdffile_path)
             else:
@@ -795,9 +1416,12 @@ def get_typesetting_data(filepath,
                 typesetting_data = load(storage)
                 cache_read = True
 
-            cache_data_outdated = (getmtime(file_path) <
-                                   getmtime(cache_filename) >
-                                   getmtime(filepath))
+            # The engine only changes if the packages of the project or the
+            # typesetting directives change
+            cache_data_outdated = (typesetting_data.get('packages') !=
+                                   packages or
+                                   typesetting_data.get('directives') !=
+                                   typesetting_directives)
 
             # Write new cache data if the current data does not contain
             # the necessary up to date information - This might be the case if
@@ -807,13 +1431,13 @@ def get_typesetting_data(filepath,
 
         except Exception:
             # Get data and save it in the cache
-            packages = find_tex_packages(filename, ignore_warnings)
             engine = construct_engine_command(typesetting_directives,
                                               tm_engine, packages)
             synctex = not (bool(
                 call("{} --help | grep -q synctex".format(engine),
                      shell=True)))
             typesetting_data.update({
+                'directives': typesetting_directives,
                 'engine': engine,
                 'packages': packages,
                 'synctex': synctex
@@ -836,6 +1460,16 @@ def get_typesetting_data(filepath,
     file_without_suffix = splitext(filename)[0]
     chdir(file_path)
     cache_filename = '.{}.lb'.format(file_without_suffix)
+    if not isfile(filename) and not ignore_warnings:
+        print("""<p class="error">Cannot open {} to check for packages.</p>
+                 <p class="error">This is most likely a problem with
+                                  TM_LATEX_MASTER</p>
+              """.format(filename))
+        exit(EXIT_FILE_ERROR)
+    # Only read the files of the project that changed since the last run
+    project = ProjectGraph(filename)
+    project.update()
+    packages = project.packages()
     typesetting_data = get_cached_data()
 
     # We add the tex files in the bundle directory to the possible input
@@ -852,6 +1486,7 @@ def get_typesetting_data(filepath,
         'filename': filename,
         'file_path': file_path,
         'file_without_suffix': file_without_suffix,
+        'project': project,
         'typesetting_directives': typesetting_directives
     })
 
@@ -917,6 +1552,14 @@ def get_command_line_arguments():
                 not set this option explicitly, then the engine options set
                 inside the TextMate preferences will be used.''')
 
+    parser_force = ArgumentParser(add_help=False)
+    parser_force.add_argument(
+        '-force',
+        action='store_true',
+        default=False,
+        help='''Run the command even if its input did not change since its
+                last successful run.''')
+
     parser = ArgumentParser(description='Execute common TeX commands.')
     parser.add_argument(
         '-addoutput',
@@ -932,7 +1575,7 @@ def get_command_line_arguments():
 
     subparsers = parser.add_subparsers(title="Commands", dest='command')
     subparsers.add_parser('bibtex',
-                          parents=[parser_file],
+                          parents=[parser_file, parser_force],
                           help='Run bibtex/biber for the specified file.')
     subparsers.add_parser('clean',
                           parents=[parser_file],
@@ -942,12 +1585,19 @@ def get_command_line_arguments():
                           help='Check the specified file with chktex.')
     subparsers.add_parser(
         'index',
-        parents=[parser_file],
+        parents=[parser_file, parser_force],
         help='''Create a index for the specified file using either
                 makeglossaries or makeindex.''')
-    subparsers.add_parser('latex',
-                          parents=[parser_file, parser_latex],
-                          help='Typeset the specified file using latex.')
+    parser_typeset = subparsers.add_parser(
+        'latex',
+        parents=[parser_file, parser_latex],
+        help='Typeset the specified file using latex.')
+    parser_typeset.add_argument(
+        '-full',
+        action='store_true',
+        default=False,
+        help='''Typeset the whole document, even if focus builds are
+                enabled.''')
     subparsers.add_parser(
         'sync',
         parents=[parser_file],
@@ -975,6 +1625,15 @@ def get_command_line_arguments():
 if __name__ == '__main__':
     # Get preferences from TextMate
     tm_preferences = Preferences()
+    # Write output for the HTML window in batches instead of line by line
+    output = BufferedOutput(
+        sys.stdout,
+        interval=float(tm_preferences['latexFlushInterval']) / 1000)
+    register(output.close)
+    sys.stdout = output
+    # Stop commands that hang, e.g. because they wait for input
+    Watchdog.idle_limit = float(tm_preferences['latexIdleTimeout'])
+    Watchdog.total_limit = float(tm_preferences['latexTimeout'])
     # Parse command line parameters...
     arguments = get_command_line_arguments()
 
@@ -982,6 +1641,7 @@ if __name__ == '__main__':
     viewer_status = 0
     filepath = arguments.filepath
     first_run = not arguments.addoutput
+    include_only = None
     line_number = match(r'^\d+', getenv('TM_SELECTION')).group(0)
     number_errors = 0
     number_runs = 0
@@ -997,6 +1657,9 @@ if __name__ == '__main__':
     verbose = True if tm_preferences['latexVerbose'] == 1 else False
     viewer = tm_preferences['latexViewer']
 
+    # Remember the edited file, since we change the directory below
+    edited_filepath = realpath(filepath) if filepath else None
+
     if command == 'latex' or command == 'version':
         if (arguments.latexmk == 'yes' or not arguments.latexmk
                 and tm_preferences['latexUselatexmk']):
@@ -1017,21 +1680,34 @@ if __name__ == '__main__':
     filename = typesetting_data['filename']
     file_path = typesetting_data['file_path']
     file_without_suffix = typesetting_data['file_without_suffix']
-    packages = typesetting_data['packages']
+    project = typesetting_data['project']
+    # The view, sync and latex commands read the packages from the project
+    # graph, not from the cache file
+    packages = project.packages()
     engine = typesetting_data['engine']
     synctex = typesetting_data['synctex']
 
     pdffile_path = "{}/{}.pdf".format(file_path, file_without_suffix)
 
+    # Write intermediate files into a build directory outside of the project
+    build_directory = (get_build_directory(
+        tm_preferences['latexBuildDirectory'], file_without_suffix,
+        file_path) if tm_preferences['latexBuildDirectory'] else None)
+    if build_directory:
+        # Programs running in the build directory still find the files of
+        # the project
+        for variable in ['BIBINPUTS', 'BSTINPUTS', 'INDEXSTYLE']:
+            putenv(variable, '{}:{}'.format(file_path, getenv(variable, '')))
+
     # Add default location of `ps2pdf` to `PATH`
     putenv('PATH', getenv('PATH') + ':/usr/local/bin')
 
     if command == "version":
-        process = Popen("{} --version".format(engine),
-                        stdout=PIPE,
-                        shell=True,
-                        universal_newlines=True)
-        print(process.stdout.readline().rstrip('\n'))
+        try:
+            version = read_command("{} --version".format(engine))
+        except CalledProcessError as error:
+            version = error.output
+        print(version.split('\n')[0])
         exit()
 
     if command != 'sync':
@@ -1050,6 +1726,17 @@ if __name__ == '__main__':
               "synctex but you have included pdfsync. You can safely remove " +
               "\\usepackage{pdfsync}</p>")
 
+    # Look up the location of the viewer and if it already shows the PDF
+    # while the TeX engine runs. Everything else we do after a run depends
+    # on its output: the gutter marks show its messages, and bibtex,
+    # makeindex and friends read the auxiliary files it writes. We parse the
+    # output of these programs while they run, so there are no transcripts
+    # of an earlier stage left to read in the meantime.
+    viewer_tasks = ([
+        lambda: get_app_path(viewer),
+        lambda: viewer_has_document(viewer, pdffile_path)
+    ] if tm_autoview and not suppress_viewer and viewer != 'TextMate' else [])
+
     problematic_characters = search('[$"]', filename)
     if problematic_characters:
         print('''<p class="error"><strong>
@@ -1063,22 +1750,39 @@ if __name__ == '__main__':
                                                   tm_engine_options, synctex)
         write_latexmkrc(engine, engine_options, '/tmp/latexmkrc')
         latexmkrc_path = "{}/config/latexmkrc".format(tm_bundle_support)
-        command = "latexmk -pdf{} -f -r /tmp/latexmkrc -r {} {}".format(
+        command = "latexmk -pdf{} -f -r /tmp/latexmkrc -r {}{} {}".format(
             'ps' if engine == 'latex' else '', shellquote(latexmkrc_path),
-            shellquote(filename))
-        process = Popen(command,
-                        shell=True,
-                        stdout=PIPE,
-                        stdin=PIPE,
-                        stderr=STDOUT,
-                        close_fds=True,
-                        universal_newlines=True)
-        command_parser = LaTexMkParser(process.stdout, verbose, filename)
-        status = command_parser.parse_stream()
+            ' -outdir={}'.format(shellquote(build_directory))
+            if build_directory else '', shellquote(filename))
+        if build_directory:
+            prepare_build_directory(build_directory, {
+                dirname(chapter) for chapter in project.includes()
+            })
+        # Only show the last pass of LaTeX in full
+        aggregator = (PassAggregator(HTMLRenderer())
+                      if tm_preferences['latexCollapsePasses'] and not verbose
+                      else None)
+        sink = aggregator if aggregator else HTMLRenderer()
+        # Stop latexmk and skip the remaining passes after a fatal error
+        fail_fast = (FailFast(sink, get_run_time(cache_filename, 'latexmk'))
+                     if tm_preferences['latexFailFast'] else None)
+        start = default_timer()
+        tex_status, command_parser, _ = run_command(
+            command,
+            lambda stream: LaTexMkParser(stream, verbose, filename,
+                                         fail_fast if fail_fast else sink),
+            viewer_tasks, fail_fast)
+        if aggregator:
+            aggregator.close()
+        if not fail_fast or fail_fast.stopped is None:
+            store_run_time(cache_filename, 'latexmk', default_timer() - start)
         update_marks(cache_filename, command_parser.marks)
-        fatal_error, number_errors, number_warnings = status
-        tex_status = process.wait()
+        fatal_error = command_parser.fatal_error
+        number_errors = command_parser.number_errors
+        number_warnings = command_parser.number_warnings
         remove("/tmp/latexmkrc")
+        if build_directory:
+            sync_back(build_directory, file_without_suffix)
         if tm_autoview and number_errors < 1 and not suppress_viewer:
             viewer_status = run_viewer(
                 viewer, filepath, pdffile_path, number_errors > 1
@@ -1087,15 +1791,19 @@ if __name__ == '__main__':
         number_runs = command_parser.number_runs
 
     elif command == 'bibtex':
-        use_biber = exists('{}.bcf'.format(file_without_suffix))
-        status = (run_biber(file_without_suffix)
-                  if use_biber else run_bibtex(file_without_suffix))
+        with working_directory(build_directory):
+            use_biber = exists('{}.bcf'.format(file_without_suffix))
+            status = (run_biber(file_without_suffix, force=arguments.force)
+                      if use_biber else
+                      run_bibtex(file_without_suffix, force=arguments.force))
         tex_status, fatal_error, number_errors, number_warnings = status
 
     elif command == 'index':
-        use_makeglossaries = exists('{}.glo'.format(file_without_suffix))
-        status = (run_makeglossaries(filename, verbose)
-                  if use_makeglossaries else run_makeindex(filename, verbose))
+        with working_directory(build_directory):
+            use_makeglossaries = exists('{}.glo'.format(file_without_suffix))
+            status = (run_makeglossaries(filename, verbose, arguments.force)
+                      if use_makeglossaries else
+                      run_makeindex(filename, verbose, arguments.force))
         tex_status, fatal_error, number_errors, number_warnings = status
 
     elif command == 'clean':
@@ -1105,6 +1813,16 @@ if __name__ == '__main__':
             filepath for filepath in removed_files
             if not basename(filepath).startswith('.')
         ]
+        # The auxiliary files of included chapters might not match any of
+        # the patterns in `auxiliary.yaml`
+        for chapter in project.includes():
+            auxfile = '{}.aux'.format(chapter)
+            if exists(auxfile):
+                remove(auxfile)
+                removed_files.append(auxfile)
+        if build_directory and exists(build_directory):
+            removed_files.append(build_directory)
+            rmtree(build_directory, ignore_errors=True)
         if removed_files:
             for removed_file in removed_files:
                 print('<p class"info">Removed {}</p>'.format(removed_file))
@@ -1114,15 +1832,55 @@ if __name__ == '__main__':
     elif command == 'latex':
         engine_options = construct_engine_options(typesetting_directives,
                                                   tm_engine_options, synctex)
+        output_option = (' -output-directory={}'.format(
+            shellquote(build_directory)) if build_directory else '')
+        engine_options += output_option
+        if build_directory:
+            prepare_build_directory(build_directory, {
+                dirname(chapter) for chapter in project.includes()
+            })
         command = "{} {}".format(engine, engine_options)
-        status = run_latex(command, filename, cache_filename, verbose)
-        tex_status, fatal_error, number_errors, number_warnings = status
-        number_runs = 1
+        # Only typeset the chapters we currently edit
+        if tm_preferences['latexFocusBuild'] and not arguments.full:
+            include_only = get_focus_chapters(edited_filepath, filename,
+                                              project.includes(),
+                                              build_directory)
+        if include_only:
+            print('<p class="info">Focus build: Typesetting only {}</p>'.
+                  format(', '.join(include_only)))
+        if tm_preferences['latexRerun']:
+            # Passes that are not the last one skip the PDF and synctex data
+            draft_command = ("{} {}{} {}".format(
+                engine, construct_engine_options(
+                    typesetting_directives, tm_engine_options, False),
+                output_option, DRAFT_OPTIONS[engine])
+                             if engine in DRAFT_OPTIONS else None)
+            # Rerun LaTeX, bibtex and friends until the document is stable
+            status = run_latex_passes(
+                command, filename, cache_filename, verbose, viewer_tasks,
+                tm_preferences['latexFailFast'], draft_ltxcmd=draft_command,
+                preamble_format=tm_preferences['latexPreambleFormat'],
+                include_only=include_only, build_directory=build_directory)
+            (tex_status, fatal_error, number_errors, number_warnings,
+             number_runs) = status
+        else:
+            status = run_latex(command, filename, cache_filename, verbose,
+                               viewer_tasks, tm_preferences['latexFailFast'],
+                               tm_preferences['latexPreambleFormat'],
+                               include_only, build_directory)
+            tex_status, fatal_error, number_errors, number_warnings = status
+            number_runs = 1
 
         if engine == 'latex':
-            call("dvips {0}.dvi -o '{0}.ps'".format(file_without_suffix),
-                 shell=True)
-            call("ps2pdf '{}.ps'".format(file_without_suffix), shell=True)
+            # The programs write to the standard output directly
+            output.flush(force=True)
+            with working_directory(build_directory):
+                call("dvips {0}.dvi -o '{0}.ps'".format(file_without_suffix),
+                     shell=True)
+                call("ps2pdf '{}.ps'".format(file_without_suffix),
+                     shell=True)
+        if build_directory:
+            sync_back(build_directory, file_without_suffix)
         if tm_autoview and number_errors < 1 and not suppress_viewer:
             viewer_status = run_viewer(
                 viewer, filepath, pdffile_path, number_errors > 1
@@ -1152,16 +1910,11 @@ if __name__ == '__main__':
 
     elif command == 'chktex':
         command = "{} '{}'".format(command, filename)
-        process = Popen(command,
-                        shell=True,
-                        stdout=PIPE,
-                        stdin=PIPE,
-                        stderr=STDOUT,
-                        close_fds=True,
-                        universal_newlines=True)
-        parser = ChkTexParser(process.stdout, verbose, filename)
-        fatal_error, number_errors, number_warnings = parser.parse_stream()
-        tex_status = process.wait()
+        tex_status, parser, _ = run_command(
+            command, lambda stream: ChkTexParser(stream, verbose, filename))
+        fatal_error = parser.fatal_error
+        number_errors = parser.number_errors
+        number_warnings = parser.number_warnings
 
     # Check status of running the viewer
     if viewer_status != 0:
@@ -1204,6 +1957,10 @@ if __name__ == '__main__':
                   onclick="runBibtex();
                   return false">'''.format(texlib_location, engine))
 
+        if include_only:
+            print('''<input type="button" value="Typeset Everything"
+                      onclick="runFullLatex(); return false">''')
+
         print('''<input type="button" value="Create Index"
                   onclick="runMakeIndex(); return false">
                  <input type="button" value="Clean" onclick="runClean();
@@ -13,16 +13,19 @@ sys.path.insert(
     path.dirname(path.dirname(path.abspath(__file__))) + "/lib/Python")
 
 from argparse import ArgumentParser
+from hashlib import sha1
 from io import open
-from os import getenv
-from os.path import basename, dirname, join
+from os import fstat, getenv
+from os.path import basename, dirname, getsize, join, realpath
 from pickle import load, dump
 from pipes import quote as shellquote
 from subprocess import check_output, STDOUT
 from sys import version_info
 
+from events import Event, HTMLRenderer, JSONRenderer
+from logreader import MappedLog
 from parsing import LaTexMkParser
-from tex import encodings
+from segments import ParallelLaTexMkParser
 from gutter import update_marks
 
 # -- Module Import ------------------------------------------------------------
@@ -109,6 +112,110 @@ def notify(title='LaTeX Watch', summary='', messages=[], token=None):
     return int(notification_output)
 
 
+def fingerprint(logfile, offset, size=1 << 20):
+    """Return a fingerprint for the first ``offset`` bytes of ``logfile``.
+
+    The fingerprint contains the inode of ``logfile`` and a hash of all bytes
+    before ``offset``. ``latex_watch.pl`` rewrites the log file on every run.
+    A new run of the same document often reproduces the start of the old log
+    and even the bytes right before ``offset``, so we have to hash the whole
+    prefix to notice that the log changed.
+
+    Arguments:
+
+        logfile
+
+            The path of the log file.
+
+        offset
+
+            The number of bytes at the start of ``logfile`` the fingerprint
+            should cover.
+
+        size
+
+            The number of bytes we read at once.
+
+    Returns: ``(int, str)``
+
+    Examples:
+
+        >>> logfile = 'Tests/Log/latexmk.log'
+        >>> fingerprint(logfile, 100) == fingerprint(logfile, 100)
+        True
+        >>> fingerprint(logfile, 100) == fingerprint(logfile, 101)
+        False
+
+        A log rewritten with the same length and the same start and end
+
+        >>> from shutil import rmtree
+        >>> from tempfile import mkdtemp
+        >>> directory = mkdtemp()
+        >>> logfile = join(directory, 'thesis.latexmk.log')
+        >>> with open(logfile, 'wb') as log:
+        ...     _ = log.write(b'Latexmk: Run 1\\nthesis.tex:3: Error\\nEnd\\n')
+        >>> old = fingerprint(logfile, 36)
+        >>> with open(logfile, 'wb') as log:
+        ...     _ = log.write(b'Latexmk: Run 1\\nthesis.tex:7: Error\\nEnd\\n')
+        >>> fingerprint(logfile, 36) == old
+        False
+        >>> rmtree(directory)
+
+    """
+    checksum = sha1()
+    with open(logfile, 'rb') as log:
+        inode = fstat(log.fileno()).st_ino
+        remaining = offset
+        while remaining > 0:
+            block = log.read(min(size, remaining))
+            if not block:
+                break
+            checksum.update(block)
+            remaining -= len(block)
+    return inode, checksum.hexdigest()
+
+
+def get_resume_position(cachefile, logfile):
+    """Return the position where we stopped parsing ``logfile`` last time.
+
+    This function returns ``None`` if there is no such position, or if
+    ``logfile`` was truncated or replaced since the last call of this script.
+    Otherwise it returns a tuple containing a byte offset into ``logfile`` and
+    the state ``LaTexMkParser`` had at this offset.
+
+    Arguments:
+
+        cachefile
+
+            The path to the cache file for the current tex project.
+
+        logfile
+
+            The path of the log file we want to parse.
+
+    Returns: ``(int, {str: object})``
+
+    Examples:
+
+        >>> print(get_resume_position('non_existent_file', 'latexmk.log'))
+        None
+
+    """
+    try:
+        with open(cachefile, 'rb') as storage:
+            tail_data = load(storage).get('texparser')
+    except Exception:
+        return None
+
+    if not tail_data or tail_data['logfile'] != realpath(logfile):
+        return None
+    offset = tail_data['offset']
+    if (getsize(logfile) < offset
+            or fingerprint(logfile, offset) != tail_data['fingerprint']):
+        return None
+    return offset, tail_data['state']
+
+
 # -- Main ---------------------------------------------------------------------
 
 if __name__ == '__main__':
@@ -127,6 +234,22 @@ if __name__ == '__main__':
                 not exist yet or the old messages could not be read for some
                 other reasons, then `reload` will just fail silently.""")
 
+    parser.add_argument(
+        '-format',
+        default='html',
+        choices={'html', 'json'},
+        help="""The format of the messages found in `logfile`. The format
+                `json` writes one JSON object per message.""")
+
+    parser.add_argument(
+        '-tail',
+        action='store_true',
+        default=False,
+        help="""Only parse the part of `logfile` that was added since the
+                last call of this script with this option. If the log file was
+                truncated or replaced in the meantime, then the script parses
+                the whole file.""")
+
     parser.add_argument(
         'logfile',
         help="""The location of the log file that should be parsed.""")
@@ -154,17 +277,38 @@ if __name__ == '__main__':
             # Fail silently
             exit(0)
     else:
-        # Depending on the error the tex engine might return a log file in a
-        # different encoding.
-        for encoding in encodings:
-            try:
-                texparser = LaTexMkParser(open(logfile, encoding=encoding),
+        sink = (JSONRenderer()
+                if arguments.format == 'json' else HTMLRenderer())
+        resume_position = (get_resume_position(cachefile, logfile)
+                           if arguments.tail else None)
+        if resume_position:
+            # Map the log into memory. This way we only decode the statements
+            # the parser is interested in, which matters for huge log files.
+            with MappedLog(logfile) as log:
+                texparser = LaTexMkParser(log,
                                           verbose=False,
-                                          filename=texfile)
+                                          filename=texfile,
+                                          sink=sink)
+                texparser.resume(*resume_position)
                 texparser.parse_stream()
-                break
-            except UnicodeDecodeError:
-                continue
+        else:
+            # Parse the runs of large finished logs in parallel
+            texparser = ParallelLaTexMkParser(logfile,
+                                              verbose=False,
+                                              filename=texfile,
+                                              sink=sink)
+            texparser.parse_stream()
+        decoder = texparser.decoder
+        if decoder.fallbacks or decoder.encoding not in {None, 'utf_8'}:
+            sink.emit(
+                Event('message',
+                      'warning' if decoder.fallbacks else 'info',
+                      text='The log file uses the encoding {}{}'.format(
+                          decoder.encoding,
+                          ' ({} statements used other encodings)'.format(
+                              decoder.fallbacks)
+                          if decoder.fallbacks else '')))
+            sink.flush()
         # Sort marks by line number
         marks = sorted(texparser.marks, key=lambda marks: marks[1])
         update_marks(cachefile, marks)
@@ -186,6 +330,14 @@ if __name__ == '__main__':
             with open(cachefile, 'r+b') as storage:
                 typesetting_data = load(storage)
                 typesetting_data['messages'] = messages
+                if arguments.tail:
+                    offset, state = texparser.boundary
+                    typesetting_data['texparser'] = {
+                        'logfile': realpath(logfile),
+                        'offset': offset,
+                        'state': state,
+                        'fingerprint': fingerprint(logfile, offset)
+                    }
                 storage.seek(0)
                 dump(typesetting_data, storage)
         except IOError:
@@ -49,6 +49,10 @@ function runLatex(){
     runCommand('latex')
 };
 
+function runFullLatex(){
+    runCommand('latex -full')
+};
+
 function runBibtex(){
     runCommand('bibtex')
 };
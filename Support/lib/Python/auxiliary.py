@@ -9,7 +9,8 @@ from __future__ import unicode_literals
 from os import getenv
 from os.path import join
 from pipes import quote
-from subprocess import check_output
+
+from pipeline import read_command
 
 # -- Functions ----------------------------------------------------------------
 
@@ -62,6 +63,5 @@ def remove_auxiliary_files(directory='.',
 
     """
     clean_command = join(tm_bundle_support, 'bin/clean.rb')
-    return check_output('{} {}'.format(quote(clean_command), quote(directory)),
-                        universal_newlines=True,
-                        shell=True).split('\n')[:-1]
+    return read_command('{} {}'.format(quote(clean_command),
+                                       quote(directory))).split('\n')[:-1]
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""This module manages build directories outside of the project directory.
+
+LaTeX and the programs it depends on write many intermediate files. If the
+project directory is slow — e.g. since it is on a network share — then we
+can write these files into a build directory on a faster location, such as
+a RAM disk. Afterwards we only copy the PDF and the synctex data back into
+the project directory.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+from hashlib import sha1
+from os import chdir, getcwd, makedirs, remove, rename
+from os.path import exists, isdir, join, realpath
+from shutil import copyfile
+
+# -- Global Variables ---------------------------------------------------------
+
+# The extensions of the files we copy back into the project directory
+SYNC_SUFFIXES = ('pdf', 'synctex.gz')
+
+# -- Functions ----------------------------------------------------------------
+
+
+def get_build_directory(location, name, project_directory='.'):
+    """Return the build directory for the tex file ``name`` in ``location``.
+
+    Every project gets its own build directory. Its name contains the name
+    of the tex file and a hash of the location of the project, so documents
+    with the same name in different projects do not share their files.
+
+    Arguments:
+
+        location
+
+            The directory that contains the build directories, e.g.
+            ``/dev/shm``.
+
+        name
+
+            The name of the tex file without its extension.
+
+        project_directory
+
+            The directory that contains the tex file.
+
+    Returns: ``str``
+
+    Examples:
+
+        >>> print(get_build_directory('/dev/shm', 'thesis', '/Users/anna/A'))
+        ... # doctest:+ELLIPSIS
+        /dev/shm/latex-thesis-...
+        >>> (get_build_directory('/dev/shm', 'thesis', '/Users/anna/A') ==
+        ...  get_build_directory('/dev/shm', 'thesis', '/Users/anna/B'))
+        False
+
+    """
+    project = sha1(realpath(project_directory).encode('utf-8')).hexdigest()
+    return join(location, 'latex-{}-{}'.format(name, project[:10]))
+
+
+def prepare_build_directory(directory, subdirectories=()):
+    """Create ``directory`` and the given ``subdirectories`` inside it.
+
+    TeX does not create directories. If a document includes the file
+    ``chapters/intro.tex`` via ``\\include``, then LaTeX writes the auxiliary
+    file ``chapters/intro.aux`` into the build directory. We therefore have
+    to create the directory ``chapters`` in the build directory beforehand.
+
+    Examples:
+
+        >>> from os.path import dirname
+        >>> from shutil import rmtree
+        >>> from tempfile import mkdtemp
+        >>> directory = join(mkdtemp(), 'build')
+        >>> prepare_build_directory(directory, ['chapters', 'chapters', ''])
+        >>> isdir(join(directory, 'chapters'))
+        True
+        >>> rmtree(dirname(directory))
+
+    """
+    for subdirectory in set(subdirectories) | {''}:
+        path = join(directory, subdirectory)
+        if not isdir(path):
+            makedirs(path, 0o700)
+
+
+def sync_back(directory, name, target='.', suffixes=SYNC_SUFFIXES):
+    """Copy the final files of ``name`` from ``directory`` to ``target``.
+
+    We first copy every file next to its destination and then rename it.
+    This way a viewer that reloads the PDF never sees a partially written
+    file.
+
+    Arguments:
+
+        directory
+
+            The build directory.
+
+        name
+
+            The name of the tex file without its extension.
+
+        target
+
+            The project directory.
+
+        suffixes
+
+            The extensions of the files we copy.
+
+    Returns: ``[str]``
+
+        The paths of the files we copied.
+
+    Examples:
+
+        >>> from shutil import rmtree
+        >>> from tempfile import mkdtemp
+        >>> directory, target = mkdtemp(), mkdtemp()
+        >>> with open(join(directory, 'thesis.pdf'), 'w') as pdf:
+        ...     _ = pdf.write('%PDF')
+        >>> for path in sync_back(directory, 'thesis', target):
+        ...     print(path.replace(target, 'target'))
+        target/thesis.pdf
+        >>> exists(join(target, '.thesis.pdf.sync'))
+        False
+        >>> rmtree(directory)
+        >>> rmtree(target)
+
+    """
+    copied = []
+    for suffix in suffixes:
+        filename = '{}.{}'.format(name, suffix)
+        source = join(directory, filename)
+        if not exists(source):
+            continue
+        destination = join(target, filename)
+        temporary = join(target, '.{}.sync'.format(filename))
+        try:
+            copyfile(source, temporary)
+            rename(temporary, destination)
+            copied.append(destination)
+        except (IOError, OSError):
+            print('<p class="warning">Could not copy {} into the project '
+                  'directory</p>'.format(filename))
+            if exists(temporary):
+                remove(temporary)
+    return copied
+
+
+@contextmanager
+def working_directory(directory):
+    """Change the current directory to ``directory`` temporarily.
+
+    If ``directory`` is ``None``, then we stay in the current directory.
+
+    Examples:
+
+        >>> current = getcwd()
+        >>> with working_directory('/'):
+        ...     print(getcwd())
+        /
+        >>> getcwd() == current
+        True
+
+    """
+    previous = getcwd()
+    if directory is not None:
+        chdir(directory)
+    try:
+        yield
+    finally:
+        chdir(previous)
@@ -0,0 +1,745 @@
+# -*- coding: utf-8 -*-
+"""This module contains the messages the log parsers produce and their output.
+
+The parsers in ``parsing.py`` do not print anything themselves. Instead they
+send ``Event`` records to a sink. A sink is any object with the methods
+``emit(event)`` and ``flush()``. This module provides sinks that render events
+as HTML for the log window or as JSON lines, and a sink that collects events,
+so we can parse a log once and feed the result to several consumers.
+``PassAggregator`` wraps another sink and condenses the repeated output of
+the LaTeX passes of a latexmk run.
+
+Since the parsers flush their sink after every message, this module also
+contains ``BufferedOutput``. This class collects the output written to a
+stream and only passes it on after a certain time or amount of data.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+
+from json import dumps
+from os.path import relpath
+from threading import Lock, Timer
+from timeit import default_timer
+try:
+    from urllib.parse import quote  # Python 3
+except ImportError:
+    from urllib import quote  # Python 2
+
+# -- Functions ----------------------------------------------------------------
+
+
+def make_link(file, line=1):
+    """Create a TextMate link for ``file`` pointing to ``line``.
+
+    Arguments:
+
+        file
+
+            The path to the file that should be opened if we click the link
+            generated by this function.
+
+        line
+
+            The line which should be displayed when TextMate opens ``file``.
+
+    Returns: ``str``
+
+    Examples:
+
+        >>> print(make_link('Tests/TeX/makeindex.tex', 1))
+        txmt://open/?url=file://Tests/TeX/makeindex.tex&line=1
+        >>> print(make_link('Wide Open Spaces.txt', 20))
+        txmt://open/?url=file://Wide%20Open%20Spaces.txt&line=20
+
+    """
+    return "txmt://open/?url=file://{}&line={}".format(
+        quote(file.encode('utf-8')), line)
+
+
+def get_marks(events):
+    """Return the gutter marks for a list of events.
+
+    The result uses the same format as the attribute ``marks`` of
+    ``LaTexParser`` and can therefore be used as argument for
+    ``gutter.update_marks``.
+
+    Arguments:
+
+        events
+
+            An iterable containing ``Event`` records.
+
+    Returns: ``{(str, int, str, str)}``
+
+    Examples:
+
+        >>> events = [Event('latex_error', 'error', '/a.tex', 4,
+        ...                 './a.tex:4: Undefined control sequence.',
+        ...                 (11, 38), ('./a.tex',)),
+        ...           Event('message', 'info', text='Document Class')]
+        >>> for mark in get_marks(events):
+        ...     print(mark[0], mark[1], mark[2], mark[3])
+        /a.tex 4 error Undefined control sequence.
+
+    """
+    return {(event.file, event.line, event.severity, event.message)
+            for event in events if event.kind in {'latex_error', 'located'}}
+
+
+# -- Classes ------------------------------------------------------------------
+
+
+class Event(object):
+    """A single message found by a log parser.
+
+    Events do not copy the message out of the log line. They store the line
+    together with the start and end of the message inside the line instead.
+
+    Attributes:
+
+        kind
+
+            A string describing what happened, e.g. ``message`` for a plain
+            log message or ``transcript`` if a tool tells us the location of
+            its log file. The renderers use the kind to format the event.
+
+        severity
+
+            One of ``info``, ``warning``, ``format`` (over- and underfull
+            boxes), ``error`` or ``fatal``. This value is ``None`` for events
+            that only structure the output.
+
+        file
+
+            The path of the file the event refers to or ``None``.
+
+        line
+
+            The line number inside ``file`` or ``None``.
+
+        text
+
+            The log line that caused the event.
+
+        span
+
+            A tuple containing the start and end of the message inside
+            ``text``. If this value is ``None``, then the message is the
+            whole text.
+
+        arguments
+
+            A tuple with additional values specific to ``kind``.
+
+    """
+
+    __slots__ = ('kind', 'severity', 'file', 'line', 'text', 'span',
+                 'arguments')
+
+    def __init__(self,
+                 kind,
+                 severity=None,
+                 file=None,
+                 line=None,
+                 text='',
+                 span=None,
+                 arguments=()):
+        """Initialize a new event.
+
+        Examples:
+
+            >>> event = Event('message', 'error', text='! Undefined control',
+            ...               span=(2, 11))
+            >>> print(event.message)
+            Undefined
+
+        """
+        self.kind = kind
+        self.severity = severity
+        self.file = file
+        self.line = line
+        self.text = text
+        self.span = span
+        self.arguments = arguments
+
+    @property
+    def message(self):
+        """Return the message of the event.
+
+        Returns: ``str``
+
+        """
+        if self.span is None:
+            return self.text
+        start, end = self.span
+        return self.text[start:end]
+
+
+class EventList(list):
+    """Collect events, e.g. to render them later with another sink.
+
+    Examples:
+
+        >>> events = EventList()
+        >>> events.emit(Event('message', 'info', text='Document Class'))
+        >>> events.flush()
+        >>> renderer = HTMLRenderer()
+        >>> for event in events:
+        ...     renderer.emit(event)
+        <p class="info">Document Class</p>
+
+    """
+
+    def emit(self, event):
+        """Store ``event``."""
+        self.append(event)
+
+    def flush(self):
+        """Do nothing, since we keep all events in memory."""
+        pass
+
+
+class BufferedOutput(object):
+    """Write output fragments to a stream in batches.
+
+    Calls of ``flush`` only write the collected fragments, if the last write
+    happened at least ``interval`` seconds ago. Otherwise a timer writes them
+    once the interval is over. If the collected fragments contain ``size``
+    characters or more, then we write them immediately.
+
+    Examples:
+
+        >>> from io import StringIO
+        >>> stream = StringIO()
+        >>> output = BufferedOutput(stream, interval=60)
+        >>> print('<p>Some text</p>', file=output)
+        >>> output.flush()
+        >>> len(stream.getvalue())
+        0
+        >>> output.flush(force=True)
+        >>> print(stream.getvalue().strip())
+        <p>Some text</p>
+
+    """
+
+    def __init__(self, stream, interval=0.05, size=1 << 16):
+        """Initialize a new buffer for ``stream``.
+
+        Arguments:
+
+            stream
+
+                The stream that receives the output.
+
+            interval
+
+                The minimum time in seconds between two writes. If this value
+                is ``0`` or smaller, then every call of ``flush`` writes the
+                collected output.
+
+            size
+
+                The maximum number of characters we collect before we write
+                them.
+
+        """
+        self.stream = stream
+        self.interval = interval
+        self.size = size
+        self.fragments = []
+        self.length = 0
+        self.last_write = default_timer()
+        self.timer = None
+        self.lock = Lock()
+
+    def __getattr__(self, name):
+        # Provide attributes such as ``encoding`` of the original stream
+        return getattr(self.stream, name)
+
+    def write(self, text):
+        """Collect ``text``."""
+        with self.lock:
+            self.fragments.append(text)
+            self.length += len(text)
+            full = self.length >= self.size
+        if full:
+            self.flush(force=True)
+
+    def flush(self, force=False):
+        """Write the collected output, if the time budget allows it.
+
+        Arguments:
+
+            force
+
+                Write the collected output regardless of the time passed
+                since the last write.
+
+        """
+        with self.lock:
+            elapsed = default_timer() - self.last_write
+            if force or elapsed >= self.interval:
+                self.write_fragments()
+            elif self.fragments and self.timer is None:
+                self.timer = Timer(self.interval - elapsed, self.flush,
+                                   kwargs={'force': True})
+                self.timer.daemon = True
+                self.timer.start()
+
+    def close(self):
+        """Write all collected output."""
+        timer = self.timer
+        self.flush(force=True)
+        if timer is not None:
+            timer.join()
+
+    def write_fragments(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.fragments:
+            self.stream.write(''.join(self.fragments))
+            self.stream.flush()
+            self.fragments = []
+            self.length = 0
+        self.stream.flush()
+        self.last_write = default_timer()
+
+
+class PassAggregator(object):
+    """Show only the last LaTeX pass of a latexmk run in full.
+
+    latexmk usually runs LaTeX several times and every pass repeats most
+    messages of the previous one. This sink keeps the messages of a pass until
+    it knows if another pass follows. For passes that are not the last one, it
+    only passes on a summary containing the number of warnings. For the last
+    pass it reports how many warnings also occurred in earlier passes, how
+    many warnings of earlier passes disappeared, and the number of overfull
+    and underfull boxes per file.
+
+    Errors always reach the wrapped sink immediately. Since the sink only
+    knows that a pass was the last one after the parser is done, you need to
+    call ``close`` afterwards.
+
+    Examples:
+
+        >>> events = EventList()
+        >>> aggregator = PassAggregator(events)
+        >>> for number in range(2):
+        ...     aggregator.emit(Event('program', text='This is pdfTeX',
+        ...                           arguments=('latex', )))
+        ...     aggregator.emit(Event('located', 'warning', '/a.tex', 4,
+        ...                           'Citation undefined'))
+        ...     if number == 0:
+        ...         aggregator.emit(Event('located', 'warning', '/a.tex', 8,
+        ...                               'Reference undefined'))
+        ...     aggregator.emit(Event('message', 'format', '/a.tex',
+        ...                           text='Overfull \\hbox'))
+        ...     aggregator.emit(Event('transcript', file='/a.log',
+        ...                           arguments=('a.log', )))
+        >>> aggregator.close()
+        >>> for event in events:
+        ...     print(event.kind)
+        program
+        collapsed_pass
+        transcript
+        program
+        final_pass
+        located
+        message
+        box_histogram
+        transcript
+
+        The first pass contained two warnings and one box warning. One of the
+        warnings disappeared in the second pass.
+
+        >>> events[1].arguments
+        (1, 2, 1)
+        >>> events[4].arguments
+        (2, 2, 1)
+        >>> events[7].arguments[0][1:]
+        (1, 0)
+
+    """
+
+    def __init__(self, sink):
+        """Initialize a new aggregator passing events on to ``sink``.
+
+        Arguments:
+
+            sink
+
+                The sink that receives the aggregated events.
+
+        """
+        self.sink = sink
+        self.passes = 0
+        # The keys of the warnings of all completed passes
+        self.earlier = set()
+        # The events since the start of the last pass together with a flag
+        # that tells us if the event belongs to the pass
+        self.pending = []
+        self.in_pass = False
+
+    def emit(self, event):
+        """Store ``event`` or pass it on to the wrapped sink."""
+        if event.kind == 'program' and event.arguments[0] == 'latex':
+            # Another pass follows, so the last one was not the final pass
+            self.collapse()
+            self.passes += 1
+            self.in_pass = True
+            self.sink.emit(event)
+        elif not self.passes or event.severity in {'error', 'fatal'}:
+            self.sink.emit(event)
+        else:
+            self.pending.append((self.in_pass, event))
+            if event.kind in {'transcript', 'bad_run'}:
+                self.in_pass = False
+
+    def flush(self):
+        """Flush the wrapped sink."""
+        self.sink.flush()
+
+    def close(self):
+        """Pass on the events of the last pass."""
+        events = [event for in_pass, event in self.pending if in_pass]
+        keys = {self.key(event) for event in events if self.is_warning(event)}
+        histogram = {}
+        for event in events:
+            if event.severity == 'format':
+                counts = histogram.setdefault(event.file, [0, 0])
+                counts[0 if event.message.startswith('Overfull') else 1] += 1
+        if self.passes > 1:
+            self.sink.emit(
+                Event('final_pass', 'info',
+                      arguments=(self.passes, len(keys & self.earlier),
+                                 len(self.earlier - keys))))
+        for in_pass, event in self.pending:
+            if in_pass and histogram and event.kind in {'transcript',
+                                                        'bad_run'}:
+                self.sink.emit(
+                    Event('box_histogram', 'info', arguments=tuple(
+                        (filename, overfull, underfull)
+                        for filename, (overfull, underfull) in sorted(
+                            histogram.items(),
+                            key=lambda item: item[0] or ''))))
+                histogram = None
+            self.sink.emit(event)
+        self.pending = []
+        self.sink.flush()
+
+    def collapse(self):
+        """Replace the messages of the pending pass by a summary."""
+        summary = [0, 0]
+        summarized = False
+        for in_pass, event in self.pending:
+            if in_pass and self.is_detail(event):
+                if self.is_warning(event):
+                    self.earlier.add(self.key(event))
+                    summary[event.severity == 'format'] += 1
+                continue
+            if not summarized and (not in_pass or event.kind in {
+                    'transcript', 'bad_run'}):
+                self.emit_summary(summary)
+                summarized = True
+            self.sink.emit(event)
+        if self.passes and not summarized:
+            self.emit_summary(summary)
+        self.pending = []
+
+    def emit_summary(self, summary):
+        number_warnings, number_boxes = summary
+        self.sink.emit(
+            Event('collapsed_pass', 'info',
+                  arguments=(self.passes, number_warnings, number_boxes)))
+
+    @staticmethod
+    def is_detail(event):
+        """Check if we can drop ``event`` for passes that are not the last."""
+        return event.kind in {'message', 'located', 'file', 'include'}
+
+    @staticmethod
+    def is_warning(event):
+        return event.severity in {'warning', 'format'}
+
+    @staticmethod
+    def key(event):
+        """Return a value identifying the message of ``event`` in all passes.
+
+        Returns: ``(str, str, str, int, str)``
+
+        """
+        return (event.kind, event.severity, event.file, event.line,
+                event.message)
+
+
+class HTMLRenderer(object):
+    """Render events as HTML for the log window of the LaTeX bundle."""
+
+    # The CSS class for messages of a certain severity
+    classes = {
+        'info': 'info',
+        'warning': 'warning',
+        'format': 'fmtWarning',
+        'error': 'error',
+        'fatal': 'error',
+    }
+
+    # The headings for the output of the different programs
+    programs = {
+        'biber': '<div class="biber"><h3>{}</h3>',
+        'bibtex': '<div class="bibtex"><h3>{}</h3>',
+        'latex': '<div class="latex"><hr><h3>{}</h3>',
+        'makeglossaries': '<h2>Make Glossaries</h2>' +
+                          '<p class="info" >Version: <i>{}</i></p>',
+        'makeindex': '<p class="info">Run <strong>Makeindex</strong>, ' +
+                     'version {}<p>',
+    }
+
+    def __init__(self, stream=None):
+        """Initialize a new HTML renderer.
+
+        Arguments:
+
+            stream
+
+                The stream the renderer writes to. If this value is ``None``,
+                then the renderer uses standard output.
+
+        """
+        self.stream = stream
+        self.urgent = False
+
+    def emit(self, event):
+        """Write ``event`` as HTML.
+
+        Examples:
+
+            >>> renderer = HTMLRenderer()
+            >>> renderer.emit(Event('message', text='Some text'))
+            <p>Some text</p>
+            >>> renderer.emit(Event('located', 'warning', file='/a.tex',
+            ...                     line=2, text='Warning'))
+            ... # doctest:+ELLIPSIS
+            <p class="warning"><a href="txmt://...a.tex&line=2">Warning</a></p>
+
+        """
+        print(self.render(event), file=self.stream)
+        if event.severity in {'error', 'fatal'}:
+            self.urgent = True
+
+    def flush(self):
+        """Flush the output stream.
+
+        If the stream is a ``BufferedOutput``, then we only bypass its time
+        budget for errors.
+
+        """
+        stream = self.stream if self.stream else sys.stdout
+        if self.urgent and isinstance(stream, BufferedOutput):
+            stream.flush(force=True)
+        else:
+            stream.flush()
+        self.urgent = False
+
+    def render(self, event):
+        """Return the HTML for ``event``.
+
+        Returns: ``str``
+
+        """
+        return getattr(self, 'render_{}'.format(event.kind))(event)
+
+    def render_message(self, event):
+        if event.severity is None:
+            return '<p>{}</p>'.format(event.message)
+        return '<p class="{}">{}</p>'.format(self.classes[event.severity],
+                                             event.message)
+
+    def render_latexmk(self, event):
+        return '<p class="ltxmk">{}</p>'.format(event.message)
+
+    def render_located(self, event):
+        return '<p class="{}"><a href="{}">{}</a></p>'.format(
+            self.classes[event.severity], make_link(event.file, event.line),
+            event.message)
+
+    def render_latex_error(self, event):
+        return ('<p class="error">Latex Error: <a href="' +
+                '{}">{}:{}</a> {}</p>'.format(
+                    make_link(event.file, event.line), event.arguments[0],
+                    event.line, event.message))
+
+    def render_chktex(self, event):
+        return '<p class="{}">{}: <a href="{}">{}:{}</a></p>'.format(
+            event.severity,
+            'Error' if event.severity == 'error' else 'Warning',
+            make_link(event.file, event.line), event.arguments[0],
+            event.message)
+
+    def render_source(self, event):
+        return '<pre>{}\n{}</pre>'.format(*event.arguments)
+
+    def render_runaway(self, event):
+        lines = ['<p class="error">']
+        if event.severity == 'fatal':
+            lines.append(event.message)
+        elif event.text:
+            lines.append('<pre>{}</pre>'.format(event.message))
+        lines.append('</p>')
+        return '\n'.join(lines)
+
+    def render_transcript(self, event):
+        return '<p>Complete transcript is in <a href="{}">{}</a></p>'.format(
+            make_link(event.file), event.arguments[0])
+
+    def render_bad_run(self, event):
+        logfile = event.arguments[0]
+        return ('<p class="error">A fatal error occurred, log file is in ' +
+                '<a href="{}">{}</a></p>'.format(
+                    make_link(event.file, logfile), logfile))
+
+    def render_file(self, event):
+        return '<h4>Processing: {}</h4>'.format(event.file)
+
+    def render_include(self, event):
+        return '<ul><li>Including: {}</li></ul>'.format(event.file)
+
+    def render_program(self, event):
+        return self.programs[event.arguments[0]].format(event.message)
+
+    def render_sorting(self, event):
+        return ('<p class="info">Sorting entries: <strong>' +
+                '{}</strong><p>'.format(event.message))
+
+    def render_index_file(self, event):
+        return '<p class="info">{} {}: <strong>{}</strong>'.format(
+            *event.arguments)
+
+    def render_written(self, event):
+        description, filename = event.arguments
+        return '<p class="info">{} <a href="{}">{}</a></p>'.format(
+            description, make_link(event.file), filename)
+
+    def render_glossary_type(self, event):
+        return ('<p class="info">Add Glossary Type <strong>' +
+                '{}</strong><i> (Files: {})</i></p>'.format(*event.arguments))
+
+    def render_xindy(self, event):
+        glossary_type, language = event.arguments
+        return ('<h3>Run xindy for glossary type {}</h3>'
+                '<p class="info">Language: {}</p>'.format(
+                    glossary_type, language))
+
+    def render_glossary(self, event):
+        glossary_type, filename = event.arguments
+        return ('<p class="info">Finished glossary for type <strong>' +
+                '{}</strong>. Output is in <a href="{}">{}</a></p>'.format(
+                    glossary_type, make_link(event.file, event.line),
+                    filename))
+
+    def render_collapsed_pass(self, event):
+        number, number_warnings, number_boxes = event.arguments
+        return ('<p class="info">Pass {}: {} warning{} and {} overfull or '
+                'underfull box{} (only the last pass is shown in full)</p>'.
+                format(number, number_warnings,
+                       '' if number_warnings == 1 else 's', number_boxes,
+                       '' if number_boxes == 1 else 'es'))
+
+    def render_final_pass(self, event):
+        number, repeated, resolved = event.arguments
+        return ('<p class="info">Pass {}: {} warning{} also occurred in '
+                'earlier passes, {} warning{} of earlier passes '
+                'disappeared</p>'.format(number, repeated,
+                                         '' if repeated == 1 else 's',
+                                         resolved,
+                                         '' if resolved == 1 else 's'))
+
+    def render_box_histogram(self, event):
+        rows = ''.join(
+            '<tr><td>{}</td><td>{}</td><td>{}</td></tr>'.format(
+                '<a href="{}">{}</a>'.format(make_link(filename),
+                                             relpath(filename))
+                if filename else 'Unknown file', overfull, underfull)
+            for filename, overfull, underfull in event.arguments)
+        return ('<table class="boxes"><tr><th>File</th><th>Overfull</th>'
+                '<th>Underfull</th></tr>{}</table>'.format(rows))
+
+    def render_stopped(self, event):
+        seconds, saved = event.arguments
+        return ('<p class="error">Stopped the command {:.1f} seconds after '
+                'it started because of the fatal error above{}</p>'.format(
+                    seconds, '' if saved is None else
+                    ' (about {:.1f} seconds faster than the last complete '
+                    'run)'.format(saved)))
+
+    def render_timeout(self, event):
+        command, reason, limit, seconds = event.arguments
+        return ('<p class="error">Stopped “{}” after {:.0f} seconds, since '
+                'it {}</p>'.format(
+                    command, seconds,
+                    'did not produce any output for {} seconds'.format(limit)
+                    if reason == 'idle' else
+                    'exceeded the time limit of {} seconds'.format(limit)))
+
+    def render_summary(self, event):
+        number_errors, number_warnings = event.arguments
+        return '''<hr><p>Found {} error{}, and {} warning{} in this run</p>
+                  '''.format(number_errors, '' if number_errors == 1 else 's',
+                             number_warnings,
+                             '' if number_warnings == 1 else 's')
+
+
+class JSONRenderer(object):
+    """Render events as JSON objects, one object per line."""
+
+    def __init__(self, stream=None):
+        """Initialize a new JSON renderer.
+
+        Arguments:
+
+            stream
+
+                The stream the renderer writes to. If this value is ``None``,
+                then the renderer uses standard output.
+
+        """
+        self.stream = stream
+
+    def emit(self, event):
+        """Write ``event`` as JSON object.
+
+        Examples:
+
+            >>> renderer = JSONRenderer()
+            >>> renderer.emit(Event('latex_error', 'error', '/a.tex', 4,
+            ...                     './a.tex:4: Undefined control sequence.',
+            ...                     (11, 38), ('./a.tex',)))
+            ... # doctest:+NORMALIZE_WHITESPACE
+            {"arguments": ["./a.tex"], "file": "/a.tex", "kind": "latex_error",
+             "line": 4, "message": "Undefined control sequence.",
+             "severity": "error"}
+
+        """
+        print(dumps(
+            {
+                'kind': event.kind,
+                'severity': event.severity,
+                'file': event.file,
+                'line': event.line,
+                'message': event.message,
+                'arguments': list(event.arguments),
+            },
+            sort_keys=True),
+              file=self.stream)
+
+    def flush(self):
+        """Flush the output stream."""
+        (self.stream if self.stream else sys.stdout).flush()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""This module keeps track of the files TeX reads while it typesets a document.
+
+Whenever TeX opens a file it writes an opening parenthesis followed by the
+name of the file to the log. As soon as it is done with the file it writes a
+closing parenthesis. Other messages in the log use (balanced) parentheses
+too, e.g. ``Underfull \\hbox (badness 10000)``.
+
+``FileStack`` scans the log for parentheses in a single pass and keeps a
+stack containing an entry for every parenthesis that is still open. This
+way we always know the file TeX currently reads.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from re import compile, UNICODE
+
+# -- Global Variables ---------------------------------------------------------
+
+# Match the parentheses TeX writes when it opens or closes a file
+PARENTHESES = compile('[()]')
+
+# Match the name of a file following an opening parenthesis. Paths starting
+# with ``/``, ``./`` or ``../`` may contain spaces. A file name always ends
+# with an extension starting with a letter. We never search past the next
+# parenthesis, so the time we need to scan a line grows linearly with its
+# length.
+FILE_NAME = compile(
+    r'(?:\.{0,2}/[^()\n]*?|[^\s()]+?)\.[A-Za-z]\w*(?=[\s()]|$)', UNICODE)
+
+# -- Classes ------------------------------------------------------------------
+
+
+class FileStack(object):
+    """Track the files TeX opens and closes.
+
+    Examples:
+
+        >>> files = FileStack('thesis.tex')
+        >>> print(' '.join(files.scan('(./chapter.tex (./section.tex')))
+        ./chapter.tex ./section.tex
+        >>> print(files.current_file)
+        ./section.tex
+        >>> files.scan('Underfull \\\\hbox (badness 10000) in paragraph)')
+        []
+        >>> print(files.current_file)
+        ./chapter.tex
+        >>> files.scan('[2]) ) )')
+        []
+        >>> print(files.current_file)
+        thesis.tex
+
+    """
+
+    def __init__(self, filename):
+        """Initialize a new stack for the log of ``filename``.
+
+        Arguments:
+
+            filename
+
+                The name of the tex file TeX typesets. We attribute all
+                messages outside of other files to this file.
+
+        """
+        self.filename = filename
+        # The entries for all open parentheses. Parentheses that do not
+        # belong to a file use the entry ``None``.
+        self.stack = []
+        self.files = []
+
+    @property
+    def current_file(self):
+        """Return the name of the file TeX currently reads.
+
+        Returns: ``str``
+
+        """
+        return self.files[-1] if self.files else self.filename
+
+    def scan(self, text):
+        """Update the stack using the parentheses in ``text``.
+
+        Closing parentheses without a matching opening parenthesis (e.g. the
+        one closing the main file) do not change the stack.
+
+        Arguments:
+
+            text
+
+                Output of TeX, usually a single statement of the log.
+
+        Returns: ``[str]``
+
+            The names of the files opened in ``text``.
+
+        Examples:
+
+            >>> files = FileStack('thesis.tex')
+            >>> for filename in files.scan(
+            ...         '(/usr/local/texlive/2014/texmf-dist/tex/latex/'
+            ...         'base/article.cls (12.5pt too wide)'):
+            ...     print(filename)
+            /usr/local/texlive/2014/texmf-dist/tex/latex/base/article.cls
+            >>> print(files.scan('(./Embedded Operating Systems.tex')[0])
+            ./Embedded Operating Systems.tex
+            >>> print(files.scan('(see the transcript) (thesis.aux)')[0])
+            thesis.aux
+            >>> len(files.stack)
+            2
+
+        """
+        opened = []
+        if '(' not in text and ')' not in text:
+            return opened
+        for parenthesis in PARENTHESES.finditer(text):
+            if parenthesis.group() == ')':
+                if self.stack and self.stack.pop() is not None:
+                    self.files.pop()
+                continue
+            name = FILE_NAME.match(text, parenthesis.end())
+            filename = name.group() if name else None
+            if filename:
+                self.files.append(filename)
+                opened.append(filename)
+            self.stack.append(filename)
+        return opened
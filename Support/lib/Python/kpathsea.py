@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+"""This module looks up files in the TeX distribution.
+
+The program ``kpsewhich`` searches the trees of the TeX distribution for
+files. Starting it once for every file we look for takes a lot of time in
+projects that include many files. A ``Resolver`` therefore first searches
+the databases of the TeX trees — the files called ``ls-R`` — itself. It
+looks up all the files it can not find this way with a single call of
+``kpsewhich`` and stores the results.
+
+The results stay valid as long as the databases of the TeX trees — the files
+called ``ls-R`` — and the search path ``TEXINPUTS`` do not change. We store
+the results on disk, so later commands can reuse them too.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from io import open
+from os import getcwd, getenv, makedirs
+from os.path import (basename, dirname, expanduser, getmtime, isdir, join,
+                     realpath)
+from pickle import dump, load
+from subprocess import Popen, PIPE
+from sys import stdout
+
+# -- Global Variables ---------------------------------------------------------
+
+# The location of the cache that stores the results of ``kpsewhich``
+CACHE_FILE = join(expanduser('~'), 'Library', 'Caches', 'TextMate',
+                  'latexkpsewhich')
+
+# The version of the cache. Increase this value whenever the stored
+# information changes, so we do not reuse caches of older versions.
+CACHE_VERSION = 3
+
+# The directories of a TeX tree that contain the files a program reads via
+# ``\\input`` or ``\\usepackage``. If a file exists in multiple of these
+# directories, then kpathsea uses the one in the first directory.
+TEX_DIRECTORIES = {
+    'latex': ('tex/latex/', 'tex/generic/', 'tex/'),
+    'pdflatex': ('tex/latex/', 'tex/generic/', 'tex/'),
+    'xelatex': ('tex/xelatex/', 'tex/latex/', 'tex/xetex/', 'tex/generic/',
+                'tex/'),
+    'lualatex': ('tex/lualatex/', 'tex/latex/', 'tex/luatex/',
+                 'tex/generic/', 'tex/')
+}
+
+# The directories of a TeX tree that contain files with certain extensions
+FORMAT_DIRECTORIES = {
+    '.bib': ('bibtex/bib/', ),
+    '.bst': ('bibtex/bst/', ),
+    '.ist': ('makeindex/', )
+}
+
+# The extensions of the files kpathsea searches in ``TEX_DIRECTORIES``
+TEX_EXTENSIONS = {'.cls', '.clo', '.def', '.fd', '.ltx', '.sty', '.tex'}
+
+# -- Functions ----------------------------------------------------------------
+
+
+def run_kpsewhich(arguments):
+    """Run ``kpsewhich`` with the given arguments.
+
+    Arguments:
+
+        arguments
+
+            A list containing the command line arguments of ``kpsewhich``.
+
+    Returns: ``[str]``
+
+        The lines ``kpsewhich`` printed or ``None`` if we could not run
+        ``kpsewhich`` at all.
+
+    """
+    stdout.flush()
+    try:
+        process = Popen(['kpsewhich'] + list(arguments),
+                        stdout=PIPE,
+                        universal_newlines=True)
+    except OSError:
+        return None
+    output = process.communicate()[0]
+    # ``kpsewhich`` returns the status 1 if it does not find one of the files
+    if process.returncode not in {0, 1}:
+        return None
+    return [line.strip() for line in output.splitlines() if line.strip()]
+
+
+def match_output(names, lines):
+    """Assign the lines printed by ``kpsewhich`` to the names we searched.
+
+    ``kpsewhich`` prints the locations of the files it finds in the order of
+    its arguments, but skips files it does not find. We therefore assign each
+    line to the next name it matches.
+
+    Arguments:
+
+        names
+
+            The names of the files we searched for.
+
+        lines
+
+            The output of ``kpsewhich``.
+
+    Returns: ``{str: str}``
+
+        A dictionary mapping every name to its location, or to ``None`` if
+        ``kpsewhich`` did not find the file.
+
+    Examples:
+
+        >>> locations = match_output(
+        ...     ['article.cls', 'missing.sty', 'book'],
+        ...     ['/texmf/tex/latex/base/article.cls',
+        ...      '/texmf/tex/latex/base/book.tex'])
+        >>> print(locations['book'])
+        /texmf/tex/latex/base/book.tex
+        >>> locations['missing.sty'] # Returns ``None``
+
+    """
+    locations = {}
+    lines = list(lines)
+    for name in names:
+        if lines and (lines[0] == name or lines[0].endswith('/' + name)
+                      or lines[0].endswith('/{}.tex'.format(name))):
+            locations[name] = lines.pop(0)
+        else:
+            locations[name] = None
+    return locations
+
+
+def read_database(filepath, index=None):
+    """Add the files listed in the ``ls-R`` database ``filepath`` to
+    ``index``.
+
+    A database lists the content of every directory of a TeX tree. Each
+    listing starts with the path of the directory followed by a colon.
+
+    Arguments:
+
+        filepath
+
+            The location of the database.
+
+        index
+
+            A dictionary mapping file names to a list of directories that
+            contain a file with this name. We use the same string object for
+            every occurrence of a directory.
+
+    Returns: ``{str: [str]}``
+
+        The updated index.
+
+    Examples:
+
+        >>> from tempfile import mkdtemp
+        >>> directory = mkdtemp()
+        >>> database = join(directory, 'ls-R')
+        >>> with open(database, 'w') as listing:
+        ...     _ = listing.write('% ls-R -- filename database for '
+        ...                       'kpathsea; do not change this line.\\n'
+        ...                       './:\\nls-R\\ntex\\n\\n'
+        ...                       './tex/latex/base:\\narticle.cls\\n'
+        ...                       'size10.clo\\n')
+        >>> index = read_database(database)
+        >>> print(index['article.cls'][0].replace(directory, 'texmf'))
+        texmf/tex/latex/base
+        >>> index['article.cls'][0] is index['size10.clo'][0]
+        True
+        >>> read_database('non_existent_file') # Returns ``{}``
+        {}
+
+    """
+    index = {} if index is None else index
+    root = dirname(filepath)
+    try:
+        with open(filepath, 'rb') as database:
+            content = database.read().decode('utf-8', 'replace')
+    except (IOError, OSError):
+        return index
+    # Store every directory only once
+    directories = {}
+    directory = root
+    for line in content.split('\n'):
+        line = line.rstrip('\r')
+        if not line or line.startswith('%'):
+            continue
+        if line.endswith(':'):
+            path = line[:-1].rstrip('/')
+            if path.startswith('./'):
+                path = join(root, path[2:])
+            elif path in {'', '.'}:
+                path = root
+            directory = directories.setdefault(path, path)
+        else:
+            index.setdefault(line, []).append(directory)
+    return index
+
+
+# -- Classes ------------------------------------------------------------------
+
+
+class Database(object):
+    """Search files in the ``ls-R`` databases of the TeX trees.
+
+    Examples:
+
+        >>> from tempfile import mkdtemp
+        >>> directory = mkdtemp()
+        >>> with open(join(directory, 'ls-R'), 'w') as listing:
+        ...     _ = listing.write('./tex/latex/base:\\narticle.cls\\n'
+        ...                       'ltxdoc.cls\\n\\n'
+        ...                       './tex/generic/babel:\\nbabel.sty\\n\\n'
+        ...                       './tex/plain/base:\\nltxdoc.cls\\n\\n'
+        ...                       './bibtex/bst/base:\\nplain.bst\\n')
+        >>> database = Database([join(directory, 'ls-R')])
+        >>> print(database.find('article.cls').replace(directory, 'texmf'))
+        texmf/tex/latex/base/article.cls
+        >>> print(database.find('ltxdoc.cls').replace(directory, 'texmf'))
+        texmf/tex/latex/base/ltxdoc.cls
+        >>> print(database.find('base/plain.bst', 'bibtex').replace(
+        ...     directory, 'texmf'))
+        texmf/bibtex/bst/base/plain.bst
+        >>> database.find('plain.bst', 'mpost') # Unknown program
+        >>> database.find('babel.sty', 'context') # Unknown program
+        >>> database.find('non_existent_file.tex') # Returns ``None``
+
+        Files in an earlier tree hide files of the same name in later trees
+
+        >>> local = mkdtemp()
+        >>> with open(join(local, 'ls-R'), 'w') as listing:
+        ...     _ = listing.write('./tex/generic/babel:\\nbabel.sty\\n')
+        >>> with open(join(directory, 'ls-R'), 'a') as listing:
+        ...     _ = listing.write('\\n./tex/latex/babel:\\nbabel.sty\\n')
+        >>> database = Database([join(local, 'ls-R'),
+        ...                      join(directory, 'ls-R')])
+        >>> print(database.find('babel.sty').replace(local, 'texmf-local'))
+        texmf-local/tex/generic/babel/babel.sty
+
+    """
+
+    def __init__(self, databases):
+        """Read the ``ls-R`` files at the locations ``databases``.
+
+        Arguments:
+
+            databases
+
+                The locations of the databases in the order kpathsea
+                searches them.
+
+        """
+        self.roots = [dirname(database) for database in databases]
+        self.index = {}
+        for database in databases:
+            read_database(database, self.index)
+
+    def directories(self, program, extension):
+        """Return the directories kpathsea searches for a file.
+
+        Returns: ``(str)``
+
+            The directories relative to the root of a TeX tree or ``None``
+            if we do not know where ``program`` searches for files with
+            the given extension.
+
+        """
+        if extension in FORMAT_DIRECTORIES and program in {'bibtex', 'biber'}:
+            return FORMAT_DIRECTORIES[extension]
+        if extension == '.ist' and program == 'makeindex':
+            return FORMAT_DIRECTORIES[extension]
+        if extension in TEX_EXTENSIONS:
+            return TEX_DIRECTORIES.get(program)
+        return None
+
+    def find(self, name, program='pdflatex'):
+        """Return the location of the file ``name``.
+
+        Arguments:
+
+            name
+
+                The name of the file, optionally prefixed with the name of
+                the directory containing the file.
+
+            program
+
+                The program that wants to read the file.
+
+        Returns: ``str``
+
+            The location of the file, or ``None`` if we can not tell where
+            ``kpsewhich`` would find the file.
+
+        """
+        if '.' not in basename(name):
+            name += '.tex'
+        filename = basename(name)
+        subdirectory = dirname(name)
+        directories = self.directories(program,
+                                       '.' + filename.rsplit('.', 1)[-1])
+        candidates = self.index.get(filename)
+        if not directories or not candidates:
+            return None
+        # Like kpathsea, search every subdirectory of a tree before the
+        # next tree
+        for root in self.roots:
+            for prefix in directories:
+                matches = [
+                    directory for directory in candidates
+                    if directory.startswith(root + '/') and
+                    (directory[len(root) + 1:] + '/').startswith(prefix) and
+                    (not subdirectory or
+                     directory.endswith('/' + subdirectory))
+                ]
+                if len(matches) == 1:
+                    return join(matches[0], filename)
+                if matches:
+                    # We do not know which file kpathsea would use
+                    return None
+        return None
+
+    def files(self, root, extensions):
+        """Return the files below ``root`` with one of the ``extensions``.
+
+        Returns: ``[str]``
+
+        """
+        root = root.rstrip('/') + '/'
+        return [
+            join(directory, name)
+            for name, directories in self.index.items()
+            if name.endswith(tuple(extensions))
+            for directory in directories if directory.startswith(root)
+        ]
+
+
+class Resolver(object):
+    """Look up files in the TeX distribution and remember the results.
+
+    Examples:
+
+        >>> from tempfile import mkdtemp
+        >>> cache_file = join(mkdtemp(), 'cache')
+        >>> resolver = Resolver(cache_file)
+        >>> resolver.lookup(['non_existent_file.tex'])
+        ... # doctest:+ELLIPSIS
+        {...'non_existent_file.tex': None}
+        >>> resolver.lookup([])
+        {}
+
+        We only remember missing files until the resolver goes away, since
+        the user might install them any time
+
+        >>> Resolver(cache_file).entries
+        {}
+
+    """
+
+    def __init__(self, cache_file=CACHE_FILE):
+        """Load the results stored in ``cache_file``.
+
+        Arguments:
+
+            cache_file
+
+                The location of the cache.
+
+        """
+        self.cache_file = cache_file
+        self.databases = None
+        self.home = None
+        self.signature = None
+        self.entries = {}
+        self.misses = {}
+        self.checked = False
+        self.database = None
+        try:
+            with open(cache_file, 'rb') as storage:
+                version, databases, home, signature, entries = load(storage)
+            if version == CACHE_VERSION:
+                self.databases = databases
+                self.home = home
+                self.signature = signature
+                self.entries = entries
+        except (IOError, OSError, ValueError, EOFError, TypeError):
+            pass
+
+    def current_signature(self):
+        """Return the modification times of the databases of the TeX trees.
+
+        Returns: ``[(str, float)]``
+
+            A list of tuples containing the location of a database and its
+            modification time, or ``None`` if a database does not exist any
+            more.
+
+        """
+        try:
+            return [(database, getmtime(database))
+                    for database in self.databases]
+        except (IOError, OSError):
+            return None
+
+    def validate(self):
+        """Forget all results if one of the databases changed.
+
+        We only check the databases once for every ``Resolver``, since they
+        do not change while a command of the bundle runs.
+
+        """
+        if self.checked:
+            return
+        self.checked = True
+        signature = (self.current_signature()
+                     if self.databases is not None else None)
+        if signature is None or signature != self.signature:
+            self.databases = run_kpsewhich(['-all', 'ls-R']) or []
+            self.home = (run_kpsewhich(['-var-value=TEXMFHOME']) or [None])[0]
+            self.signature = self.current_signature()
+            self.entries = {}
+            self.misses = {}
+
+    def search_database(self, names, program):
+        """Search the files ``names`` in the databases of the TeX trees.
+
+        Trees without a database, like the personal tree ``TEXMFHOME``, and
+        additional directories in ``TEXINPUTS`` might contain files that
+        take precedence over the files in the databases. In this case we
+        leave the search to ``kpsewhich``.
+
+        Returns: ``{str: str}``
+
+            A dictionary mapping the names we found to their location.
+
+        """
+        if self.home and isdir(expanduser(self.home)):
+            return {}
+        if any(directory not in {'', '.'}
+               for directory in getenv('TEXINPUTS', '').split(':')):
+            return {}
+        if self.database is None:
+            self.database = Database(self.databases)
+        locations = {}
+        for name in names:
+            location = self.database.find(name, program)
+            if location:
+                locations[name] = location
+        return locations
+
+    def lookup(self, names, program='pdflatex'):
+        """Return the locations of the files ``names``.
+
+        Arguments:
+
+            names
+
+                The names of the files we search for.
+
+            program
+
+                The name of the program that wants to read the files.
+                ``kpsewhich`` uses this value to determine the search paths.
+
+        Returns: ``{str: str}``
+
+            A dictionary mapping every name to its location, or to ``None``
+            if the file does not exist in the TeX distribution.
+
+        """
+        names = list(names)
+        if not names:
+            return {}
+        self.validate()
+        # Relative directories in ``TEXINPUTS`` depend on the current
+        # directory
+        key = (program, getenv('TEXINPUTS', ''), realpath(getcwd()))
+        entries = self.entries.setdefault(key, {})
+        misses = self.misses.setdefault(key, set())
+        known = len(entries)
+        pending = [name for name in names
+                   if name not in entries and name not in misses]
+        if pending:
+            entries.update(self.search_database(pending, program))
+            pending = [name for name in pending if name not in entries]
+        if pending:
+            lines = run_kpsewhich(['-progname={}'.format(program)] + pending)
+            if lines is not None:
+                for name, location in match_output(pending, lines).items():
+                    if location:
+                        entries[name] = location
+                    else:
+                        misses.add(name)
+        if len(entries) > known:
+            self.save()
+        # If we could not run `kpsewhich`, then some names are still unknown
+        return {name: entries.get(name) for name in names}
+
+    def save(self):
+        """Store the results in the cache file."""
+        try:
+            if not isdir(dirname(self.cache_file)):
+                makedirs(dirname(self.cache_file))
+            with open(self.cache_file, 'wb') as storage:
+                dump((CACHE_VERSION, self.databases, self.home,
+                      self.signature, self.entries),
+                     storage,
+                     protocol=2)
+        except (IOError, OSError):
+            pass
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""This module contains a memory mapped reader for (large) TeX log files.
+
+The parsers in ``parsing.py`` usually read a log one line at a time from a
+stream, decode every line and join lines TeX wrapped after 79 characters.
+``MappedLog`` maps the whole log file into memory instead. It detects wrapped
+lines on the raw bytes and only decodes a statement if the caller is
+actually interested in it.
+
+Both readers use a ``Decoder`` to turn bytes into text. The decoder picks a
+single encoding for the whole log and only falls back to the other encodings
+of ``tex.encodings`` for the parts of the log it can not decode.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from codecs import getincrementaldecoder
+from io import open
+from mmap import mmap, ACCESS_READ
+from re import compile
+
+from tex import encodings
+
+# -- Global Variables ---------------------------------------------------------
+
+# TeX does not wrap lines that end with one of these characters
+LINE_ENDINGS = {b'!', b'.', b')'}
+
+# Match bytes outside of the ASCII range
+NON_ASCII = compile(b'[\x80-\xff]')
+
+# The number of bytes at the start of a mapped log we use to detect its
+# encoding
+SAMPLE_SIZE = 1 << 16
+
+# -- Functions ----------------------------------------------------------------
+
+
+def decode(data):
+    """Decode ``data`` using the first fitting encoding of ``tex.encodings``.
+
+    Arguments:
+
+        data
+
+            A byte string read from a log file.
+
+    Returns: ``str``
+
+    Examples:
+
+        >>> print(decode('Grüße'.encode('utf-8')))
+        Grüße
+        >>> print(decode('Grüße'.encode('mac_roman')))
+        Grüße
+
+    """
+    for encoding in encodings:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+
+
+def is_wrapped(line):
+    """Check if TeX continued the statement in ``line`` on the next line.
+
+    TeX breaks lines after 79 characters. If the line does not end with one
+    of the characters in ``LINE_ENDINGS``, then we assume that the next line
+    belongs to the same statement. We only decode ``line`` if it contains
+    characters outside of the ASCII range.
+
+    Arguments:
+
+        line
+
+            A line read from a log file, including the trailing newline.
+
+    Returns: ``bool``
+
+    Examples:
+
+        >>> is_wrapped(b'a' * 79 + b'\\n')
+        True
+        >>> is_wrapped(b'a' * 78 + b'.\\n')
+        False
+        >>> is_wrapped(b'a' * 70 + b'\\n')
+        False
+        >>> is_wrapped('ä'.encode('utf-8') * 79 + b'\\n')
+        True
+
+    """
+    if len(line) < 80:
+        return False
+    if not NON_ASCII.search(line):
+        return len(line) == 80 and line[78:79] not in LINE_ENDINGS
+    text = decode(line)
+    return len(text) == 80 and text[78] not in {'!', '.', ')'}
+
+
+# -- Classes ------------------------------------------------------------------
+
+
+class Decoder(object):
+    """Decode the data of a log using a single encoding.
+
+    The decoder picks the encoding as soon as it sees data containing
+    non-ASCII characters: Either a sample passed to ``detect`` or the first
+    piece of data passed to ``decode``. If the chosen encoding can not
+    decode some data, then we decode only this data using the first fitting
+    encoding of ``tex.encodings``.
+
+    Attributes:
+
+        encoding
+
+            The encoding used for the log or ``None`` if the decoder did not
+            see any non-ASCII characters yet.
+
+        fallbacks
+
+            The number of times the decoder could not use ``encoding``.
+
+    Examples:
+
+        >>> decoder = Decoder()
+        >>> print(decoder.decode(b'This is pdfTeX'))
+        This is pdfTeX
+        >>> print(decoder.encoding)
+        None
+        >>> print(decoder.decode('Grüße'.encode('mac_roman')))
+        Grüße
+        >>> print(decoder.encoding)
+        mac_roman
+        >>> print(decoder.decode('Grüße'.encode('utf-8')))
+        Gr√º√üe
+        >>> decoder.fallbacks
+        0
+
+    """
+
+    def __init__(self):
+        self.encoding = None
+        self.fallbacks = 0
+
+    def detect(self, sample):
+        """Pick the encoding for the log using ``sample``.
+
+        The sample may end with an incomplete character.
+
+        Arguments:
+
+            sample
+
+                A byte string containing data of the log.
+
+        Examples:
+
+            >>> decoder = Decoder()
+            >>> decoder.detect('Größe'.encode('utf-8')[:-2])
+            >>> print(decoder.encoding)
+            utf_8
+
+        """
+        if self.encoding is not None or not NON_ASCII.search(sample):
+            return
+        for encoding in encodings:
+            try:
+                getincrementaldecoder(encoding)().decode(sample)
+            except UnicodeDecodeError:
+                continue
+            self.encoding = encoding
+            return
+
+    def decode(self, data):
+        """Decode ``data``.
+
+        Arguments:
+
+            data
+
+                A byte string read from the log.
+
+        Returns: ``str``
+
+        """
+        if self.encoding is None:
+            self.detect(data)
+            if self.encoding is None:
+                return data.decode('ascii')
+        try:
+            return data.decode(self.encoding)
+        except UnicodeDecodeError:
+            self.fallbacks += 1
+            return decode(data)
+
+
+class MappedLog(object):
+    """Read a log file via a memory map.
+
+    The class provides the part of the file interface the parser classes use:
+    ``readline`` returns the next (decoded) line, while ``seek``, ``tell``
+    and ``seekable`` work with byte offsets. Since there is no separate
+    buffer, the attribute ``buffer`` returns the object itself.
+
+    Examples:
+
+        >>> with MappedLog('Tests/Log/latexmk_makeindex.log') as log:
+        ...     print(log.readline().strip())
+        ...     offset = log.tell()
+        ...     statement = log.read_statement()
+        ...     log.seek(offset)
+        ...     statement == log.read_statement()
+        Latexmk: This is Latexmk, John Collins, 10 Nov 2013, version: 4.39.
+        True
+
+    """
+
+    def __init__(self, filepath, end=None):
+        """Map the file at ``filepath`` into memory.
+
+        Arguments:
+
+            filepath
+
+                The location of the log file.
+
+            end
+
+                The byte offset where the log ends for the reader. If this
+                value is ``None``, then we read the whole file.
+
+        """
+        with open(filepath, 'rb') as log:
+            try:
+                self.data = mmap(log.fileno(), 0, access=ACCESS_READ)
+            except ValueError:
+                # We can not map empty files
+                self.data = b''
+        self.end = len(self.data) if end is None else min(end, len(self.data))
+        self.position = 0
+        self.decoder = Decoder()
+        self.decoder.detect(self.data[:SAMPLE_SIZE])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    @property
+    def buffer(self):
+        """Return the byte level interface of the log, i.e. the log itself."""
+        return self
+
+    def close(self):
+        """Release the memory map."""
+        if self.data:
+            self.data.close()
+            self.data = b''
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset):
+        self.position = offset
+
+    def tell(self):
+        return self.position
+
+    def read_raw_line(self):
+        """Return the next line as byte string, including the newline.
+
+        Returns: ``bytes``
+
+        """
+        start = self.position
+        self.position = self.data.find(b'\n', start, self.end) + 1 or self.end
+        return self.data[start:self.position]
+
+    def readline(self):
+        """Return the next line, including the newline.
+
+        Returns: ``str``
+
+        """
+        return self.decoder.decode(self.read_raw_line())
+
+    def read_statement(self, prefilter=None):
+        """Return the next statement, joining lines wrapped by TeX.
+
+        If ``prefilter`` is not ``None``, then we skip all statements that do
+        not contain a match for this compiled byte pattern without decoding
+        them. At the end of the log this method returns the empty string.
+
+        Arguments:
+
+            prefilter
+
+                A regular expression for byte strings or ``None``.
+
+        Returns: ``str``
+
+        Examples:
+
+            >>> from re import compile
+            >>> with MappedLog('Tests/Log/latexmk_makeindex.log') as log:
+            ...     print(log.read_statement(compile(b'Run number')).strip())
+            Run number 1 of rule 'pdflatex'
+
+        """
+        data = self.data
+        end = self.end
+        while True:
+            pieces = []
+            while self.position < end:
+                start = self.position
+                self.position = data.find(b'\n', start, end) + 1 or end
+                line = data[start:self.position]
+                pieces.append(line.rstrip(b'\n'))
+                if len(line) < 80 or not is_wrapped(line):
+                    pieces.append(b'\n')
+                    break
+            statement = b''.join(pieces)
+            if not statement:
+                return ''
+            if prefilter is None or prefilter.search(statement):
+                return self.decoder.decode(statement)
@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+"""This module decides if we can skip a bibliography or index run.
+
+The output of bibtex, biber, makeindex and makeglossaries only changes if
+their input changes. The functions of this module collect the parts of the
+input that matter for one of these programs and turn them into a hash. A
+``Manifest`` stores this hash together with the result of the last
+successful run of the program. If the hash did not change since then, we can
+reuse the result instead of running the program again.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from hashlib import sha1
+from io import open
+from glob import glob
+from os.path import dirname, exists, join, splitext
+from pickle import dump, load
+from re import compile, MULTILINE
+
+from tex import expand_names
+
+# -- Global Variables ---------------------------------------------------------
+
+# Match the lines of an auxiliary file bibtex reads
+BIBTEX_COMMAND = compile(
+    br'^\\(citation|bibdata|bibstyle|@input)\{(.*)\}\s*$', MULTILINE)
+
+# Match the data sources listed in a control file of biber
+BIBER_SOURCE = compile(br'<bcf:datasource[^>]*>\s*(.*?)\s*</bcf:datasource>')
+
+# Match the lines of an auxiliary file the glossaries package writes for
+# makeglossaries
+GLOSSARY_COMMAND = compile(
+    br'^\\@(newglossary|istfilename|glsorder|xdylanguage|gls@codepage)'
+    br'(\{.*)$', MULTILINE)
+
+# Match the arguments of a TeX command
+ARGUMENT = compile(br'\{([^}]*)\}')
+
+# The extensions of the files LaTeX writes in one pass and reads in the next
+FINGERPRINT_SUFFIXES = ('aux', 'toc', 'lof', 'lot', 'out', 'bbl', 'ind')
+
+# -- Functions ----------------------------------------------------------------
+
+
+def read(filepath):
+    """Return the content of ``filepath`` or ``None`` if it does not exist.
+
+    Returns: ``bytes``
+
+    """
+    try:
+        with open(filepath, 'rb') as source:
+            return source.read()
+    except (IOError, OSError):
+        return None
+
+
+def hash_parts(parts):
+    """Return a hash for the byte strings in ``parts``.
+
+    Returns: ``str``
+
+        The hash or ``None`` if ``parts`` is ``None``.
+
+    Examples:
+
+        >>> hash_parts([b'ab', b'c']) == hash_parts([b'a', b'bc'])
+        False
+        >>> hash_parts(None) # Returns ``None``
+
+    """
+    if parts is None:
+        return None
+    checksum = sha1()
+    for part in parts:
+        checksum.update('{}:'.format(len(part)).encode('ascii'))
+        checksum.update(part)
+    return checksum.hexdigest()
+
+
+def external_files(names, suffix, program):
+    """Return the names and the content of the files in ``names``.
+
+    We look for files we do not find in the current directory in the TeX
+    distribution, all at once. If we do not find a file there either, then
+    we only use its name. The program will then report the missing file
+    anyway.
+
+    Returns: ``[bytes]``
+
+    """
+    filenames = []
+    for name in names:
+        name = name.decode('utf-8', 'replace').strip()
+        if name:
+            filenames.append(name if name.endswith(suffix) else name + suffix)
+    filepaths = expand_names(filenames, program)
+    parts = []
+    for filename in filenames:
+        parts.append(filename.encode('utf-8'))
+        parts.append(read(filepaths[filename]) or b'')
+    return parts
+
+
+def bibtex_hash(auxfiles):
+    """Return a hash of the input bibtex reads for ``auxfiles``.
+
+    The hash covers the citations, the bibliography style and the
+    bibliography databases of each auxiliary file, including the auxiliary
+    files it includes via ``\\@input``. Other changes of an auxiliary file,
+    like new page numbers, do not matter to bibtex.
+
+    Arguments:
+
+        auxfiles
+
+            The locations of the auxiliary files we run bibtex for.
+
+    Returns: ``str``
+
+        The hash or ``None`` if we have to run bibtex anyway, e.g. since
+        there is no bibliography for one of the auxiliary files yet.
+
+    Examples:
+
+        >>> from os import chdir, getcwd
+        >>> from shutil import rmtree
+        >>> from tempfile import mkdtemp
+        >>> directory = getcwd()
+        >>> chdir(mkdtemp())
+        >>> def write(filename, content):
+        ...     with open(filename, 'w') as output:
+        ...         _ = output.write(content)
+
+        >>> write('thesis.aux', '\\\\bibstyle{style}\\n'
+        ...       '\\\\@input{intro.aux}\\n\\\\bibdata{references}\\n')
+        >>> write('intro.aux', '\\\\citation{Knuth}\\n'
+        ...       '\\\\newlabel{sec}{{1}{1}}\\n')
+        >>> write('references.bib', '@book{Knuth, title={The TeXbook}}')
+        >>> write('style.bst', 'ENTRY { title } { } { label }')
+        >>> bibtex_hash(['thesis.aux']) # There is no bibliography yet
+        >>> write('thesis.bbl', '')
+        >>> checksum = bibtex_hash(['thesis.aux'])
+
+        Labels do not matter to bibtex, citations and databases do
+
+        >>> write('intro.aux', '\\\\citation{Knuth}\\n'
+        ...       '\\\\newlabel{sec}{{2}{3}}\\n')
+        >>> bibtex_hash(['thesis.aux']) == checksum
+        True
+        >>> write('references.bib', '@book{Knuth, title={TeX}}')
+        >>> bibtex_hash(['thesis.aux']) == checksum
+        False
+
+        >>> rmtree(getcwd())
+        >>> chdir(directory)
+
+    """
+    parts = []
+    for auxfile in auxfiles:
+        if not exists('{}.bbl'.format(splitext(auxfile)[0])):
+            return None
+        pending, seen = [auxfile], set()
+        while pending:
+            filepath = pending.pop(0)
+            if filepath in seen:
+                continue
+            seen.add(filepath)
+            content = read(filepath)
+            if content is None:
+                return None
+            for command in BIBTEX_COMMAND.finditer(content):
+                name, argument = command.groups()
+                parts.append(command.group())
+                if name == b'@input':
+                    pending.append(argument.decode('utf-8', 'replace'))
+                elif name == b'bibdata':
+                    parts.extend(
+                        external_files(argument.split(b','), '.bib',
+                                       'bibtex'))
+                elif name == b'bibstyle':
+                    parts.extend(external_files([argument], '.bst', 'bibtex'))
+    return hash_parts(parts)
+
+
+def biber_hash(name):
+    """Return a hash of the input biber reads for the document ``name``.
+
+    The hash covers the control file ``name.bcf`` and the data sources it
+    lists. The interface of this function is the same as the one of
+    ``bibtex_hash``.
+
+    Returns: ``str``
+
+    """
+    content = read('{}.bcf'.format(name))
+    if content is None or not exists('{}.bbl'.format(name)):
+        return None
+    return hash_parts([content] + external_files(
+        BIBER_SOURCE.findall(content), '.bib', 'biber'))
+
+
+def makeindex_style(filename):
+    """Return the style file makeindex uses for the tex file ``filename``.
+
+    A style file next to the tex file with the same name, e.g.
+    ``thesis.ist`` for ``thesis.tex``, customizes the index of the document.
+
+    Returns: ``str``
+
+        The name of the style file or ``None`` if makeindex uses its default
+        style.
+
+    Examples:
+
+        >>> makeindex_style('non_existent_file.tex') # Returns ``None``
+
+    """
+    style = '{}.ist'.format(splitext(filename)[0])
+    return style if exists(style) else None
+
+
+def makeindex_hash(filename, style=None):
+    """Return a hash of the input makeindex reads for the file ``filename``.
+
+    The hash covers the index entries and the style file of the index.
+
+    Arguments:
+
+        filename
+
+            The name of the tex file that contains the index.
+
+        style
+
+            The name of the style file makeindex reads via the option ``-s``.
+            If this value is ``None``, then we use the style file
+            ``makeindex_style`` returns.
+
+    Returns: ``str``
+
+        The hash or ``None`` if there is no index yet.
+
+    Examples:
+
+        >>> from os import chdir, getcwd
+        >>> from shutil import rmtree
+        >>> from tempfile import mkdtemp
+        >>> directory = getcwd()
+        >>> chdir(mkdtemp())
+        >>> def write(filename, content):
+        ...     with open(filename, 'w') as output:
+        ...         _ = output.write(content)
+
+        >>> write('thesis.idx', '\\\\indexentry{TeX}{1}\\n')
+        >>> makeindex_hash('thesis.tex') # There is no index yet
+        >>> write('thesis.ind', '')
+        >>> checksum = makeindex_hash('thesis.tex')
+
+        The style of the index matters to makeindex
+
+        >>> write('thesis.ist', 'headings_flag 1\\n')
+        >>> makeindex_hash('thesis.tex') == checksum
+        False
+        >>> write('fancy.ist', 'headings_flag 0\\n')
+        >>> makeindex_hash('thesis.tex', 'fancy') == makeindex_hash(
+        ...     'thesis.tex', 'fancy.ist')
+        True
+        >>> makeindex_hash('thesis.tex', 'fancy') == makeindex_hash(
+        ...     'thesis.tex')
+        False
+
+        >>> rmtree(getcwd())
+        >>> chdir(directory)
+
+    """
+    name = splitext(filename)[0]
+    content = read('{}.idx'.format(name))
+    if content is None or not exists('{}.ind'.format(name)):
+        return None
+    style = style if style else makeindex_style(filename)
+    return hash_parts([content] + (external_files(
+        [style.encode('utf-8')], '.ist', 'makeindex') if style else []))
+
+
+def makeglossaries_hash(filename):
+    """Return a hash of the glossary entries of the tex file ``filename``.
+
+    The auxiliary file of ``filename`` lists the glossaries of the document
+    together with the extensions of their input and output files, and the
+    style file makeglossaries uses.
+
+    Returns: ``str``
+
+        The hash or ``None`` if one of the glossaries does not exist yet.
+
+    Examples:
+
+        >>> makeglossaries_hash('non_existent_file.tex') # Returns ``None``
+
+    """
+    name = splitext(filename)[0]
+    content = read('{}.aux'.format(name))
+    if content is None:
+        return None
+    parts = []
+    for command in GLOSSARY_COMMAND.finditer(content):
+        parts.append(command.group())
+        arguments = ARGUMENT.findall(command.group(2))
+        if command.group(1) == b'newglossary' and len(arguments) == 4:
+            _, _, output, source = [
+                argument.decode('utf-8', 'replace') for argument in arguments
+            ]
+            if not exists('{}.{}'.format(name, output)):
+                return None
+            parts.append(read('{}.{}'.format(name, source)) or b'')
+        elif command.group(1) == b'istfilename' and arguments:
+            parts.append(read(arguments[0].decode('utf-8', 'replace')) or b'')
+    return hash_parts(parts) if parts else None
+
+
+def fingerprint(name, suffixes=FINGERPRINT_SUFFIXES):
+    """Return hashes of the files LaTeX exchanges between passes.
+
+    If the fingerprint after a pass of LaTeX is the same as the one before
+    it, then another pass will not change the document any more.
+
+    Arguments:
+
+        name
+
+            The name of the tex file without its extension.
+
+        suffixes
+
+            The extensions of the files we fingerprint.
+
+    Returns: ``{str: str}``
+
+        A dictionary mapping each extension to the hash of the file or
+        ``None`` if the file does not exist.
+
+    Examples:
+
+        >>> hashes = fingerprint('non_existent_file', ('aux', 'toc'))
+        >>> sorted(hashes) == ['aux', 'toc']
+        True
+        >>> hashes['aux'] # Returns ``None``
+
+    """
+    return {
+        suffix: hash_parts(None if content is None else [content])
+        for suffix, content in ((suffix, read('{}.{}'.format(name, suffix)))
+                                for suffix in suffixes)
+    }
+
+
+def uses_bibtex(name):
+    """Check if bibtex has to process the auxiliary files of ``name``.
+
+    This is the case if the auxiliary file of the document or one of the
+    auxiliary files of ``bibunits`` contains a bibliography database.
+
+    Returns: ``bool``
+
+    Examples:
+
+        >>> uses_bibtex('non_existent_file')
+        False
+
+    """
+    auxfiles = (['{}.aux'.format(name)] +
+                glob(join(dirname(name), 'bu[0-9]*.aux')))
+    return any(b'\\bibdata{' in (read(auxfile) or b'')
+               for auxfile in auxfiles)
+
+
+# -- Classes ------------------------------------------------------------------
+
+
+class Manifest(object):
+    """Store the hashes and results of successful runs of a program.
+
+    Examples:
+
+        >>> from os import remove
+        >>> manifest = Manifest('.test.lbm')
+        >>> manifest.lookup('makeindex', '2f1a') # Returns ``None``
+        >>> manifest.update('makeindex', '2f1a', (0, False, 0, 1))
+        >>> Manifest('.test.lbm').lookup('makeindex', '2f1a')
+        (0, False, 0, 1)
+        >>> Manifest('.test.lbm').lookup('makeindex', '9c3e') # Changed input
+        >>> remove('.test.lbm')
+
+    """
+
+    def __init__(self, filepath):
+        """Load the manifest stored at ``filepath``.
+
+        Arguments:
+
+            filepath
+
+                The location of the manifest. We usually store it next to
+                the cache file of the project.
+
+        """
+        self.filepath = filepath
+        try:
+            with open(filepath, 'rb') as storage:
+                self.entries = load(storage)
+        except (IOError, OSError, ValueError, EOFError):
+            self.entries = {}
+
+    def lookup(self, stage, checksum):
+        """Return the result of the last run of ``stage`` for ``checksum``.
+
+        Returns: ``(int, bool, int, int)``
+
+            The result or ``None`` if the input of ``stage`` changed.
+
+        """
+        if checksum is None:
+            return None
+        stored_checksum, result = self.entries.get(stage, (None, None))
+        return result if stored_checksum == checksum else None
+
+    def update(self, stage, checksum, result):
+        """Store ``result`` as result of ``stage`` for ``checksum``.
+
+        We only store results of successful runs, so a failed run is always
+        repeated.
+
+        """
+        status, fatal, _, _ = result
+        if checksum is None or status or fatal:
+            self.entries.pop(stage, None)
+        else:
+            self.entries[stage] = (checksum, tuple(result))
+        try:
+            with open(self.filepath, 'wb') as storage:
+                dump(self.entries, storage, protocol=2)
+        except (IOError, OSError):
+            print('<p class="warning"> Could not write manifest file {}!'
+                  '</p>'.format(self.filepath))
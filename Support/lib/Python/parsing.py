@@ -15,64 +15,233 @@ from os import sys, path
 
 sys.path.insert(1, path.dirname(path.abspath(__file__)))
 
-from re import compile, match, search, UNICODE
-from os import getcwd
-from os.path import basename, join, splitext
-from sys import stdout, version_info
+from re import compile, error, escape, match, search, IGNORECASE, UNICODE
 try:
-    from urllib.parse import quote  # Python 3
+    from re import _constants as sre_constants  # Python 3.11+
+    from re import _parser as sre_parse
 except ImportError:
-    from urllib import quote  # Python 2
+    import sre_constants
+    import sre_parse
+from os import getcwd
+from os.path import basename, join, normpath, splitext
+from sys import version_info
 
-from tex import encodings
+from events import Event, EventList, HTMLRenderer, make_link  # noqa
+from filestack import FileStack
+from logreader import Decoder, MappedLog, is_wrapped
 
 # -- Module Import ------------------------------------------------------------
 
 PYTHON2 = version_info <= (3, 0)
 
+# -- Global Variables ---------------------------------------------------------
+
+# Dispatchers for the pattern tables of the parser classes. The keys of this
+# dictionary are the sources and flags of the patterns in the table.
+dispatchers = {}
+
 # -- Functions ----------------------------------------------------------------
 
 
-def make_link(file, line=1):
-    """Create a TextMate link for ``file`` pointing to ``line``.
+def required_literal(regex):
+    """Return the longest literal string every match of ``regex`` contains.
+
+    This function only looks at literals on the top level of the pattern and
+    inside (non-optional) groups. If there is no such literal, or we can not
+    analyze the pattern, then the function returns ``None``.
 
     Arguments:
 
-        file
+        regex
 
-            The path to the file that should be opened if we click the link
-            generated by this function.
+            A compiled regular expression.
 
-        line
+    Returns: ``str``
 
-            The line which should be displayed when TextMate opens ``file``.
+    Examples:
 
-    Returns: ``str``
+        >>> print(required_literal(compile('LaTeX Warning:.*')))
+        LaTeX Warning:
+        >>> print(required_literal(compile(r'([^:]*):(\\d+): LaTeX Error:')))
+        : LaTeX Error:
+        >>> print(required_literal(compile('(a|b)+')))
+        None
+
+    """
+    if regex.flags & IGNORECASE:
+        return None
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+
+    def literals(items):
+        run = ''
+        for opcode, argument in items:
+            if opcode == sre_constants.LITERAL:
+                run += '{:c}'.format(argument)
+                continue
+            yield run
+            run = ''
+            if opcode == sre_constants.SUBPATTERN:
+                # The last item of the argument always contains the items of
+                # the group.
+                for literal in literals(argument[-1]):
+                    yield literal
+        yield run
+
+    longest = max(literals(parsed), key=len)
+    return longest if longest else None
+
+
+def get_dispatcher(regexes, combine=True):
+    """Return a (cached) ``PatternDispatcher`` for a list of regexes.
+
+    Since all instances of a parser class use the same pattern table, we only
+    compile the combined regular expression once per process.
+
+    Arguments:
+
+        regexes
+
+            A list of compiled regular expressions.
+
+        combine
+
+            Specifies if the dispatcher should match all patterns in a single
+            pass (``True``) or try one pattern after another (``False``).
+
+    Returns: ``PatternDispatcher``
 
     Examples:
 
-        >>> print(make_link('Tests/TeX/makeindex.tex', 1))
-        txmt://open/?url=file://Tests/TeX/makeindex.tex&line=1
-        >>> print(make_link('Wide Open Spaces.txt', 20))
-        txmt://open/?url=file://Wide%20Open%20Spaces.txt&line=20
+        >>> regexes = [compile('Warning'), compile('Error')]
+        >>> get_dispatcher(regexes) is get_dispatcher(list(regexes))
+        True
 
     """
-    return "txmt://open/?url=file://{}&line={}".format(
-        quote(file.encode('utf-8')), line)
+    key = (combine, tuple((regex.pattern, regex.flags) for regex in regexes))
+    dispatcher = dispatchers.get(key)
+    if dispatcher is None:
+        dispatcher = dispatchers[key] = PatternDispatcher(regexes, combine)
+    return dispatcher
 
 
 # -- Classes ------------------------------------------------------------------
 
 
+class PatternDispatcher(object):
+    """Find the first pattern of an ordered pattern table matching a line.
+
+    The dispatcher joins all patterns into a single alternation of named
+    groups. Since the regex engine tries the alternatives from left to right,
+    the winning group is always the first pattern of the table that matches.
+    A search for literals that every pattern requires rejects most lines
+    before we even try the alternation.
+
+    """
+
+    def __init__(self, regexes, combine=True):
+        """Initialize a new dispatcher for the list ``regexes``.
+
+        If the patterns can not be combined (e.g. because they use different
+        flags), then the dispatcher falls back to matching the patterns one
+        after another.
+
+        Examples:
+
+            >>> dispatcher = PatternDispatcher([compile('Warning'),
+            ...                                 compile('(.*)Error')])
+            >>> dispatcher.combined is None
+            False
+            >>> print(dispatcher.prefilter.pattern)
+            Warning|Error
+            >>> dispatcher.byte_prefilter.search(b'Error') is None
+            False
+
+        """
+        self.regexes = regexes
+        self.combined = None
+        self.prefilter = None
+        self.byte_prefilter = None
+
+        flags = {regex.flags for regex in regexes}
+        if not combine or len(flags) != 1:
+            return
+
+        flags = flags.pop()
+        try:
+            self.combined = compile(
+                '|'.join('(?P<pattern{}>{})'.format(index, regex.pattern)
+                         for index, regex in enumerate(regexes)), flags)
+        except (error, AssertionError, OverflowError):
+            # Python 2 only supports 100 named groups
+            return
+
+        literals = [required_literal(regex) for regex in regexes]
+        if all(literals):
+            literals = sorted(set(literals), key=len, reverse=True)
+            self.prefilter = compile(
+                '|'.join(escape(literal) for literal in literals), flags)
+            # All encodings in ``tex.encodings`` store ASCII characters as
+            # single bytes. We can therefore search for ASCII literals
+            # before we decode a line.
+            if all(ord(character) < 128 for character in ''.join(literals)):
+                self.byte_prefilter = compile(b'|'.join(
+                    escape(literal.encode('ascii')) for literal in literals))
+
+    def match(self, line):
+        """Return the index and match for the first pattern matching ``line``.
+
+        If no pattern matches, then this method returns ``(None, None)``.
+
+        Returns: ``(int, Match)``
+
+        Examples:
+
+            >>> dispatcher = PatternDispatcher([compile('Warning'),
+            ...                                 compile('(.*)Error'),
+            ...                                 compile('(.*)')])
+            >>> index, matching = dispatcher.match('Error in line 1')
+            >>> index
+            1
+            >>> len(matching.group(1))
+            0
+            >>> dispatcher.match('Nothing to see')[0]
+            2
+
+        """
+        if self.combined is None:
+            for index, regex in enumerate(self.regexes):
+                matching = regex.match(line)
+                if matching:
+                    return index, matching
+            return None, None
+
+        if self.prefilter is not None and not self.prefilter.search(line):
+            return None, None
+        matching = self.combined.match(line)
+        if not matching:
+            return None, None
+        index = int(matching.lastgroup[len('pattern'):])
+        # Match again to get the group numbers the handlers expect
+        return index, self.regexes[index].match(line)
+
+
 class TexParser(object):
     """Parse TeX typesetting streams.
 
-    This class reads output from a tex program and tries to convert this
-    information into HTML.
+    This class reads output from a tex program and turns the information into
+    ``Event`` records (see ``events.py``). By default the parser renders these
+    events as HTML.
 
     """
 
-    def __init__(self, input_stream, verbose):
+    # Match all patterns of the table in a single pass. Setting this value to
+    # ``False`` tries one pattern after another instead.
+    combine_patterns = True
+
+    def __init__(self, input_stream, verbose, sink=None):
         """Initialize a new TexParser.
 
         Arguments:
@@ -88,6 +257,13 @@ class TexParser(object):
                 only messages about important events should produce output by
                 this class.
 
+            sink
+
+                The object that receives the events produced by the parser.
+                It has to provide the methods ``emit(event)`` and ``flush()``.
+                If this value is ``None``, then the parser writes HTML to the
+                standard output.
+
         Examples:
 
             >>> with open('Tests/Log/external_bibliography.log') as log:
@@ -95,6 +271,9 @@ class TexParser(object):
 
         """
         self.input_stream = input_stream
+        self.decoder = (input_stream.decoder if isinstance(
+            input_stream, MappedLog) else Decoder())
+        self.sink = HTMLRenderer() if sink is None else sink
         self.patterns = []
         self.done = False
         self.verbose = verbose
@@ -102,7 +281,7 @@ class TexParser(object):
         self.number_warnings = 0
         self.fatal_error = False
 
-    def get_rewrapped_line(self):
+    def get_rewrapped_line(self, prefilter=None):
         """Try to get exactly one line of coherent tex output.
 
         Sometimes TeX breaks up lines with hard line breaks. This is
@@ -110,6 +289,14 @@ class TexParser(object):
         for two distinct warnings. This function attempts to return a single
         statement.
 
+        Arguments:
+
+            prefilter
+
+                A regular expression for byte strings or ``None``. If the
+                input stream is a ``MappedLog``, then we skip statements not
+                containing a match for this pattern without decoding them.
+
         Returns: ``str``
 
         Examples:
@@ -127,32 +314,41 @@ class TexParser(object):
 
         """
 
-        def to_utf8(bytes):
-            for encoding in encodings:
-                try:
-                    return bytes.decode(encoding)
-                except UnicodeDecodeError:
-                    continue
+        if isinstance(self.input_stream, MappedLog):
+            return self.input_stream.read_statement(prefilter)
 
-        statement = ""
+        pieces = []
+        stream = self.input_stream if PYTHON2 else self.input_stream.buffer
         while True:
-            stream = (self.input_stream
-                      if PYTHON2 else self.input_stream.buffer)
-            line = to_utf8(stream.readline())
+            line = stream.readline()
             if not line:
-                return statement
-            statement += line.rstrip('\n')
-            if not (len(line) == 80 and not line[78] in {'!', '.', ')'}):
+                return self.decoder.decode(b''.join(pieces))
+            pieces.append(line.rstrip(b'\n'))
+            if not is_wrapped(line):
                 break
-        return statement + '\n'
+        pieces.append(b'\n')
+        return self.decoder.decode(b''.join(pieces))
+
+    def readline(self):
+        """Read a single line from the input stream.
+
+        Handlers use this method to look at the line following a match.
+
+        Returns: ``str``
+
+        """
+        if isinstance(self.input_stream, MappedLog):
+            return self.input_stream.readline()
+        stream = self.input_stream if PYTHON2 else self.input_stream.buffer
+        return self.decoder.decode(stream.readline())
 
     def parse_stream(self):
         """Process the input stream one line at a time.
 
-        We match against each pattern in the patterns dictionary. If a pattern
-        matches we call the corresponding method in the dictionary. The
-        dictionary is organized with patterns as the keys and methods as the
-        values.
+        We match against each pattern in the list ``patterns``. If a pattern
+        matches we call the corresponding method of the list. The list is
+        organized as pairs of patterns and methods. Only the first matching
+        pattern counts.
 
         This method returns a tuple containing the following values:
 
@@ -177,29 +373,48 @@ class TexParser(object):
             (False, 0, 0)
 
         """
-        line = self.get_rewrapped_line()
+        dispatcher = get_dispatcher([pattern for pattern, _ in self.patterns],
+                                    self.combine_patterns)
+        prefilter = self.get_prefilter(dispatcher)
+        line = self.get_rewrapped_line(prefilter)
         while line and not self.done:
             line = line.rstrip("\n")
-            found_match = False
 
-            # Process matching patterns until we find one
-            for patttern, function in self.patterns:
-                matching = patttern.match(line)
-                if matching:
-                    function(matching, line)
-                    stdout.flush()
-                    found_match = True
-                    break
-            if self.verbose and not found_match:
-                print('<p>{}</p>'.format(line))
-
-            line = self.get_rewrapped_line()
+            index, matching = dispatcher.match(line)
+            if matching:
+                function = self.patterns[index][1]
+                function(matching, line)
+                self.sink.flush()
+            elif self.verbose:
+                self.sink.emit(Event('message', text=line))
+
+            # Once we are done, we only consume the next statement. Skipping
+            # statements would take them away from the calling parser.
+            line = self.get_rewrapped_line(None if self.done else prefilter)
         if not self.done:
             self.bad_run()
         return self.fatal_error, self.number_errors, self.number_warnings
 
+    def get_prefilter(self, dispatcher):
+        """Return the byte pattern statements have to match to be read.
+
+        Statements that do not match any pattern of the parser only matter in
+        verbose mode. We therefore skip all statements that do not contain a
+        literal required by one of the patterns.
+
+        Arguments:
+
+            dispatcher
+
+                The ``PatternDispatcher`` for the patterns of the parser.
+
+        Returns: ``Pattern``
+
+        """
+        return None if self.verbose else dispatcher.byte_prefilter
+
     def info(self, matching, line):
-        """Print a message containing ``line``.
+        """Emit a message containing ``line``.
 
         The functions of the form ``function(self, matching, line)`` in this
         class and all subclasses use the same interface. We will therefore
@@ -218,24 +433,22 @@ class TexParser(object):
                 A string containing the regex pattern which lead to the call
                 of this function
 
-        Returns: ``str``
-
         """
-        print('<p class="info">{}</p>'.format(line))
+        self.sink.emit(Event('message', 'info', text=line))
 
     def error(self, matching, line):
-        print('<p class="error">{}</p>'.format(line))
+        self.sink.emit(Event('message', 'error', text=line))
         self.number_errors += 1
 
     def warning(self, matching, line):
-        print('<p class="warning">{}</p>'.format(line))
+        self.sink.emit(Event('message', 'warning', text=line))
         self.number_warnings += 1
 
     def warning_format(self, matching, line):
-        print('<p class="fmtWarning">{}</p>'.format(line))
+        self.sink.emit(Event('message', 'format', text=line))
 
     def fatal(self, matching, line):
-        print('<p class="error">{}</p>'.format(line))
+        self.sink.emit(Event('message', 'fatal', text=line))
         self.fatal_error = True
 
     def bad_run(self):
@@ -245,9 +458,9 @@ class TexParser(object):
 class BibTexParser(TexParser):
     """Parse and format messages from bibtex"""
 
-    def __init__(self, input_stream, verbose):
+    def __init__(self, input_stream, verbose, sink=None):
         """Initialize the regex patterns for the BibTexParser"""
-        super(BibTexParser, self).__init__(input_stream, verbose)
+        super(BibTexParser, self).__init__(input_stream, verbose, sink)
         self.patterns.extend([
             (compile("Warning--"), self.warning),
             (compile(r'I found no \\\w+ command'), self.error),
@@ -298,9 +511,9 @@ class BibTexParser(TexParser):
 class BiberParser(TexParser):
     """Parse and format messages from biber"""
 
-    def __init__(self, input_stream, verbose):
+    def __init__(self, input_stream, verbose, sink=None):
         """Initialize the regex patterns for the BiberParser"""
-        super(BiberParser, self).__init__(input_stream, verbose)
+        super(BiberParser, self).__init__(input_stream, verbose, sink)
         self.patterns.extend([
             (compile('INFO - This is Biber'), self.info),
             (compile('WARN'), self.warning),
@@ -333,17 +546,18 @@ class BiberParser(TexParser):
 
     def finish_run(self, matching, line):
         log = matching.group(1)
-        print('<p>Complete transcript is in <a href="{}">{}</a></p>'.format(
-            make_link(join(getcwd(), log)), log))
+        self.sink.emit(
+            Event('transcript', file=join(getcwd(), log), text=line,
+                  arguments=(log, )))
         self.done = True
 
 
 class MakeIndexParser(TexParser):
     """Parse and format messages from makeindex."""
 
-    def __init__(self, input_stream, verbose):
+    def __init__(self, input_stream, verbose, sink=None):
         """Initialize the regex patterns for the MakeIndexParser"""
-        super(MakeIndexParser, self).__init__(input_stream, verbose)
+        super(MakeIndexParser, self).__init__(input_stream, verbose, sink)
         self.patterns.extend([
             (compile(r'This is makeindex, version (\d+\.\d+)'),
              self.run_makeindex),
@@ -383,28 +597,24 @@ class MakeIndexParser(TexParser):
         return super(MakeIndexParser, self).parse_stream()
 
     def run_makeindex(self, matching, line):
-        version = matching.group(1)
-        print('<p class="info">Run <strong>Makeindex</strong>, ' +
-              'version {}<p>'.format(version))
+        self.sink.emit(
+            Event('program', text=line, span=matching.span(1),
+                  arguments=('makeindex', )))
 
     def sorting(self, matching, line):
-        status = matching.group(1)
-        print('<p class="info">Sorting entries: <strong>' +
-              '{}</strong><p>'.format(status))
+        self.sink.emit(Event('sorting', text=line, span=matching.span(1)))
 
     def work_with_file(self, matching, line):
-        description = matching.group(1)
-        filename = matching.group(2)
-        status = matching.group(3)
-        print('<p class="info">{} {}: <strong>{}</strong>'.format(
-            description, filename, status))
+        self.sink.emit(
+            Event('index_file', file=matching.group(2), text=line,
+                  arguments=matching.groups()))
 
     def written(self, matching, line):
         description = matching.group(1)
         filename = matching.group(2)
-        filepath = make_link(join(getcwd(), filename))
-        print('<p class="info">{} <a href="{}">{}</a></p>'.format(
-            description, filepath, filename))
+        self.sink.emit(
+            Event('written', file=join(getcwd(), filename), text=line,
+                  arguments=(description, filename)))
 
     def transcript_written(self, matching, line):
         self.written(matching, line)
@@ -414,9 +624,9 @@ class MakeIndexParser(TexParser):
 class MakeGlossariesParser(MakeIndexParser):
     """Parse and format messages from makeglossaries."""
 
-    def __init__(self, input_stream, verbose):
+    def __init__(self, input_stream, verbose, sink=None):
         """Initialize the regex patterns for the MakeGlossariesParser"""
-        super(MakeGlossariesParser, self).__init__(input_stream, verbose)
+        super(MakeGlossariesParser, self).__init__(input_stream, verbose, sink)
         self.patterns.extend([
             (compile('^.*makeglossaries version (.*)$'), self.begin_run),
             (compile('^.*added glossary type \'(.*)\' \((.*)\).*$'),
@@ -466,26 +676,25 @@ class MakeGlossariesParser(MakeIndexParser):
         return super(MakeGlossariesParser, self).parse_stream()
 
     def begin_run(self, matching, line):
-        version = matching.group(1)
-        print('<h2>Make Glossaries</h2>' +
-              '<p class="info" >Version: <i>{}</i></p>'
-              ''.format(version))
+        self.sink.emit(
+            Event('program', text=line, span=matching.span(1),
+                  arguments=('makeglossaries', )))
 
     def add_type(self, matching, line):
         glossary_type = matching.group(1)
         files = matching.group(2)
         for file in files.split(','):
             self.types[file] = glossary_type
-        print(
-            '<p class="info">Add Glossary Type <strong>' +
-            '{}</strong><i> (Files: {})</i></p>'.format(glossary_type, files))
+        self.sink.emit(
+            Event('glossary_type', text=line,
+                  arguments=(glossary_type, files)))
 
     def run_xindy(self, matching, line):
         language = matching.group(1)
         file = matching.group(2)
         glossary_type = self.types[file]
-        print('<h3>Run xindy for glossary type {}</h3>'.format(glossary_type) +
-              '<p class="info">Language: {}</p>'.format(language))
+        self.sink.emit(
+            Event('xindy', text=line, arguments=(glossary_type, language)))
 
     def transcript_written(self, matching, line):
         self.written(matching, line)
@@ -493,25 +702,29 @@ class MakeGlossariesParser(MakeIndexParser):
     def finish_markup(self, m, line):
         mkfile = m.group(1)
         glossary_type = self.types[mkfile[-3:]]
-        print('<p class="info">Finished glossary for type <strong>' +
-              '{}</strong>. Output is in <a href="{}">{}</a></p>'.format(
-                  glossary_type, make_link(join(getcwd(), mkfile), 1), mkfile))
+        self.sink.emit(
+            Event('glossary', file=join(getcwd(), mkfile), line=1, text=line,
+                  arguments=(glossary_type, mkfile)))
 
 
 class LaTexParser(TexParser):
     """Parse log messages from latex."""
 
-    def __init__(self, input_stream, verbose, filename):
+    def __init__(self, input_stream, verbose, filename, sink=None):
         """Initialize the regex patterns for the LaTexParser."""
-        super(LaTexParser, self).__init__(input_stream, verbose)
+        super(LaTexParser, self).__init__(input_stream, verbose, sink)
         self.suffix = splitext(filename)[0]
-        self.filename = self.current_file = filename
+        self.filename = filename
+        # Track the file TeX reads, so we attribute warnings to the right file
+        self.files = FileStack(filename)
+        self.project_file = compile('\./.*\.(tex|{})$'.format(self.suffix))
+        # The statement read last. We update the file stack for it as soon as
+        # we read the next statement.
+        self.statement = ''
         # Save gutter marks for errors and warnings
         self.marks = set()
         self.patterns.extend([
             (compile('^Document Class'), self.info),
-            (compile('.*?\(\.\/([^\)]*?\.(tex|{})( |$))'.format(self.suffix)),
-             self.detect_new_file),
             (compile('.*\<use (.*?)\>'), self.detect_include),
             (compile('^Output written'), self.info),
             (compile('LaTeX Warning:.*?input line (\d+)(\.|$)'),
@@ -612,30 +825,88 @@ class LaTexParser(TexParser):
         """
         return super(LaTexParser, self).parse_stream()
 
-    def detect_new_file(self, matching, line):
-        self.current_file = matching.group(1).rstrip()
-        print("<h4>Processing: {}</h4>".format(self.current_file))
+    def get_prefilter(self, dispatcher):
+        """Return the byte pattern statements have to match to be read.
+
+        In addition to the statements the patterns of the parser are
+        interested in, the file stack needs every statement containing a
+        parenthesis.
+
+        Returns: ``Pattern``
+
+        """
+        prefilter = super(LaTexParser, self).get_prefilter(dispatcher)
+        return prefilter and compile(prefilter.pattern + b'|[()]')
+
+    def get_rewrapped_line(self, prefilter=None):
+        """Read the next statement and update the file stack."""
+        self.track_files()
+        self.statement = super(LaTexParser, self).get_rewrapped_line(prefilter)
+        return self.statement
+
+    def readline(self):
+        """Read a single line and update the file stack."""
+        self.track_files()
+        self.statement = super(LaTexParser, self).readline()
+        return self.statement
+
+    def track_files(self):
+        """Update the file stack using the statement read last.
+
+        We update the stack only after the handlers processed the statement,
+        since TeX closes a file after it wrote the messages for it.
+
+        Examples:
+
+            >>> from io import BytesIO, TextIOWrapper
+            >>> log = TextIOWrapper(BytesIO(
+            ...     b"(./chapter.tex\\n"
+            ...     b"LaTeX Warning: Citation `Knuth' on page 1 undefined on "
+            ...     b"input line 3.\\n"
+            ...     b")\\n"
+            ...     b"LaTeX Warning: Citation `Lamport' on page 1 undefined "
+            ...     b"on input line 7.\\n"
+            ...     b"Transcript written on thesis.log.\\n"))
+            >>> parser = LaTexParser(log, False, 'thesis.tex', EventList())
+            >>> _ = parser.parse_stream()
+            >>> for filepath, line, _, _ in sorted(parser.marks):
+            ...     print(basename(filepath), line)
+            chapter.tex 3
+            thesis.tex 7
+
+        """
+        for filename in self.files.scan(self.statement):
+            if self.project_file.match(filename):
+                self.sink.emit(
+                    Event('file', file=normpath(filename),
+                          text=self.statement.rstrip('\n')))
+        self.statement = ''
 
     def detect_include(self, matching, line):
-        filepath = matching.group(1)
-        print("<ul><li>Including: {}</li></ul>".format(filepath))
+        self.sink.emit(Event('include', file=matching.group(1), text=line))
 
     def handle_warning(self, matching, line):
-        filepath = join(getcwd(), self.current_file)
+        filepath = join(getcwd(), normpath(self.files.current_file))
         linenumber = int(matching.group(1))
-        print('<p class="warning"><a href="{}">{}</a></p>'.format(
-            make_link(filepath, linenumber), line))
+        self.sink.emit(
+            Event('located', 'warning', filepath, linenumber, text=line))
         self.marks.add((filepath, linenumber, 'warning', line))
         self.number_warnings += 1
 
+    def warning_format(self, matching, line):
+        self.sink.emit(
+            Event('message', 'format',
+                  join(getcwd(), normpath(self.files.current_file)),
+                  text=line))
+
     def handle_error(self, matching, line):
         filename = matching.group(1)
         linenumber = int(matching.group(2))
         description = matching.group(3)
         filepath = join(getcwd(), filename)
-        print('<p class="error">Latex Error: <a href="' +
-              '{}">{}:{}</a> {}</p>'.format(make_link(filepath, linenumber),
-                                            filename, linenumber, description))
+        self.sink.emit(
+            Event('latex_error', 'error', filepath, linenumber, line,
+                  matching.span(3), (filename, )))
         self.marks.add((filepath, linenumber, 'error', description))
         self.number_errors += 1
         if search('Fatal error', description):
@@ -643,30 +914,29 @@ class LaTexParser(TexParser):
 
     def handle_old_style_errors(self, matching, line):
         if search('[Ee]rror', line):
-            print('<p class="error">{}</p>'.format(line))
+            self.sink.emit(Event('message', 'error', text=line))
             self.number_errors += 1
         else:
-            print('<p class="warning">{}</p>'.format(line))
+            self.sink.emit(Event('message', 'warning', text=line))
             self.number_warnings += 1
 
     def pdf_latex_error(self, matching, line):
         self.number_errors += 1
-        print('<p class="error">')
-        line = self.input_stream.readline()
-        if line and match('^ ==> Fatal error occurred', line):
-            print('{}'.format(line.rstrip('\n')))
+        line = self.readline()
+        fatal = bool(line and match('^ ==> Fatal error occurred', line))
+        if fatal:
             self.fatal_error = True
-        elif line:
-            print('<pre>{}</pre>'.format(line.rstrip('\n')))
-        print('</p>')
-        stdout.flush()
+        self.sink.emit(
+            Event('runaway', 'fatal' if fatal else 'error', text=line,
+                  span=(0, len(line.rstrip('\n')))))
+        self.sink.flush()
 
     def warning(self, matching, line):
         # We might have gotten here by matching $1 of the following regex:
         #   (LaTeX Warning:.*) ?input line (\d+)(\.|$)
         # Lets read the next line and check if we find the remaining regex
         # pattern
-        next_line = self.input_stream.readline().strip('\n')
+        next_line = self.readline().strip('\n')
         match_next_line = match('.*?input line (\d+)(\.|$)', next_line)
         if match_next_line:
             return (self.handle_warning(match_next_line,
@@ -678,28 +948,47 @@ class LaTexParser(TexParser):
 
     def finish_run(self, matching, line):
         filename = matching.group(2).strip('"')
-        filepath = make_link(join(getcwd(), filename))
-        print('<p>Complete transcript is in <a href="{}">{}</a></p>'.format(
-            filepath, filename))
+        self.sink.emit(
+            Event('transcript', file=join(getcwd(), filename), text=line,
+                  arguments=(filename, )))
         self.done = True
 
     def bad_run(self):
         logfile = basename(self.filename)
         logfile = logfile.replace(self.suffix, 'log')
-        logpath = join(getcwd(), logfile)
-        print('<p class="error">A fatal error occurred, log file is in ' +
-              '<a href="{}">{}</a></p>'.format(make_link(logpath, logfile),
-                                               logfile))
+        self.sink.emit(
+            Event('bad_run', 'error', join(getcwd(), logfile),
+                  arguments=(logfile, )))
 
 
 class LaTexMkParser(TexParser):
-    """Parse log messages from latexmk."""
+    """Parse log messages from latexmk.
 
-    def __init__(self, input_stream, verbose, filename):
+    If the input stream supports random access, then the parser remembers the
+    position and state at the start of the last section of the log handled by
+    a nested parser (e.g. a run of ``pdflatex``). The attribute ``boundary``
+    stores this information. Using ``resume`` we can later continue parsing
+    the log at this position, e.g. after the log file grew.
+
+    """
+
+    def __init__(self, input_stream, verbose, filename, sink=None):
         """Initialize the regex patterns for the LaTexMkParser."""
-        super(LaTexMkParser, self).__init__(input_stream, verbose)
+        super(LaTexMkParser, self).__init__(input_stream, verbose, sink)
         self.filename = filename
         self.marks = set()
+        self.stream = (self.input_stream
+                       if PYTHON2 else self.input_stream.buffer)
+        try:
+            self.resumable = self.stream.seekable()
+        except AttributeError:
+            # File objects of Python 2 do not provide ``seekable``
+            try:
+                self.stream.tell()
+                self.resumable = True
+            except IOError:
+                self.resumable = False
+        self.offset = self.stream.tell() if self.resumable else 0
         self.patterns.extend([
             (compile('This is (pdfTeX|latex2e|latex|LuaTeX|XeTeX)'),
              self.start_latex), (compile('This is BibTeX'), self.start_bibtex),
@@ -711,6 +1000,7 @@ class LaTexMkParser(TexParser):
             (compile('Run number'), self.new_run)
         ])
         self.number_runs = 0
+        self.boundary = (self.offset, self.get_state())
 
     def parse_stream(self):
         """Parse log messages from latexmk.
@@ -771,35 +1061,139 @@ class LaTexMkParser(TexParser):
         """
         return super(LaTexMkParser, self).parse_stream()
 
+    def get_rewrapped_line(self, prefilter=None):
+        """Read the next statement and remember its offset in the stream."""
+        if self.resumable:
+            self.offset = self.stream.tell()
+        return super(LaTexMkParser, self).get_rewrapped_line(prefilter)
+
+    def get_state(self):
+        """Return the state needed to continue parsing at a later point.
+
+        Returns: ``{str: object}``
+
+        """
+        return {
+            'number_errors': self.number_errors,
+            'number_warnings': self.number_warnings,
+            'number_runs': self.number_runs,
+            'marks': set(self.marks),
+        }
+
+    def set_boundary(self, offset=None):
+        """Remember ``offset`` and the current state as resume position.
+
+        If ``offset`` is ``None``, then we use the offset of the statement
+        processed last.
+
+        """
+        if self.resumable:
+            self.boundary = (self.offset if offset is None else offset,
+                             self.get_state())
+
+    def resume(self, offset, state):
+        """Continue parsing at byte ``offset`` using the parser ``state``.
+
+        Arguments:
+
+            offset
+
+                A byte offset into the input stream, usually the first item of
+                the attribute ``boundary``.
+
+            state
+
+                A dictionary returned by ``get_state``, usually the second
+                item of the attribute ``boundary``.
+
+        Examples:
+
+            >>> from tempfile import NamedTemporaryFile
+            >>> filepath = 'Tests/Log/latexmk_external_bibliography_biber.log'
+            >>> with open(filepath, 'rb') as log:
+            ...     content = log.read()
+            >>> with open(filepath) as log:
+            ...     parser = LaTexMkParser(log, False, filepath, EventList())
+            ...     status = parser.parse_stream()
+
+            Parse the first half of the log
+
+            >>> partial = NamedTemporaryFile(suffix='.log')
+            >>> _ = partial.write(content[:len(content) // 2])
+            >>> partial.flush()
+            >>> with open(partial.name) as log:
+            ...     partial_parser = LaTexMkParser(log, False, filepath,
+            ...                                    EventList())
+            ...     _ = partial_parser.parse_stream()
+            ...     offset, state = partial_parser.boundary
+
+            Continue after the log is complete
+
+            >>> _ = partial.write(content[len(content) // 2:])
+            >>> partial.flush()
+            >>> with open(partial.name) as log:
+            ...     resumed_parser = LaTexMkParser(log, False, filepath,
+            ...                                    EventList())
+            ...     resumed_parser.resume(offset, state)
+            ...     resumed_status = resumed_parser.parse_stream()
+            >>> partial.close()
+            >>> 0 < offset < len(content) // 2
+            True
+            >>> status == resumed_status
+            True
+            >>> parser.marks == resumed_parser.marks
+            True
+            >>> parser.number_runs == resumed_parser.number_runs
+            True
+
+        """
+        self.stream.seek(offset)
+        self.offset = offset
+        self.number_errors = state['number_errors']
+        self.number_warnings = state['number_warnings']
+        self.number_runs = state['number_runs']
+        self.marks = set(state['marks'])
+        self.boundary = (offset, state)
+
     def start_bibtex(self, matching, line):
-        print('<div class="bibtex"><h3>{}</h3>'.format(line[:-1]))
-        parser = BibTexParser(self.input_stream, self.verbose)
+        self.set_boundary()
+        self.sink.emit(
+            Event('program', text=line, span=(0, len(line) - 1),
+                  arguments=('bibtex', )))
+        parser = BibTexParser(self.input_stream, self.verbose, self.sink)
+        parser.decoder = self.decoder
         fatal_error, number_errors, number_warnings = parser.parse_stream()
         self.number_errors += number_errors
         self.number_warnings += number_warnings
 
     def start_biber(self, matching, line):
-        print('<div class="biber"><h3>{}</h3>'.format(line))
-        parser = BiberParser(self.input_stream, self.verbose)
+        self.set_boundary()
+        self.sink.emit(Event('program', text=line, arguments=('biber', )))
+        parser = BiberParser(self.input_stream, self.verbose, self.sink)
+        parser.decoder = self.decoder
         fatal_error, number_errors, number_warnings = parser.parse_stream()
         self.number_errors += number_errors
         self.number_warnings += number_warnings
 
     def start_latex(self, matching, line):
-        print('<div class="latex"><hr><h3>{}</h3>'.format(line[:-1]))
-        parser = LaTexParser(self.input_stream, self.verbose, self.filename)
+        self.set_boundary()
+        self.sink.emit(
+            Event('program', text=line, span=(0, len(line) - 1),
+                  arguments=('latex', )))
+        parser = LaTexParser(self.input_stream, self.verbose, self.filename,
+                             self.sink)
+        parser.decoder = self.decoder
         fatal_error, number_errors, number_warnings = parser.parse_stream()
         self.number_errors += number_errors
         self.number_warnings += number_warnings
         self.marks = parser.marks
 
     def new_run(self, matching, line):
+        self.set_boundary()
         if self.number_runs > 0:
-            print('''<hr><p>Found {} error{}, and {} warning{} in this run</p>
-                  '''.format(self.number_errors,
-                             '' if self.number_errors == 1 else 's',
-                             self.number_warnings,
-                             '' if self.number_warnings == 1 else 's'))
+            self.sink.emit(
+                Event('summary', text=line,
+                      arguments=(self.number_errors, self.number_warnings)))
         self.number_warnings = 0
         self.number_errors = 0
         self.number_runs += 1
@@ -807,17 +1201,20 @@ class LaTexMkParser(TexParser):
     def finish_run(self, matching, line):
         self.latexmk(matching, line)
         self.done = True
+        # Continue after the end of this latexmk run, if the log grows
+        if self.resumable:
+            self.set_boundary(self.stream.tell())
 
     def latexmk(self, matching, line):
-        print('<p class="ltxmk">{}</p>'.format(line))
+        self.sink.emit(Event('latexmk', text=line))
 
 
 class ChkTexParser(TexParser):
     """Parse the output from chktex."""
 
-    def __init__(self, input_stream, verbose, filename):
+    def __init__(self, input_stream, verbose, filename, sink=None):
         """Initialize the regex patterns for the ChkTexParser."""
-        super(ChkTexParser, self).__init__(input_stream, verbose)
+        super(ChkTexParser, self).__init__(input_stream, verbose, sink)
         self.fileName = filename
         self.patterns.extend([
             (compile('^ChkTeX'), self.info),
@@ -863,17 +1260,16 @@ class ChkTexParser(TexParser):
 
     def handle(self, matching, line, error_class='warning'):
         filename = matching.group(1)
-        linenumber = matching.group(2)
-        description = matching.group(3)
-        print('<p class="{}">{}: <a href="{}">{}:{}</a></p>'.format(
-            error_class, 'Error' if error_class == 'error' else 'Warning',
-            make_link(join(getcwd(), filename), linenumber), filename,
-            description))
-        details = self.input_stream.readline()
+        linenumber = int(matching.group(2))
+        self.sink.emit(
+            Event('chktex', error_class, join(getcwd(), filename), linenumber,
+                  line, matching.span(3), (filename, )))
+        details = self.readline()
         if len(details) > 2:
-            print('<pre>{}\n{}</pre>'.format(
-                details[:-1],
-                self.input_stream.readline()[:-1])),
+            self.sink.emit(
+                Event('source', text=details,
+                      arguments=(details[:-1],
+                                 self.readline()[:-1])))
         if error_class == 'error':
             self.number_errors += 1
         else:
@@ -0,0 +1,678 @@
+# -*- coding: utf-8 -*-
+"""This module runs the programs of a typesetting run and parses their output.
+
+Every stage of a typesetting run (LaTeX, BibTeX, Biber, makeindex, …) starts
+a program and parses its output with one of the parser classes of
+``parsing.py``. ``run_command`` reads the output of the program in chunks on
+an ``asyncio`` event loop and feeds the chunks to a ``ChunkStream``. The
+parser reads statements from this stream in a worker thread, as soon as the
+program produces them. Meanwhile further work, that does not depend on the
+output of the program (e.g. looking up the location of the PDF viewer), runs
+in other worker threads.
+
+Python 2 does not provide ``asyncio``. There we run the program and the
+additional work one after another. We do the same for programs we start
+outside of the main thread.
+
+If we pass a ``FailFast`` sink to ``run_command``, then we stop the program
+and all programs it started as soon as the parser reports an error TeX can
+not recover from. A ``Watchdog`` stops programs that do not produce output
+or run for too long, e.g. a TeX engine waiting for input from a terminal.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from os import killpg, setsid
+from re import compile
+from signal import SIGKILL, SIGTERM
+from subprocess import Popen, PIPE, STDOUT
+from subprocess import CalledProcessError
+from sys import version_info
+from threading import Condition, current_thread, Event as Signal, Thread
+from time import sleep
+from timeit import default_timer
+try:
+    from asyncio import gather, new_event_loop, set_event_loop  # Python 3
+    from asyncio import SubprocessProtocol
+    from threading import main_thread
+except ImportError:
+    new_event_loop = main_thread = None  # Python 2
+    SubprocessProtocol = object
+
+from events import Event, HTMLRenderer
+
+# -- Global Variables ---------------------------------------------------------
+
+# The number of bytes a ``ChunkStream`` buffers before we stop reading the
+# output of the program. The program then waits until the parser caught up.
+BUFFER_LIMIT = 1 << 22
+
+PYTHON2 = version_info <= (3, 0)
+
+# The arguments of ``Popen`` that start a program in a new session. In
+# Python 3 ``preexec_fn`` is not safe if the program uses threads.
+NEW_SESSION = ({
+    'preexec_fn': setsid
+} if PYTHON2 else {
+    'start_new_session': True
+})
+
+# The number of seconds between two checks of a ``Watchdog``
+WATCHDOG_INTERVAL = 0.5
+
+# The number of seconds a program has to exit after ``SIGTERM``, before we
+# send it ``SIGKILL``
+KILL_GRACE = 5
+
+# Match the descriptions of errors that stop TeX or leave it without a
+# chance to produce useful output
+FATAL_ERROR = compile(
+    r"Emergency stop|Fatal error|File `[^']*\.sty' not found")
+
+# -- Functions ----------------------------------------------------------------
+
+
+def is_fatal(event):
+    """Check if ``event`` reports an error TeX can not recover from.
+
+    Returns: ``bool``
+
+    Examples:
+
+        >>> is_fatal(Event('message', 'fatal', text='==> Fatal error'))
+        True
+        >>> line = './thesis.tex:3: Emergency stop.'
+        >>> is_fatal(Event('latex_error', 'error', text=line, span=(16, 30)))
+        True
+        >>> line = './thesis.tex:7: Undefined control sequence.'
+        >>> is_fatal(Event('latex_error', 'error', text=line, span=(16, 42)))
+        False
+
+    """
+    return event.severity == 'fatal' or (event.kind == 'latex_error' and
+                                         bool(FATAL_ERROR.search(
+                                             event.message)))
+
+
+def terminate(process_group, grace=None):
+    """Terminate all processes of ``process_group``, if they still run.
+
+    Processes that ignore ``SIGTERM``, such as a program started via
+    ``\\write18`` that waits for input, get ``SIGKILL`` after ``grace``
+    seconds. As long as one process of the group still runs, the system does
+    not reuse the id of the group.
+
+    Examples:
+
+        >>> from time import sleep
+        >>> process = Popen("trap '' TERM; sleep 10; exit 0", shell=True,
+        ...                 preexec_fn=setsid)
+        >>> sleep(0.2)
+        >>> terminate(process.pid, grace=0.5)
+        >>> sleep(0.2)
+        >>> process.poll() is None
+        True
+        >>> process.wait() == -SIGKILL
+        True
+
+    """
+    try:
+        killpg(process_group, SIGTERM)
+    except OSError:
+        return
+    killer = Thread(target=kill,
+                    args=(process_group,
+                          KILL_GRACE if grace is None else grace))
+    killer.daemon = True
+    killer.start()
+
+
+def kill(process_group, grace):
+    """Kill all processes of ``process_group`` that still run after
+    ``grace`` seconds."""
+    deadline = default_timer() + grace
+    try:
+        while default_timer() < deadline:
+            sleep(WATCHDOG_INTERVAL / 5)
+            # Signal ``0`` only checks if the group still exists
+            killpg(process_group, 0)
+        killpg(process_group, SIGKILL)
+    except OSError:
+        pass
+
+
+def read_command(command, sink=None):
+    """Run ``command`` under a ``Watchdog`` and return its output.
+
+    Arguments:
+
+        command
+
+            The shell command we execute.
+
+        sink
+
+            The sink that receives the record of a timeout. If this value is
+            ``None``, then we write HTML to the standard output.
+
+    Returns: ``str``
+
+    Raises: ``CalledProcessError`` if ``command`` fails.
+
+    Examples:
+
+        >>> print(read_command('echo LuaTeX').strip())
+        LuaTeX
+        >>> try:
+        ...     read_command('exit 3')
+        ... except CalledProcessError as error:
+        ...     print(error.returncode)
+        3
+
+        Run a command outside of the main thread
+
+        >>> outputs = []
+        >>> thread = Thread(
+        ...     target=lambda: outputs.append(read_command('echo bibunit')))
+        >>> thread.start()
+        >>> thread.join()
+        >>> print(outputs[0].strip())
+        bibunit
+
+    """
+    status, reader, _ = run_command(
+        command, lambda stream: CommandOutput(stream, sink))
+    if status:
+        raise CalledProcessError(status, command, reader.output)
+    return reader.output
+
+
+def run_command(command,
+                create_parser,
+                tasks=(),
+                fail_fast=None,
+                watchdog=None):
+    """Run ``command`` and parse its output while the program still runs.
+
+    Arguments:
+
+        command
+
+            The shell command we execute.
+
+        create_parser
+
+            A function that takes a stream containing the output of
+            ``command`` and returns the parser for this stream.
+
+        tasks
+
+            Functions without arguments we call while ``command`` runs. These
+            functions must not write to the standard output, since the output
+            would end up in the middle of the output of the parser.
+
+        fail_fast
+
+            A ``FailFast`` sink the parser uses, or ``None``. If the sink sees
+            a fatal error, then we terminate the process group of
+            ``command``.
+
+        watchdog
+
+            The ``Watchdog`` that stops ``command`` if it hangs. If this
+            value is ``None``, then we use a watchdog with the default limits.
+
+    Returns: ``(int, TexParser, [object])``
+
+        A tuple containing the exit status of ``command``, the parser after
+        it processed the output of ``command`` and the return values of
+        ``tasks``.
+
+    Examples:
+
+        >>> from events import EventList
+        >>> from parsing import BibTexParser
+        >>> status, parser, results = run_command(
+        ...     "printf 'Warning--empty journal in Knuth\\\\n'; exit 2",
+        ...     lambda stream: BibTexParser(stream, False, EventList()),
+        ...     [lambda: 21 * 2])
+        >>> status
+        2
+        >>> parser.fatal_error, parser.number_errors, parser.number_warnings
+        (False, 0, 1)
+        >>> results
+        [42]
+
+        Stop a command after a fatal error
+
+        >>> from parsing import LaTexParser
+        >>> fail_fast = FailFast(EventList())
+        >>> status, parser, _ = run_command(
+        ...     "echo './thesis.tex:3: Emergency stop.'; sleep 10",
+        ...     lambda stream: LaTexParser(stream, False, 'thesis.tex',
+        ...                                fail_fast), fail_fast=fail_fast)
+        >>> status != 0, fail_fast.stopped < 10
+        (True, True)
+        >>> print(fail_fast.sink[-1].kind)
+        stopped
+
+        Stop a command that does not produce output
+
+        >>> events = EventList()
+        >>> status, parser, _ = run_command(
+        ...     'echo Waiting; sleep 10',
+        ...     lambda stream: CommandOutput(stream, events),
+        ...     watchdog=Watchdog(idle_limit=1))
+        >>> status != 0, parser.number_errors
+        (True, 1)
+        >>> print(events[-1].kind, events[-1].arguments[1])
+        timeout idle
+
+    """
+    watchdog = Watchdog() if watchdog is None else watchdog
+    # Before Python 3.8 an event loop can only start child processes in the
+    # main thread. Other threads, e.g. the bibtex runs of ``bibunits``, wait
+    # for the program themselves.
+    if new_event_loop is None or current_thread() is not main_thread():
+        # Put the program and its children into a new process group, so we
+        # can stop them together
+        process = Popen(command,
+                        shell=True,
+                        stdout=PIPE,
+                        stdin=PIPE,
+                        stderr=STDOUT,
+                        close_fds=True,
+                        universal_newlines=True,
+                        **NEW_SESSION)
+        if fail_fast:
+            fail_fast.start(lambda: terminate(process.pid))
+        watchdog.start()
+        exited = Signal()
+        watcher = Thread(target=watchdog.watch, args=(process.pid, exited))
+        watcher.daemon = True
+        watcher.start()
+        parser = create_parser(WatchedStream(process.stdout, watchdog))
+        parser.parse_stream()
+        status = process.wait()
+        exited.set()
+        watcher.join()
+        if fail_fast:
+            fail_fast.finish()
+        watchdog.finish(command, parser)
+        return status, parser, [task() for task in tasks]
+
+    loop = new_event_loop()
+    # Older versions of Python only watch child processes of the current
+    # event loop
+    set_event_loop(loop)
+    transport = None
+    try:
+        stream = ChunkStream()
+        exited = loop.create_future()
+        transport, _ = loop.run_until_complete(
+            loop.subprocess_shell(
+                lambda: CommandProtocol(loop, stream, exited, watchdog),
+                command,
+                stdin=PIPE,
+                stdout=PIPE,
+                stderr=STDOUT,
+                close_fds=True,
+                # Put the program and its children into a new process group,
+                # so we can stop them together
+                start_new_session=True))
+        pid = transport.get_pid()
+        if fail_fast:
+            fail_fast.start(
+                lambda: loop.call_soon_threadsafe(terminate, pid))
+
+        def check():
+            # The program does not wait, if we stopped reading its output
+            if stream.paused:
+                watchdog.output()
+            if watchdog.expired():
+                terminate(pid)
+            elif not exited.done():
+                loop.call_later(WATCHDOG_INTERVAL, check)
+
+        watchdog.start()
+        loop.call_later(WATCHDOG_INTERVAL, check)
+        parser = create_parser(stream)
+        parsing = loop.run_in_executor(None, parser.parse_stream)
+        # Once the parser is done, we still need to read the remaining output
+        # of the program. Otherwise the program would block.
+        parsing.add_done_callback(lambda _: stream.detach())
+        work = [loop.run_in_executor(None, task) for task in tasks]
+        results = loop.run_until_complete(gather(parsing, exited, *work))
+        if fail_fast:
+            fail_fast.finish()
+        watchdog.finish(command, parser)
+        return transport.get_returncode(), parser, list(results[2:])
+    finally:
+        if transport is not None:
+            transport.close()
+        set_event_loop(None)
+        loop.close()
+
+
+# -- Classes ------------------------------------------------------------------
+
+
+class ChunkStream(object):
+    """A stream of bytes written in chunks by one thread and read by another.
+
+    The class provides the part of the file interface the parser classes use
+    to read lines. The method ``feed`` returns ``False`` as soon as the
+    stream contains more than ``limit`` unread bytes. The stream calls
+    ``resume`` after the reader consumed most of these bytes.
+
+    Examples:
+
+        >>> stream = ChunkStream()
+        >>> stream.feed(b'This is BibTeX')
+        True
+        >>> stream.feed(b', Version 0.99d\\nThe top-level')
+        True
+        >>> stream.close()
+        >>> print(stream.buffer.readline().decode('utf-8').rstrip())
+        This is BibTeX, Version 0.99d
+        >>> print(stream.readline().decode('utf-8'))
+        The top-level
+        >>> stream.readline() == b''
+        True
+
+    """
+
+    def __init__(self, limit=BUFFER_LIMIT):
+        self.data = bytearray()
+        # The part of ``data`` we already searched for a line ending
+        self.searched = 0
+        self.limit = limit
+        self.paused = False
+        self.closed = False
+        self.detached = False
+        self.resume = None
+        self.condition = Condition()
+
+    @property
+    def buffer(self):
+        return self
+
+    def seekable(self):
+        return False
+
+    def feed(self, chunk):
+        """Append ``chunk`` to the stream.
+
+        Returns: ``bool``
+
+            ``False`` if the writer should wait for a call of ``resume``
+            before it adds more data.
+
+        """
+        with self.condition:
+            if self.detached:
+                return True
+            self.data.extend(chunk)
+            self.condition.notify()
+            self.paused = len(self.data) > self.limit
+            return not self.paused
+
+    def close(self):
+        """Mark the end of the stream."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def detach(self):
+        """Discard all data, since nobody reads the stream anymore."""
+        with self.condition:
+            self.detached = True
+            self.take(len(self.data))
+
+    def readline(self):
+        """Read a line, waiting for more data until the line is complete.
+
+        Returns: ``bytes``
+
+        """
+        with self.condition:
+            while True:
+                end = self.data.find(b'\n', self.searched)
+                if end >= 0:
+                    return self.take(end + 1)
+                self.searched = len(self.data)
+                if self.closed or self.detached:
+                    return self.take(len(self.data))
+                self.condition.wait()
+
+    def take(self, size):
+        """Remove and return the first ``size`` bytes of the stream.
+
+        Returns: ``bytes``
+
+        """
+        chunk = bytes(self.data[:size])
+        del self.data[:size]
+        self.searched = 0
+        if self.paused and len(self.data) <= self.limit // 2:
+            self.paused = False
+            if self.resume:
+                self.resume()
+        return chunk
+
+
+class CommandProtocol(SubprocessProtocol):
+    """Pass the output of a program to a ``ChunkStream``."""
+
+    def __init__(self, loop, stream, exited, watchdog):
+        self.loop = loop
+        self.stream = stream
+        self.exited = exited
+        self.watchdog = watchdog
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        pipe = transport.get_pipe_transport(1)
+        # ``ChunkStream`` calls ``resume`` in the thread of the parser
+        self.stream.resume = lambda: self.loop.call_soon_threadsafe(
+            pipe.resume_reading)
+
+    def pipe_data_received(self, fd, data):
+        self.watchdog.output()
+        if not self.stream.feed(data):
+            self.transport.get_pipe_transport(fd).pause_reading()
+
+    def pipe_connection_lost(self, fd, exception):
+        self.stream.close()
+
+    def process_exited(self):
+        if not self.exited.done():
+            self.exited.set_result(self.transport.get_returncode())
+
+
+class FailFast(object):
+    """Pass events on to another sink and watch for fatal errors.
+
+    Once the sink sees the first fatal error, it calls the function passed
+    to ``start``. After the program finished, ``finish`` reports how long the
+    program ran and how much time we saved compared to ``expected``.
+
+    """
+
+    def __init__(self, sink, expected=None):
+        """Initialize a new sink wrapping ``sink``.
+
+        Arguments:
+
+            sink
+
+                The sink that receives all events.
+
+            expected
+
+                The number of seconds the last complete run of the program
+                took, or ``None`` if we do not know this value.
+
+        """
+        self.sink = sink
+        self.expected = expected
+        self.stop = None
+        self.started = None
+        # The number of seconds after which we stopped the program
+        self.stopped = None
+
+    def start(self, stop):
+        """Start the clock; ``stop`` terminates the program."""
+        self.stop = stop
+        self.started = default_timer()
+
+    def emit(self, event):
+        self.sink.emit(event)
+        if self.stop and self.stopped is None and is_fatal(event):
+            self.stopped = default_timer() - self.started
+            self.stop()
+
+    def flush(self):
+        self.sink.flush()
+
+    def finish(self):
+        """Report that we stopped the program, if we did."""
+        if self.stopped is None:
+            return
+        saved = (None if self.expected is None else
+                 max(self.expected - self.stopped, 0))
+        self.sink.emit(
+            Event('stopped', 'fatal', arguments=(self.stopped, saved)))
+        self.sink.flush()
+
+
+class Watchdog(object):
+    """Decide when we stop a program that hangs.
+
+    The watchdog tracks the time since the program started and since it last
+    produced output. If one of these values exceeds its limit, then the
+    watchdog expires. A limit of ``0`` or ``None`` disables the check.
+
+    Examples:
+
+        >>> from time import sleep
+        >>> watchdog = Watchdog(idle_limit=300, total_limit=0.01)
+        >>> watchdog.start()
+        >>> watchdog.expired()
+        False
+        >>> sleep(0.02)
+        >>> watchdog.output()
+        >>> watchdog.expired()
+        True
+        >>> print(watchdog.reason)
+        total
+
+    """
+
+    # The default limits in seconds
+    idle_limit = 300
+    total_limit = 3600
+
+    def __init__(self, idle_limit=None, total_limit=None):
+        if idle_limit is not None:
+            self.idle_limit = idle_limit
+        if total_limit is not None:
+            self.total_limit = total_limit
+        self.started = self.last_output = None
+        # The limit the program exceeded (``idle`` or ``total``)
+        self.reason = None
+
+    def start(self):
+        self.started = self.last_output = default_timer()
+        self.reason = None
+
+    def output(self):
+        """Record that the program produced output."""
+        self.last_output = default_timer()
+
+    def expired(self):
+        """Check if the program exceeded one of the limits.
+
+        Returns: ``bool``
+
+        """
+        if self.reason is None:
+            now = default_timer()
+            if self.total_limit and now - self.started > self.total_limit:
+                self.reason = 'total'
+            elif self.idle_limit and now - self.last_output > self.idle_limit:
+                self.reason = 'idle'
+        return self.reason is not None
+
+    def watch(self, process_group, exited):
+        """Check the watchdog until the event ``exited`` is set.
+
+        If the watchdog expires, then we terminate ``process_group``. We do
+        not poll the process itself, since only the thread waiting for the
+        process should collect its exit status.
+
+        """
+        while not exited.wait(WATCHDOG_INTERVAL):
+            if self.expired():
+                terminate(process_group)
+                return
+
+    def finish(self, command, parser):
+        """Report a timeout of ``command`` to the sink of ``parser``.
+
+        The timeout counts as error, so the log window stays open.
+
+        """
+        if self.reason is None:
+            return
+        limit = self.idle_limit if self.reason == 'idle' else self.total_limit
+        parser.number_errors += 1
+        parser.sink.emit(
+            Event('timeout', 'error', arguments=(
+                command, self.reason, limit, default_timer() - self.started)))
+        parser.sink.flush()
+
+
+class WatchedStream(object):
+    """Tell a ``Watchdog`` whenever we read a line from a stream."""
+
+    def __init__(self, stream, watchdog):
+        self.stream = stream
+        self.watchdog = watchdog
+
+    @property
+    def buffer(self):
+        return WatchedStream(self.stream.buffer, self.watchdog)
+
+    def readline(self):
+        line = self.stream.readline()
+        self.watchdog.output()
+        return line
+
+    def seekable(self):
+        return False
+
+
+class CommandOutput(object):
+    """Collect the output of a program we do not parse.
+
+    The class provides the part of the parser interface ``run_command`` uses.
+
+    """
+
+    def __init__(self, input_stream, sink=None):
+        self.input_stream = input_stream
+        self.sink = HTMLRenderer() if sink is None else sink
+        self.number_errors = 0
+        self.output = ''
+
+    def parse_stream(self):
+        stream = self.input_stream if PYTHON2 else self.input_stream.buffer
+        self.output = b''.join(iter(stream.readline, b'')).decode(
+            'utf-8', 'replace')
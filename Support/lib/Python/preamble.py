@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+"""This module precompiles the preamble of tex documents into formats.
+
+Most of the time LaTeX spends on a short document goes into loading the
+packages of its preamble. The package ``mylatexformat`` dumps the state of
+LaTeX at the end of the preamble into a format file. If we start the engine
+with this format, then it skips the preamble of the document.
+
+A ``PreambleFormat`` knows the key of the current preamble: a hash of the
+preamble, the local files it includes, the engine, the version of the
+engine and the options of the engine that change the format. We store the
+key of the format next to the format and only use the format if the keys
+match. Otherwise we rebuild the format in the background, while the current
+run of LaTeX still uses the full preamble.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from errno import EPERM
+from io import open
+from os import devnull, getcwd, kill
+from os.path import basename, dirname, isfile, join, normpath, splitext
+from pipes import quote as shellquote
+from re import compile
+from subprocess import CalledProcessError, Popen
+from time import time
+
+from manifest import hash_parts, read
+from pipeline import NEW_SESSION, read_command, Watchdog
+from tex import COMMENT, read_until_document
+
+# -- Global Variables ---------------------------------------------------------
+
+# The engines that can load a format dumped by ``mylatexformat``. The formats
+# of XeTeX and LuaTeX can not contain the fonts and Lua code most preambles
+# of these engines load.
+FORMAT_ENGINES = {'latex', 'pdflatex'}
+
+# The versions of the engines we already looked up
+ENGINE_VERSIONS = {}
+
+# Match engine options that do not change the format
+IGNORED_OPTION = compile(
+    r"(?:^|\s)--?(?:interaction|file-line-error(?:-style)?|synctex|draftmode|"
+    r"no-pdf|output-directory|jobname)(?:=(?:'[^']*'|\S*))?(?=\s|$)")
+
+# The number of seconds after which we consider a build of a format that did
+# not finish as failed, e.g. since the system stopped it
+BUILD_LIMIT = 600
+
+# Match commands that read a file in the preamble
+INCLUDE_COMMAND = compile(br'\\(input|usepackage|RequirePackage|documentclass)'
+                          br'\s*(?:\[[^\]]*\])?\s*\{([^}#]+)\}')
+
+# The extension of the files read by the commands in ``INCLUDE_COMMAND``
+INCLUDE_EXTENSIONS = {
+    b'input': '.tex',
+    b'usepackage': '.sty',
+    b'RequirePackage': '.sty',
+    b'documentclass': '.cls'
+}
+
+# -- Functions ----------------------------------------------------------------
+
+
+def read_preamble(texfile):
+    """Return the preamble of ``texfile`` and the local files it includes.
+
+    Arguments:
+
+        texfile
+
+            The path of the tex file. We look for included files relative to
+            the directory of this file.
+
+    Returns: ``[bytes]``
+
+        The preamble, followed by the name and the content of every local
+        file the preamble includes. If ``texfile`` has no preamble, then
+        this function returns ``None``.
+
+    Examples:
+
+        >>> from os import getcwd, chdir
+        >>> from shutil import rmtree
+        >>> from tempfile import mkdtemp
+        >>> directory = getcwd()
+        >>> chdir(mkdtemp())
+        >>> def write(filename, content):
+        ...     with open(filename, 'w') as output:
+        ...         _ = output.write(content)
+
+        >>> write('thesis.tex', '\\\\documentclass{article}\\n'
+        ...       '\\\\usepackage{macros, amsmath} % \\\\input{notes}\\n'
+        ...       '\\\\begin{document}Text\\\\end{document}')
+        >>> write('macros.sty', '\\\\RequirePackage{symbols}')
+        >>> write('symbols.sty', '\\\\newcommand\\\\R{\\\\mathbb{R}}')
+        >>> for part in read_preamble('thesis.tex')[1:]:
+        ...     print(part.decode('utf-8'))
+        macros.sty
+        \\RequirePackage{symbols}
+        symbols.sty
+        \\newcommand\\R{\\mathbb{R}}
+
+        >>> write('notes.tex', 'No preamble')
+        >>> read_preamble('notes.tex') # Returns ``None``
+
+        >>> rmtree(getcwd())
+        >>> chdir(directory)
+
+    """
+    try:
+        preamble, found = read_until_document(texfile)
+    except (IOError, OSError):
+        return None
+    if not found:
+        return None
+    parts = [preamble]
+    pending, seen = [parts[0]], set()
+    while pending:
+        source = COMMENT.sub(b'', pending.pop(0))
+        for command in INCLUDE_COMMAND.finditer(source):
+            name, arguments = command.groups()
+            for argument in arguments.split(b','):
+                filename = argument.strip().decode('utf-8', 'replace')
+                if not filename.endswith(INCLUDE_EXTENSIONS[name]):
+                    filename += INCLUDE_EXTENSIONS[name]
+                filepath = join(dirname(texfile), filename)
+                if filepath in seen or not isfile(filepath):
+                    continue
+                seen.add(filepath)
+                included = read(filepath) or b''
+                parts.extend([filename.encode('utf-8'), included])
+                pending.append(included)
+    return parts
+
+
+def engine_version(engine):
+    """Return the version string of ``engine``.
+
+    Returns: ``str``
+
+        The first line of the output of ``engine --version`` or ``None`` if
+        we could not run ``engine``.
+
+    Examples:
+
+        >>> engine_version('non_existent_engine') # Returns ``None``
+
+    """
+    if engine not in ENGINE_VERSIONS:
+        try:
+            output = read_command('{} --version'.format(shellquote(engine)))
+            ENGINE_VERSIONS[engine] = output.split('\n')[0]
+        except (CalledProcessError, OSError):
+            ENGINE_VERSIONS[engine] = None
+    return ENGINE_VERSIONS[engine]
+
+
+def format_options(options):
+    """Return the options of an engine that change the format it dumps.
+
+    Options like ``-shell-escape`` change what the preamble can do. Options
+    that only change the output or the messages of the engine do not
+    matter.
+
+    Arguments:
+
+        options
+
+            The command line options of the engine.
+
+    Returns: ``str``
+
+    Examples:
+
+        >>> print(format_options("-interaction=nonstopmode -synctex=1 "
+        ...                      "-file-line-error-style -shell-escape "
+        ...                      "-output-directory='build dir' -8bit"))
+        -shell-escape -8bit
+        >>> print(format_options('-interaction=nonstopmode -draftmode'))
+        <BLANKLINE>
+
+    """
+    return ' '.join(IGNORED_OPTION.sub('', options).split())
+
+
+# -- Classes ------------------------------------------------------------------
+
+
+class PreambleFormat(object):
+    """Manage the precompiled preamble of a tex document.
+
+    The file ``.name.preamble.key`` stores the state of the format of the
+    document ``name.tex``. It contains
+
+        - the key of the format, if the format is ready,
+        - the key prefixed with ``~``, followed by the start time of the
+          build and the id of the process that builds the format, while we
+          build the format, and
+        - the key prefixed with ``!``, if the format could not be built or
+          used.
+
+    If the process building the format does not run any more, or the build
+    started more than ``BUILD_LIMIT`` seconds ago, then the format is stale.
+
+    Examples:
+
+        >>> preamble_format = PreambleFormat('non_existent_file.tex',
+        ...                                  'xelatex')
+        >>> preamble_format.usable()
+        False
+        >>> preamble_format.state() # Returns ``None``
+
+        A build that stopped without storing its result is stale
+
+        >>> from os import getcwd, chdir, getpid
+        >>> from shutil import rmtree
+        >>> from subprocess import call
+        >>> from tempfile import mkdtemp
+        >>> directory = getcwd()
+        >>> chdir(mkdtemp())
+        >>> preamble_format = PreambleFormat('thesis.tex', 'pdflatex')
+        >>> preamble_format.key = 'c0fe'
+        >>> preamble_format.store('~', int(time()), getpid())
+        >>> print(preamble_format.state())
+        building
+        >>> process = Popen('exit 0', shell=True)
+        >>> process.wait()
+        0
+        >>> preamble_format.store('~', int(time()), process.pid)
+        >>> print(preamble_format.state())
+        stale
+        >>> preamble_format.store('~', int(time()) - BUILD_LIMIT - 1)
+        >>> print(preamble_format.state())
+        stale
+        >>> rmtree(getcwd())
+        >>> chdir(directory)
+
+    """
+
+    def __init__(self, texfile, engine, options='', build_directory=None):
+        """Initialize the format of ``texfile`` for ``engine``.
+
+        Arguments:
+
+            texfile
+
+                The path of the tex file.
+
+            engine
+
+                The name of the typesetting engine, e.g. ``pdflatex``.
+
+            options
+
+                The command line options of the engine.
+
+            build_directory
+
+                The directory the engine writes its output to. We store the
+                format there. If this value is ``None``, then we store the
+                format next to ``texfile``.
+
+        Examples:
+
+            >>> print(PreambleFormat('input/thesis.tex', 'pdflatex').jobname)
+            input/.thesis.preamble
+            >>> print(PreambleFormat('thesis.tex', 'pdflatex',
+            ...                      build_directory='build').jobname)
+            build/.thesis.preamble
+
+        """
+        self.texfile = texfile
+        self.engine = engine
+        self.options = format_options(options)
+        name = splitext(texfile)[0]
+        self.jobname = join(build_directory or dirname(name),
+                            '.{}.preamble'.format(basename(name)))
+        self.key = None
+        if self.usable():
+            version = engine_version(engine)
+            parts = read_preamble(texfile)
+            if version and parts and not parts[0].startswith(b'%&'):
+                self.key = hash_parts([
+                    engine.encode('utf-8'),
+                    version.encode('utf-8'),
+                    self.options.encode('utf-8')
+                ] + parts)
+
+    def usable(self):
+        """Check if we can build a format for the document at all.
+
+        Returns: ``bool``
+
+        """
+        return (self.engine in FORMAT_ENGINES
+                and ' ' not in basename(self.texfile))
+
+    def state(self):
+        """Return the state of the format.
+
+        Returns: ``str``
+
+            One of the values ``ready``, ``building``, ``failed`` and
+            ``stale``, or ``None`` if we do not build a format for the
+            document.
+
+        """
+        if self.key is None:
+            return None
+        try:
+            with open('{}.key'.format(self.jobname), encoding='ascii') as file:
+                stored = file.read().strip()
+        except (IOError, OSError, ValueError):
+            return 'stale'
+        states = {
+            self.key: 'ready',
+            '~' + self.key: 'building',
+            '!' + self.key: 'failed'
+        }
+        stored = stored.split()
+        state = states.get(stored[0] if stored else None, 'stale')
+        if state == 'ready' and not isfile('{}.fmt'.format(self.jobname)):
+            return 'stale'
+        if state == 'building' and not self.running(stored[1:]):
+            return 'stale'
+        return state
+
+    @staticmethod
+    def running(details):
+        """Check if the build described by ``details`` still runs.
+
+        Arguments:
+
+            details
+
+                The start time of the build, followed by the id of the
+                process that builds the format, once this process started.
+
+        Returns: ``bool``
+
+        """
+        try:
+            if time() - float(details[0]) > BUILD_LIMIT:
+                return False
+            if len(details) > 1:
+                kill(int(details[1]), 0)
+        except (IndexError, ValueError):
+            return False
+        except OSError as error:
+            # The process exists, but belongs to another user
+            return error.errno == EPERM
+        return True
+
+    def option(self):
+        """Return the option that tells the engine to load the format.
+
+        Returns: ``str``
+
+        """
+        return '-fmt={}'.format(shellquote(self.jobname))
+
+    def build(self, watchdog=None):
+        """Build the format in the background.
+
+        The build uses a temporary job name, so the engine can still use the
+        old format or the full preamble in the meantime. The build outlives
+        the current command. The shell that runs it therefore stops the
+        engine itself, if the engine does not extend its transcript or runs
+        longer than the limits of ``watchdog`` allow.
+
+        Arguments:
+
+            watchdog
+
+                The ``Watchdog`` whose limits apply to the build. If this
+                value is ``None``, then we use the default limits.
+
+        Examples:
+
+            >>> from os import chdir, chmod, getcwd
+            >>> from shutil import rmtree
+            >>> from tempfile import mkdtemp
+            >>> from time import sleep
+            >>> directory = getcwd()
+            >>> chdir(mkdtemp())
+            >>> with open('engine', 'w') as engine:
+            ...     _ = engine.write('#!/bin/sh\\nsleep 10\\n')
+            >>> chmod('engine', 0o755)
+            >>> preamble_format = PreambleFormat('thesis.tex', 'pdflatex')
+            >>> preamble_format.key = 'c0fe'
+            >>> preamble_format.engine = './engine'
+            >>> preamble_format.build(Watchdog(idle_limit=1))
+            >>> while preamble_format.state() == 'building':
+            ...     sleep(0.2)
+            >>> print(preamble_format.state())
+            failed
+            >>> rmtree(getcwd())
+            >>> chdir(directory)
+
+        """
+        watchdog = Watchdog() if watchdog is None else watchdog
+        started = int(time())
+        self.store('~', started)
+        temporary = '{}.tmp'.format(self.jobname)
+        # The shell stores its process id, so we notice if it stops before
+        # it stores the result of the build. A subshell checks every second
+        # how long the engine runs and when its transcript last grew.
+        command = (
+            "echo '~{key} {started}' $$ > {jobname}.key; "
+            "{engine} -ini -interaction=batchmode -jobname={temporary} "
+            "{options}'&{engine}' mylatexformat.ltx {texfile} & engine=$!; "
+            "(start=$(date +%s); last=$start; size=; "
+            "while sleep 1 && kill -0 $engine 2>/dev/null; do "
+            "now=$(date +%s); "
+            "current=$(wc -c < {temporary}.log 2>/dev/null); "
+            "if [ \"$current\" != \"$size\" ]; then "
+            "size=$current; last=$now; fi; "
+            "if [ {total} -gt 0 -a $((now - start)) -gt {total} ] || "
+            "[ {idle} -gt 0 -a $((now - last)) -gt {idle} ]; then "
+            "kill $engine; fi; done) & "
+            "wait $engine && "
+            "mv {temporary}.fmt {jobname}.fmt && "
+            "echo {key} > {jobname}.key || echo '!{key}' > {jobname}.key; "
+            "mv {temporary}.log {jobname}.log").format(
+                engine=self.engine,
+                options='{} '.format(self.options) if self.options else '',
+                temporary=shellquote(temporary),
+                texfile=shellquote(self.texfile),
+                jobname=shellquote(self.jobname),
+                key=self.key,
+                started=started,
+                idle=int(watchdog.idle_limit or 0),
+                total=int(watchdog.total_limit or 0))
+        with open(devnull, 'r+b') as null:
+            Popen(command,
+                  shell=True,
+                  stdin=null,
+                  stdout=null,
+                  stderr=null,
+                  close_fds=True,
+                  **NEW_SESSION)
+
+    def failed(self, parser, stopped=False):
+        """Check if a run of LaTeX failed since it could not use the format.
+
+        The run failed to load the format if it did not write a transcript,
+        or if it reported a fatal error before the body of the document,
+        i.e. while loading the format or in the part of the preamble after
+        ``\\endofdump``.
+
+        Arguments:
+
+            parser
+
+                The ``LaTexParser`` that read the output of the run.
+
+            stopped
+
+                Specifies if we stopped the run ourselves. Such a run does
+                not write a transcript either, so then only its fatal errors
+                count.
+
+        Returns: ``bool``
+
+        Examples:
+
+            >>> from collections import namedtuple
+            >>> from os import getcwd
+            >>> Parser = namedtuple('Parser', 'done fatal_error marks')
+            >>> preamble_format = PreambleFormat('Tests/TeX/packages.tex',
+            ...                                  'pdflatex')
+            >>> preamble_format.failed(Parser(False, False, set()))
+            True
+            >>> preamble_format.failed(Parser(False, False, set()), True)
+            False
+            >>> texfile = join(getcwd(), 'Tests/TeX/packages.tex')
+            >>> preamble_format.failed(Parser(True, True, {
+            ...     (texfile, 2, 'error', 'Emergency stop')}))
+            True
+            >>> preamble_format.failed(Parser(True, True, {
+            ...     (texfile, 12, 'error', 'Emergency stop')}))
+            False
+
+        """
+        if not parser.done and not stopped:
+            return True
+        if not parser.fatal_error:
+            return False
+        try:
+            preamble, _ = read_until_document(self.texfile)
+        except (IOError, OSError):
+            return True
+        document = preamble.count(b'\n') + 1
+        texfile = normpath(join(getcwd(), self.texfile))
+        return not any(
+            kind == 'error' and not filepath.endswith(('.sty', '.cls')) and (
+                normpath(filepath) != texfile or line >= document)
+            for filepath, line, kind, _ in parser.marks)
+
+    def invalidate(self):
+        """Stop using the format for the current preamble."""
+        self.store('!')
+
+    def store(self, prefix, *details):
+        try:
+            with open('{}.key'.format(self.jobname), 'w',
+                      encoding='ascii') as file:
+                file.write(' '.join(['{}{}'.format(prefix, self.key)] + [
+                    '{}'.format(detail) for detail in details
+                ]) + '\n')
+        except (IOError, OSError):
+            pass
@@ -0,0 +1,603 @@
+# -*- coding: utf-8 -*-
+"""This module stores the dependency graph of a tex project.
+
+A project consists of a master file and all the files it includes via
+commands such as ``\\input``, ``\\include``, ``\\subfile`` and ``\\import``.
+For each of these files the graph stores the ``%!TEX`` directives, the
+included files, the packages, the bibliography databases and the graphics
+the file references.
+
+We store the graph of a project next to its master file. Every file in the
+graph remembers its modification time, size and hash. If the modification
+time and the size of a file did not change since we stored the graph, then
+we reuse the stored information without reading the file again. This way an
+update of the graph for an unchanged project only needs one ``stat`` call
+for each of its files.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from hashlib import sha1
+from io import open
+from os import stat
+from os.path import (basename, dirname, isfile, join, normpath, realpath,
+                     relpath, splitext)
+from pickle import dump, load
+from threading import Condition, Event as Signal, Lock, Thread
+
+from tex import expand_names, scan_tex
+
+# -- Global Variables ---------------------------------------------------------
+
+# The version of the stored graph. Increase this value whenever the stored
+# information changes, so we do not reuse graphs of older versions.
+GRAPH_VERSION = 1
+
+# The commands of the package ``import`` and the command we use for the file
+# they include
+IMPORT_COMMANDS = {
+    'import': 'input',
+    'subimport': 'input',
+    'inputfrom': 'input',
+    'subinputfrom': 'input',
+    'includefrom': 'include',
+    'subincludefrom': 'include'
+}
+
+# Commands that include another tex file
+INPUT_COMMANDS = {'input', 'include', 'subfile'}
+
+# Commands that load a package
+PACKAGE_COMMANDS = {'usepackage', 'RequirePackage'}
+
+# Commands that reference a bibliography database
+BIBLIOGRAPHY_COMMANDS = {'bibliography', 'addbibresource'}
+
+# The maximum number of files we read at the same time
+SCAN_THREADS = 8
+
+# -- Functions ----------------------------------------------------------------
+
+
+def map_concurrently(function, arguments, threads=SCAN_THREADS):
+    """Apply ``function`` to ``arguments`` in up to ``threads`` threads.
+
+    We return the results in the order of ``arguments``. As soon as the
+    caller stops iterating over the results, the threads do not start to
+    work on further arguments.
+
+    Arguments:
+
+        function
+
+            The function we apply to each argument.
+
+        arguments
+
+            A list of arguments.
+
+        threads
+
+            The maximum number of threads that work at the same time.
+
+    Returns: ``generator``
+
+    Examples:
+
+        >>> for square in map_concurrently(lambda number: number ** 2,
+        ...                                [1, 2, 3, 4]):
+        ...     print(square)
+        1
+        4
+        9
+        16
+        >>> next(map_concurrently(lambda number: 1 / number, [0, 1]))
+        ... # doctest: +IGNORE_EXCEPTION_DETAIL
+        Traceback (most recent call last):
+        ...
+        ZeroDivisionError: division by zero
+
+    """
+    # Starting threads does not pay off for a single argument
+    if len(arguments) < 2 or threads < 2:
+        for argument in arguments:
+            yield function(argument)
+        return
+
+    results = {}
+    pending = iter(enumerate(arguments))
+    condition = Condition()
+    stopped = Signal()
+
+    def work():
+        while not stopped.is_set():
+            with condition:
+                index, argument = next(pending, (None, None))
+            if index is None:
+                return
+            try:
+                result = (True, function(argument))
+            except Exception as error:
+                result = (False, error)
+            with condition:
+                results[index] = result
+                condition.notify()
+
+    for _ in range(min(len(arguments), threads)):
+        worker = Thread(target=work)
+        worker.daemon = True
+        worker.start()
+    try:
+        for index in range(len(arguments)):
+            with condition:
+                while index not in results:
+                    condition.wait()
+                success, result = results.pop(index)
+            if not success:
+                raise result
+            yield result
+    finally:
+        stopped.set()
+
+
+# -- Classes ------------------------------------------------------------------
+
+
+class ProjectGraph(object):
+    """Store the files of a tex project and the files they reference.
+
+    Examples:
+
+        >>> from shutil import rmtree
+        >>> from tempfile import mkdtemp
+        >>> storage = mkdtemp()
+        >>> graph = ProjectGraph('Tests/TeX/packages.tex',
+        ...                      join(storage, 'packages.lbd'))
+        >>> graph.update()
+        >>> for filepath in graph.files():
+        ...     print(relpath(filepath, graph.directory))
+        packages.tex
+        input/packages_input1.tex
+        input/packages_input2.tex
+        >>> for package in sorted(graph.packages()):
+        ...     print(package)
+        booktabs
+        csquotes
+        framed
+        mathtools
+        polyglossia
+        xcolor
+        >>> print(graph.directives()['TS-program'])
+        xelatex
+
+        A stored graph does not read unchanged files again
+
+        >>> graph = ProjectGraph('Tests/TeX/packages.tex',
+        ...                      join(storage, 'packages.lbd'))
+        >>> graph.update()
+        >>> graph.scanned
+        0
+
+        >>> graph = ProjectGraph('Tests/TeX/include.tex',
+        ...                      join(storage, 'include.lbd'))
+        >>> graph.update()
+        >>> for name in graph.includes():
+        ...     print(name)
+        input/chapter1
+        input/chapter2
+        input/chapter3
+        >>> rmtree(storage)
+
+    """
+
+    def __init__(self, master, filepath=None):
+        """Load the stored graph of the project with the master file
+        ``master``.
+
+        Arguments:
+
+            master
+
+                The path of the master file of the project.
+
+            filepath
+
+                The location of the stored graph. If this value is ``None``,
+                then we use the file ``.name.lbd`` next to the master file
+                ``name.tex``.
+
+        """
+        self.master = normpath(realpath(master))
+        self.directory = dirname(self.master)
+        self.filepath = filepath if filepath else join(
+            self.directory,
+            '.{}.lbd'.format(splitext(basename(self.master))[0]))
+        self.nodes = {}
+        self.order = []
+        self.edges = []
+        self.chapters = []
+        self.scanned = 0
+        self.lock = Lock()
+        try:
+            with open(self.filepath, 'rb') as storage:
+                version, nodes = load(storage)
+            if version == GRAPH_VERSION:
+                self.nodes = nodes
+        except (IOError, OSError, ValueError, EOFError, TypeError):
+            pass
+
+    def node(self, filepath):
+        """Return the stored information about the file at ``filepath``.
+
+        We only read the file, if its modification time or its size changed.
+        If the file was only touched, then its hash stays the same and we
+        keep the stored information.
+
+        Returns: ``{str: object}``
+
+            The information about the file or ``None`` if the file does not
+            exist.
+
+        """
+        try:
+            status = stat(filepath)
+        except (IOError, OSError):
+            return None
+        signature = (status.st_mtime, status.st_size)
+        node = self.nodes.get(filepath)
+        if node is not None and node['signature'] == signature:
+            return node
+        try:
+            with open(filepath, 'rb') as source:
+                content = source.read()
+        except (IOError, OSError):
+            return None
+        checksum = sha1(content).hexdigest()
+        if node is None or node['hash'] != checksum:
+            node = scan_tex(content)
+            node['hash'] = checksum
+            with self.lock:
+                self.scanned += 1
+        node['signature'] = signature
+        self.nodes[filepath] = node
+        return node
+
+    def update(self):
+        """Update the graph and store it, if one of its files changed.
+
+        We follow the references of the master file and of all files it
+        includes, one level of the include graph at a time. Reading the files
+        usually takes much longer than scanning them, e.g. on a network file
+        system, so we read the files a level includes concurrently, each of
+        them only once. We then process the level in the order a sequential
+        search would use.
+
+        Files that the project does not include any more are removed from
+        the graph.
+
+        """
+        stored = dict((filepath, node['signature'])
+                      for filepath, node in self.nodes.items())
+        checked = {}
+
+        def lookup(filepath):
+            if filepath not in checked:
+                checked[filepath] = self.node(filepath)
+            return checked[filepath]
+
+        def prefetch(filepaths):
+            missing = []
+            for filepath in filepaths:
+                if filepath not in checked and filepath not in missing:
+                    missing.append(filepath)
+            for filepath, node in zip(missing,
+                                      map_concurrently(self.node, missing)):
+                checked[filepath] = node
+
+        self.order, self.edges, self.chapters = [], [], []
+        pending = [(self.master, self.directory, True)]
+        visited = set()
+        while pending:
+            level, pending = pending, []
+            prefetch(filepath for filepath, _, _ in level)
+            prefetch(candidate for filepath, base, _ in level
+                     for candidate in self.inputs(checked[filepath],
+                                                  filepath, base))
+            for filepath, base, preamble in level:
+                self.visit(filepath, base, preamble, lookup, pending,
+                           visited)
+
+        for filepath in set(self.nodes) - set(self.order):
+            del self.nodes[filepath]
+        current = dict((filepath, node['signature'])
+                       for filepath, node in self.nodes.items())
+        if current != stored:
+            self.save()
+
+    def inputs(self, node, filepath, base):
+        """Return the possible locations of the tex files ``node`` includes.
+
+        Arguments:
+
+            node
+
+                The stored information about the file at ``filepath``, or
+                ``None`` if the file does not exist.
+
+            base
+
+                The directory relative to which the file includes files.
+
+        Returns: ``[str]``
+
+        """
+        if node is None:
+            return []
+        locations = []
+        for command, directory, name, _ in node['references']:
+            child_command = IMPORT_COMMANDS.get(command, command)
+            if child_command in INPUT_COMMANDS:
+                locations.extend(
+                    self.candidates(
+                        child_command,
+                        join(self.base(command, directory, base, filepath),
+                             name)))
+        return locations
+
+    def visit(self, filepath, base, preamble, lookup, pending, visited):
+        """Add the file at ``filepath`` and its references to the graph.
+
+        Arguments:
+
+            preamble
+
+                Specifies if the file is part of the preamble of the
+                project.
+
+            lookup
+
+                The function that returns the stored information about a
+                file.
+
+            pending
+
+                The files we still have to visit. We append the files
+                ``filepath`` includes.
+
+            visited
+
+                The files and their ``preamble`` values we already visited.
+
+        """
+        node = lookup(filepath)
+        if node is None or (filepath, preamble) in visited:
+            return
+        visited.add((filepath, preamble))
+        if filepath not in self.order:
+            self.order.append(filepath)
+        for command, directory, name, in_preamble in node['references']:
+            in_preamble = preamble and in_preamble
+            child_command = IMPORT_COMMANDS.get(command, command)
+            if child_command in INPUT_COMMANDS:
+                child_base = self.base(command, directory, base, filepath)
+                candidates = self.candidates(child_command,
+                                             join(child_base, name))
+                target = next((candidate for candidate in candidates
+                               if lookup(candidate) is not None), None)
+                if target is None:
+                    target = self.search(child_command, command, name,
+                                         candidates[0])
+                pending.append((target, child_base, in_preamble))
+                if child_command == 'include':
+                    # ``\includeonly`` has to use the name of the file
+                    # exactly as ``\include`` does
+                    self.chapters.append(
+                        name if child_base == self.directory else
+                        splitext(relpath(target, self.directory))[0])
+            else:
+                target = self.target(command, name, base)
+            self.edges.append((filepath, command, target, in_preamble))
+
+    def base(self, command, directory, base, filepath):
+        """Return the directory relative to which ``command`` includes files.
+
+        Returns: ``str``
+
+        """
+        if command in {'import', 'inputfrom', 'includefrom'}:
+            return normpath(join(self.directory, directory))
+        if command in {'subimport', 'subinputfrom', 'subincludefrom'}:
+            return normpath(join(base, directory))
+        if command == 'subfile':
+            return dirname(filepath)
+        return base
+
+    @staticmethod
+    def search(child_command, command, name, default):
+        """Return the location of a tex file TeX finds via ``TEXINPUTS``.
+
+        TeX searches files it reads via ``\\input`` and ``\\include`` in
+        the directories of the TeX distribution and of ``TEXINPUTS``, if
+        they do not exist relative to the current directory. The commands of
+        the package ``import`` only read files from the directory they
+        specify.
+
+        Returns: ``str``
+
+            The absolute path of the file or ``default`` if TeX can not find
+            the file.
+
+        """
+        if command != child_command:
+            return default
+        filename = name if name.endswith('.tex') else name + '.tex'
+        location = expand_names([filename])[filename]
+        return (normpath(realpath(location))
+                if location != filename or isfile(filename) else default)
+
+    @staticmethod
+    def target(command, name, base):
+        """Return the file a command that does not include tex code
+        references.
+
+        Returns: ``str``
+
+            The name of the package for package commands and the location
+            of the referenced files otherwise.
+
+        """
+        if command in PACKAGE_COMMANDS:
+            return name
+        return ','.join(
+            normpath(join(base, part.strip())) for part in name.split(','))
+
+    @staticmethod
+    def candidates(command, filepath):
+        """Return the possible locations of a tex file included by
+        ``command``.
+
+        Returns: ``[str]``
+
+        """
+        filepath = normpath(filepath)
+        if command == 'include' or filepath.endswith('.tex'):
+            return [filepath if filepath.endswith('.tex') else filepath +
+                    '.tex']
+        return [filepath + '.tex', filepath]
+
+    def save(self):
+        """Store the graph next to the master file."""
+        try:
+            with open(self.filepath, 'wb') as storage:
+                dump((GRAPH_VERSION, self.nodes), storage, protocol=2)
+        except (IOError, OSError):
+            print('<p class="warning"> Could not write project file {}!'
+                  '</p>'.format(self.filepath))
+
+    def files(self):
+        """Return the tex files of the project.
+
+        Returns: ``[str]``
+
+            The absolute paths of the files in the order we found them.
+
+        """
+        return list(self.order)
+
+    def directives(self, filepath=None):
+        """Return the ``%!TEX`` directives of ``filepath``.
+
+        If ``filepath`` is ``None``, then we return the directives of the
+        master file.
+
+        Returns: ``{str: str}``
+
+        """
+        filepath = self.master if filepath is None else normpath(
+            realpath(filepath))
+        node = self.nodes.get(filepath)
+        return dict(node['directives']) if node else {}
+
+    def packages(self):
+        """Return the packages the preamble of the project loads.
+
+        Returns: ``{str}``
+
+        Examples:
+
+            Only packages the preamble loads count, even if they come from
+            an included file
+
+            >>> from os import chdir, getcwd, mkdir
+            >>> from shutil import rmtree
+            >>> from tempfile import mkdtemp
+            >>> directory = getcwd()
+            >>> chdir(mkdtemp())
+            >>> def write(filename, content):
+            ...     with open(filename, 'w') as output:
+            ...         _ = output.write(content)
+            >>> mkdir('styles')
+            >>> write('thesis.tex', '\\\\documentclass{article}\\n'
+            ...       '\\\\usepackage{amsmath, booktabs}\\n'
+            ...       '\\\\input{styles/settings}\\n'
+            ...       '\\\\begin{document}\\\\input{chapter}'
+            ...       '\\\\end{document}')
+            >>> write('styles/settings.tex', '\\\\usepackage{siunitx}')
+            >>> write('chapter.tex', '\\\\RequirePackage{tikz}')
+            >>> graph = ProjectGraph('thesis.tex')
+            >>> graph.update()
+            >>> for package in sorted(graph.packages()):
+            ...     print(package)
+            amsmath
+            booktabs
+            siunitx
+            >>> rmtree(getcwd())
+            >>> chdir(directory)
+
+        """
+        return {
+            package.strip()
+            for _, command, names, preamble in self.edges
+            if command in PACKAGE_COMMANDS and preamble
+            for package in names.split(',') if package.strip()
+        }
+
+    def includes(self):
+        """Return the files the project includes via ``\\include``.
+
+        Returns: ``[str]``
+
+            The names of the files as used in the ``\\include`` commands.
+            For files included via the package ``import`` we use the name
+            relative to the directory of the master file.
+
+        """
+        return list(self.chapters)
+
+    def bibliographies(self):
+        """Return the bibliography databases of the project.
+
+        Returns: ``[str]``
+
+        Examples:
+
+            >>> from shutil import rmtree
+            >>> from tempfile import mkdtemp
+            >>> storage = mkdtemp()
+            >>> graph = ProjectGraph('Tests/TeX/external_bibliography.tex',
+            ...                      join(storage, 'graph.lbd'))
+            >>> graph.update()
+            >>> for database in graph.bibliographies():
+            ...     print(relpath(database, graph.directory))
+            references.bib
+            >>> rmtree(storage)
+
+        """
+        databases = []
+        for _, command, target, _ in self.edges:
+            if command not in BIBLIOGRAPHY_COMMANDS:
+                continue
+            for database in target.split(','):
+                if command == 'bibliography' and not database.endswith('.bib'):
+                    database += '.bib'
+                databases.append(database)
+        return databases
+
+    def graphics(self):
+        """Return the graphics the project includes.
+
+        Returns: ``[str]``
+
+            The locations of the graphics as used in ``\\includegraphics``.
+            They might not contain the extension of the graphic files.
+
+        """
+        return [
+            target for _, command, target, _ in self.edges
+            if command == 'includegraphics'
+        ]
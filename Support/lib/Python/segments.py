@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+"""This module contains code to parse finished latexmk logs in parallel.
+
+A latexmk log contains the output of several runs of the tools latexmk calls.
+Every run starts with a line of the form ``Run number 2 of rule 'pdflatex'``.
+We split the log at these lines and parse each segment in a separate process
+using ``LaTexMkParser``. Afterwards we merge the events and the state of the
+segments in order.
+
+Since the parsers handle every segment on its own, we need to check that
+the split did not change the result: A nested parser (e.g. for a run of
+``pdflatex``) must not read past the end of its segment. If this happens,
+then we join the segment with the next one and parse it again.
+
+"""
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from multiprocessing import Pool
+from re import compile, MULTILINE
+
+from events import HTMLRenderer, EventList
+from logreader import Decoder, MappedLog, NON_ASCII, is_wrapped
+from parsing import LaTexMkParser
+
+# -- Global Variables ---------------------------------------------------------
+
+# Match the start of a new run in a latexmk log
+RUN_START = compile(b'^Run number', MULTILINE)
+
+# The minimum number of bytes a segment should contain. For smaller logs
+# starting the worker processes takes longer than parsing the log.
+MINIMUM_SEGMENT_SIZE = 1 << 20
+
+# -- Functions ----------------------------------------------------------------
+
+
+def split_log(filepath, minimum_size=MINIMUM_SEGMENT_SIZE):
+    """Split the latexmk log at ``filepath`` into segments.
+
+    All segments except the first one start with the line that announces a
+    new run. We merge runs until a segment contains at least
+    ``minimum_size`` bytes.
+
+    Arguments:
+
+        filepath
+
+            The location of the latexmk log.
+
+        minimum_size
+
+            The minimum number of bytes a segment should contain.
+
+    Returns: ``[(int, int)]``
+
+    Examples:
+
+        >>> filepath = 'Tests/Log/latexmk_external_bibliography_biber.log'
+        >>> for start, end in split_log(filepath, 0):
+        ...     print(start, end)
+        0 350
+        350 3869
+        3869 4963
+        4963 8100
+        8100 11120
+        >>> split_log(filepath)
+        [(0, 11120)]
+
+    """
+    with MappedLog(filepath) as log:
+        starts = [0]
+        for matching in RUN_START.finditer(log.data):
+            start = matching.start()
+            # Only split after lines TeX did not wrap
+            previous = log.data.rfind(b'\n', 0, start - 1) + 1
+            if (start - starts[-1] >= max(minimum_size, 1)
+                    and not is_wrapped(log.data[previous:start])):
+                starts.append(start)
+        size = log.end
+    if size - starts[-1] < minimum_size and len(starts) > 1:
+        starts.pop()
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def detect_encoding(filepath):
+    """Return the encoding a sequential parser would use for the log.
+
+    The parser detects the encoding from the start of the log or, if the
+    start only contains ASCII characters, from the first line that contains
+    other characters.
+
+    Returns: ``str``
+
+        The name of the encoding or ``None`` if the log only contains ASCII
+        characters.
+
+    Examples:
+
+        >>> from os import close, remove
+        >>> from tempfile import mkstemp
+        >>> handle, logfile = mkstemp()
+        >>> close(handle)
+        >>> with open(logfile, 'wb') as log:
+        ...     _ = log.write(b'Latexmk: Padding\\n' * 5000 +
+        ...                   'Größe'.encode('utf-8'))
+        >>> print(detect_encoding(logfile))
+        utf_8
+        >>> remove(logfile)
+        >>> print(detect_encoding('Tests/Log/latexmk_makeindex.log'))
+        None
+
+    """
+    with MappedLog(filepath) as log:
+        decoder = log.decoder
+        if decoder.encoding is None:
+            non_ascii = NON_ASCII.search(log.data)
+            if non_ascii:
+                start = log.data.rfind(b'\n', 0, non_ascii.start()) + 1
+                end = log.data.find(b'\n', non_ascii.start())
+                decoder.detect(log.data[start:end if end >= 0 else log.end])
+        return decoder.encoding
+
+
+def parse_segment(task):
+    """Parse a single segment of a latexmk log.
+
+    This function runs inside the worker processes.
+
+    Arguments:
+
+        task
+
+            A tuple containing the location of the log, the start and end
+            offset of the segment, the ``verbose`` setting, the name of the
+            tex file that produced the log and the encoding of the log.
+
+    Returns: ``SegmentResult``
+
+    """
+    filepath, start, end, verbose, filename, encoding = task
+    events = EventList()
+    with SegmentLog(filepath, start, end) as log:
+        # Decode every segment like the parser of the whole log would
+        log.decoder.encoding = encoding
+        parser = SegmentParser(log, verbose, filename, events)
+        # Let the first run of this segment produce the summary for the
+        # previous run. We fill in the numbers when we merge the results.
+        parser.number_runs = 1 if start else 0
+        parser.parse_stream()
+        # The parser at the top level reads the end of the segment exactly
+        # once. If a nested parser reached the end too, then it would have
+        # read data of the next segment in a sequential run.
+        clean = log.exhausted == 1
+    return SegmentResult(parser, events, clean)
+
+
+# -- Classes ------------------------------------------------------------------
+
+
+class SegmentLog(MappedLog):
+    """A memory mapped part of a log, counting reads at the end."""
+
+    def __init__(self, filepath, start, end):
+        super(SegmentLog, self).__init__(filepath, end)
+        self.seek(start)
+        self.exhausted = 0
+
+    def readline(self):
+        line = super(SegmentLog, self).readline()
+        if not line:
+            self.exhausted += 1
+        return line
+
+    def read_statement(self, prefilter=None):
+        statement = super(SegmentLog, self).read_statement(prefilter)
+        if not statement:
+            self.exhausted += 1
+        return statement
+
+
+class SegmentParser(LaTexMkParser):
+    """Parse a segment of a latexmk log.
+
+    In addition to ``LaTexMkParser`` this class records which parts of the
+    resume boundary still depend on the state of previous segments.
+
+    """
+
+    def __init__(self, input_stream, verbose, filename, sink=None):
+        self.run_started = False
+        self.latex_started = False
+        # Specifies if the counters and the marks stored in ``boundary``
+        # belong to the previous segment
+        self.inherited = (True, True)
+        super(SegmentParser, self).__init__(input_stream, verbose, filename,
+                                            sink)
+
+    def set_boundary(self, offset=None):
+        super(SegmentParser, self).set_boundary(offset)
+        self.inherited = (not self.run_started, not self.latex_started)
+
+    def new_run(self, matching, line):
+        super(SegmentParser, self).new_run(matching, line)
+        self.run_started = True
+
+    def start_latex(self, matching, line):
+        super(SegmentParser, self).start_latex(matching, line)
+        self.latex_started = True
+
+
+class SegmentResult(object):
+    """The events and the final state of a parsed segment."""
+
+    def __init__(self, parser, events, clean):
+        self.events = list(events)
+        self.clean = clean
+        self.done = parser.done
+        self.number_errors = parser.number_errors
+        self.number_warnings = parser.number_warnings
+        self.number_runs = parser.number_runs
+        self.marks = parser.marks
+        self.latex_started = parser.latex_started
+        self.boundary = parser.boundary
+        self.inherited = parser.inherited
+        self.fallbacks = parser.decoder.fallbacks
+
+
+class ParallelLaTexMkParser(object):
+    """Parse a finished latexmk log using several processes.
+
+    After calling ``parse_stream`` the attributes ``done``, ``marks``,
+    ``number_runs`` and ``boundary`` contain the same values as the ones of
+    a ``LaTexMkParser`` that parsed the whole log. The parser sends the events
+    of all segments to its sink in order. The attribute ``decoder`` tells us
+    which encoding the log uses.
+
+    """
+
+    def __init__(self,
+                 filepath,
+                 verbose,
+                 filename,
+                 sink=None,
+                 processes=None,
+                 minimum_size=MINIMUM_SEGMENT_SIZE):
+        """Initialize a new parallel parser.
+
+        Arguments:
+
+            filepath
+
+                The location of the latexmk log.
+
+            verbose
+
+                Specifies if the parser should produce output for all
+                messages of the log.
+
+            filename
+
+                The name of the tex file that produced the log.
+
+            sink
+
+                The object that receives the events produced by the parser.
+                If this value is ``None``, then the parser writes HTML to the
+                standard output.
+
+            processes
+
+                The number of worker processes. If this value is ``None``,
+                then we use one process per CPU.
+
+            minimum_size
+
+                The minimum number of bytes a segment should contain.
+
+        """
+        self.filepath = filepath
+        self.verbose = verbose
+        self.filename = filename
+        self.sink = HTMLRenderer() if sink is None else sink
+        self.processes = processes
+        self.minimum_size = minimum_size
+        self.done = False
+        self.fatal_error = False
+        self.number_errors = 0
+        self.number_warnings = 0
+        self.number_runs = 0
+        self.marks = set()
+        self.decoder = Decoder()
+        self.boundary = (0, {
+            'number_errors': 0,
+            'number_warnings': 0,
+            'number_runs': 0,
+            'marks': set(),
+        })
+
+    def parse_stream(self):
+        """Parse the log and return the same status as ``LaTexMkParser``.
+
+        Returns: ``(bool, int, int)``
+
+        Examples:
+
+            >>> filepath = 'Tests/Log/latexmk_external_bibliography_biber.log'
+            >>> events = EventList()
+            >>> with MappedLog(filepath) as log:
+            ...     parser = LaTexMkParser(log, False, filepath, events)
+            ...     status = parser.parse_stream()
+            >>> parallel_events = EventList()
+            >>> parallel_parser = ParallelLaTexMkParser(
+            ...     filepath, False, filepath, parallel_events, 2, 0)
+            >>> parallel_parser.parse_stream() == status
+            True
+            >>> [(event.kind, event.message, event.arguments)
+            ...  for event in events] == [
+            ...  (event.kind, event.message, event.arguments)
+            ...  for event in parallel_events]
+            True
+            >>> parallel_parser.number_runs
+            4
+            >>> parallel_parser.boundary == parser.boundary
+            True
+
+            Decode all segments with the encoding of the whole log
+
+            >>> from os import close, remove
+            >>> from tempfile import mkstemp
+            >>> with open(filepath, 'rb') as log:
+            ...     lines = log.read().split(b'\\n')
+            >>> lines[1:1] = ([b'Latexmk: Padding'] * 5000 +
+            ...               ['Latexmk: Größe'.encode('mac_roman')])
+            >>> handle, logfile = mkstemp()
+            >>> close(handle)
+            >>> with open(logfile, 'wb') as log:
+            ...     _ = log.write(b'\\n'.join(lines).replace(
+            ...         b'Deltron3030', 'Größe'.encode('utf-8')))
+            >>> events, parallel_events = EventList(), EventList()
+            >>> with MappedLog(logfile) as log:
+            ...     _ = LaTexMkParser(log, False, filepath,
+            ...                       events).parse_stream()
+            >>> _ = ParallelLaTexMkParser(logfile, False, filepath,
+            ...                           parallel_events, 2,
+            ...                           0).parse_stream()
+            >>> [event.message for event in events] == [
+            ...  event.message for event in parallel_events]
+            True
+            >>> remove(logfile)
+
+        """
+        segments = split_log(self.filepath, self.minimum_size)
+        if len(segments) > 1:
+            self.decoder.encoding = detect_encoding(self.filepath)
+            pool = Pool(self.processes)
+            try:
+                results = self.parse_segments(pool, segments)
+            finally:
+                pool.close()
+                pool.join()
+            self.merge(results)
+            return self.fatal_error, self.number_errors, self.number_warnings
+
+        with MappedLog(self.filepath) as log:
+            parser = LaTexMkParser(log, self.verbose, self.filename,
+                                   self.sink)
+            status = parser.parse_stream()
+        self.done = parser.done
+        self.number_errors = parser.number_errors
+        self.number_warnings = parser.number_warnings
+        self.number_runs = parser.number_runs
+        self.marks = parser.marks
+        self.boundary = parser.boundary
+        self.decoder = parser.decoder
+        return status
+
+    def parse_segments(self, pool, segments):
+        """Parse ``segments`` using the worker processes of ``pool``.
+
+        If the parser of a segment read past the end of the segment, then we
+        join the segment with its successor and parse the result again.
+        Afterwards ``segments`` only contains segments we can merge.
+
+        Returns: ``[SegmentResult]``
+
+        """
+        results = {}
+        while len(segments) > 1:
+            pending = [segment for segment in segments
+                       if segment not in results]
+            results.update(
+                zip(pending,
+                    pool.map(parse_segment, [
+                        (self.filepath, start, end, self.verbose,
+                         self.filename, self.decoder.encoding)
+                        for start, end in pending
+                    ])))
+
+            joined = segments[:1]
+            for previous, segment in zip(segments, segments[1:]):
+                if results[previous].clean or results[previous].done:
+                    joined.append(segment)
+                else:
+                    joined[-1] = (joined[-1][0], segment[1])
+            if joined == segments:
+                break
+            segments[:] = joined
+        return [results[segment] for segment in segments]
+
+    def merge(self, results):
+        """Merge the results of the segments in order."""
+        for index, result in enumerate(results):
+            events = result.events
+            # The number of runs before the current segment, minus the run
+            # we added in ``parse_segment``
+            runs_offset = self.number_runs - (1 if index else 0)
+            if index:
+                summary = events.pop(0)
+                if self.number_runs > 0:
+                    summary.arguments = (self.number_errors,
+                                         self.number_warnings)
+                    events.insert(0, summary)
+
+            offset, state = result.boundary
+            counters_inherited, marks_inherited = (result.inherited
+                                                   if index else
+                                                   (False, False))
+            self.boundary = (offset, {
+                'number_errors': (self.number_errors if counters_inherited
+                                  else state['number_errors']),
+                'number_warnings': (self.number_warnings
+                                    if counters_inherited else
+                                    state['number_warnings']),
+                'number_runs': state['number_runs'] + runs_offset,
+                'marks': (set(self.marks)
+                          if marks_inherited else state['marks']),
+            })
+
+            self.number_errors = result.number_errors
+            self.number_warnings = result.number_warnings
+            self.number_runs = result.number_runs + runs_offset
+            if result.latex_started or not index:
+                self.marks = result.marks
+            self.decoder.fallbacks += result.fallbacks
+
+            for event in events:
+                self.sink.emit(event)
+            self.sink.flush()
+            if result.done:
+                self.done = True
+                break
+        return True
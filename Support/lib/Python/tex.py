@@ -13,16 +13,46 @@ from __future__ import unicode_literals
 from io import open
 from os import chdir, getenv, EX_OSFILE  # noqa
 from os.path import basename, dirname, isfile, join, normpath, realpath
-from pipes import quote as shellquote
 from re import compile
-from subprocess import Popen, PIPE
-from sys import exit, stdout
+from sys import exit
+
+from kpathsea import Resolver
 
 # -- Global Variables ---------------------------------------------------------
 
 # The list of encodings we try to open files with.
 encodings = ['utf_8', 'mac_roman', 'latin_1', 'gb2312', 'cp1251', 'cp1252']
 
+# The resolver we use to look up files in the TeX distribution. We create it
+# when we need it for the first time.
+resolver = None
+
+# The number of bytes we read at once while we search for the end of the
+# preamble
+BLOCK_SIZE = 1 << 16
+
+# Match a ``%!TEX`` directive
+DIRECTIVE = compile(br'%\s*!T[E|e]X\s+([\w-]+)\s*=\s*(.+)')
+
+# The number of lines at the start of a file that may contain directives
+DIRECTIVE_LINES = 20
+
+# Match a comment
+COMMENT = compile(br'(?<!\\)%[^\n]*')
+
+# Match the end of the preamble
+BEGIN_DOCUMENT = compile(br'\\begin\s*\{document\}')
+
+# Match commands that reference another file. The first alternative matches
+# commands with a single file argument, the second one the commands of the
+# package ``import``, which take a directory and a file name.
+REFERENCE = compile(
+    br'\\(?:(input|include|subfile|usepackage|RequirePackage|bibliography|'
+    br'addbibresource|includegraphics)\*?\s*(?:\[[^\]]*\]\s*)?'
+    br'\{([^}#]+)\}|'
+    br'(import|subimport|inputfrom|subinputfrom|includefrom|'
+    br'subincludefrom)\*?\s*\{([^}#]*)\}\s*\{([^}#]+)\})')
+
 # -- Exit Codes ---------------------------------------------------------------
 
 EXIT_LOOP_IN_TEX_ROOT = -1
@@ -55,16 +85,188 @@ def expand_name(filename, program='pdflatex'):
         non_existent_file.tex
 
     """
-    if isfile(filename):
-        return filename
-    stdout.flush()
-    run_object = Popen("kpsewhich -progname='{}' {}".format(
-        program, shellquote(filename)),
-                       shell=True,
-                       stdout=PIPE,
-                       universal_newlines=True)
-    expanded_filepath = run_object.stdout.read().strip()
-    return expanded_filepath if expanded_filepath else filename
+    return expand_names([filename], program)[filename]
+
+
+def expand_names(filenames, program='pdflatex'):
+    """Get the expanded file names for multiple tex files.
+
+    We look up all the files that do not exist in the current directory with
+    a single call of ``kpsewhich``.
+
+    Arguments:
+
+        filenames
+
+                The names of the files we want to expand.
+
+        program
+
+                The name of the tex program for which we want to expand the
+                names of the files.
+
+    Returns: ``{str: str}``
+
+        A dictionary mapping every name to its expanded name. If we can not
+        find a file, then we map its name to itself.
+
+    Examples:
+
+        >>> names = expand_names(['Tests/TeX/text.tex',
+        ...                       'non_existent_file.tex'])
+        >>> for name in sorted(names):
+        ...     print(names[name])
+        Tests/TeX/text.tex
+        non_existent_file.tex
+
+    """
+    global resolver
+    expanded = {filename: filename for filename in filenames
+                if isfile(filename)}
+    missing = [filename for filename in filenames if filename not in expanded]
+    if missing:
+        if resolver is None:
+            resolver = Resolver()
+        for filename, location in resolver.lookup(missing, program).items():
+            expanded[filename] = location if location else filename
+    return expanded
+
+
+def decode(data):
+    """Decode the bytes ``data`` using the first encoding that fits.
+
+    Returns: ``str``
+
+    Examples:
+
+        >>> print(decode(b'Gr\\xc3\\xbc\\xc3\\x9fe'))
+        Grüße
+        >>> print(decode(b'Gr\\x9fe')) # Mac OS Roman
+        Grüe
+
+    """
+    for encoding in encodings:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', 'replace')
+
+
+def read_until_document(filepath, block_size=BLOCK_SIZE):
+    """Read the file at ``filepath`` until the start of the document.
+
+    We read the file in blocks and stop as soon as we find a
+    ``\\begin{document}`` that is not part of a comment. This way we do not
+    read the body of large documents.
+
+    Arguments:
+
+        filepath
+
+            The location of the tex file.
+
+        block_size
+
+            The number of bytes we read at once.
+
+    Returns: ``(bytes, bool)``
+
+        The content of the file before ``\\begin{document}`` and a boolean
+        that specifies if we found ``\\begin{document}``. If the file does
+        not contain ``\\begin{document}``, then we return the whole file.
+
+    Examples:
+
+        >>> preamble, found = read_until_document('Tests/TeX/packages.tex',
+        ...                                       block_size=16)
+        >>> found
+        True
+        >>> print(preamble.decode('utf-8').split()[-1])
+        \\input{input/packages_input2}
+        >>> preamble, found = read_until_document(
+        ...     'Tests/TeX/input/packages_input1.tex')
+        >>> found
+        False
+
+    """
+    content = b''
+    start = 0
+    with open(filepath, 'rb') as tex_file:
+        for block in iter(lambda: tex_file.read(block_size), b''):
+            content += block
+            for begin in BEGIN_DOCUMENT.finditer(content, start):
+                line_start = content.rfind(b'\n', 0, begin.start()) + 1
+                if not COMMENT.search(content, line_start, begin.start()):
+                    return content[:begin.start()], True
+            # The next block might complete a `\begin{document}` that
+            # starts at the end of this block
+            start = max(0, content.rfind(b'\n') + 1)
+    return content, False
+
+
+def scan_tex(content):
+    """Return the directives and the references of the tex code ``content``.
+
+    We search the bytes of ``content`` and only decode the parts we match.
+
+    Arguments:
+
+        content
+
+            The content of a tex file.
+
+    Returns: ``{str: object}``
+
+        A dictionary containing the directives of the file in the item
+        ``directives`` and the references to other files in the item
+        ``references``. Every reference is a tuple containing the command,
+        the directory argument of commands of the package ``import``, the
+        name of the referenced file and a boolean that specifies if the
+        reference appears before ``\\begin{document}``.
+
+    Examples:
+
+        >>> data = scan_tex(b'%!TEX TS-program = xelatex\\n'
+        ...                 b'\\\\usepackage[utf8]{inputenc} '
+        ...                 b'% \\\\input{old}\\n'
+        ...                 b'\\\\begin{document}\\n'
+        ...                 b'\\\\subimport{chapters/}{intro}\\n'
+        ...                 b'\\\\end{document}')
+        >>> print(data['directives']['TS-program'])
+        xelatex
+        >>> for command, directory, name, preamble in data['references']:
+        ...     print(command, directory, name, preamble)
+        usepackage  inputenc True
+        subimport chapters/ intro False
+
+    """
+    directives = {}
+    for line in content.split(b'\n', DIRECTIVE_LINES)[:DIRECTIVE_LINES]:
+        directive = DIRECTIVE.match(line)
+        if directive:
+            name, value = [decode(part).strip() for part in directive.groups()]
+            directives[name] = value
+
+    source = COMMENT.sub(b'', content) if b'%' in content else content
+    begin = BEGIN_DOCUMENT.search(source)
+    end_preamble = begin.start() if begin else len(source)
+    references = []
+    append = references.append
+    for preamble, part in ((True, source[:end_preamble]),
+                           (False, source[end_preamble:])):
+        for command, name, imported, directory, filename in REFERENCE.findall(
+                part):
+            if command:
+                try:
+                    name = name.decode('utf-8')
+                except UnicodeDecodeError:
+                    name = decode(name)
+                append((command.decode('ascii'), '', name.strip(), preamble))
+            else:
+                append((imported.decode('ascii'), decode(directory),
+                        decode(filename).strip(), preamble))
+    return {'directives': directives, 'references': references}
 
 
 def determine_typesetting_directory(ts_directives,
@@ -129,126 +331,42 @@ def determine_typesetting_directory(ts_directives,
     return master_path
 
 
-def find_tex_packages(filepath, ignore_nonexistent_files=False):
-    """Find packages included by the given file.
-
-    This function searches for packages in:
-
-        1. The preamble of ``filepath``, and
-        2. files included in the preamble of ``filepath``.
+def find_tex_includes(filepath):
+    """Find the files included by the given file via ``\\include``.
 
     Arguments:
 
         filepath
 
-            The path to the file which should be searched for packages.
-
-        ignore_nonexistent_files
+            The path to the file which should be searched for included files.
 
-            This option specifies if this function exits with an error code if
-            it encounters a file it can not open.
+    Returns: ``[str]``
 
-    Returns: ``{str}``
+        The names of the included files in the order of the ``\\include``
+        commands. The names are relative to the directory of ``filepath``
+        and do not contain the extension ``.tex``.
 
     Examples:
 
         >>> chdir('Tests/TeX')
-        >>> packages = find_tex_packages('packages.tex')
-        >>> isinstance(packages, set)
-        True
-        >>> for package in sorted(packages):
-        ...     print(package)
-        booktabs
-        csquotes
-        framed
-        mathtools
-        polyglossia
-        xcolor
-        >>> 'inputenc' in list(find_tex_packages('applemac.tex'))
-        True
+        >>> for name in find_tex_includes('include.tex'):
+        ...     print(name)
+        input/chapter1
+        input/chapter2
+        input/chapter3
+        >>> find_tex_includes('non_existent_file.tex')
+        []
         >>> chdir('../..')
 
     """
-    filepath = expand_name(filepath)
     if not isfile(filepath):
-        if ignore_nonexistent_files:
-            return set()
-        print("""<p class="error">Cannot open {} to check for packages.</p>
-                 <p class="error">This is most likely a problem with
-                                  TM_LATEX_MASTER</p>
-              """.format(filepath))
-        exit(EXIT_FILE_ERROR)
-
-    option_regex = r'\[[^\]]+\]'
-    argument_regex = r'\{([^}#]+)\}'
-    input_regex = compile(r'[^%]*?\\input{}'.format(argument_regex))
-    package_regex = compile(r'[^%]*?\\usepackage(?:{})?{}'.format(
-        option_regex, argument_regex))
-    begin_regex = compile(r'[^%]*?\\begin\{document\}')
-
-    # Search for packages and included files in the tex document
-    done_reading = False
-    included_files = set()
-    packages = set()
-    for encoding in encodings:
-        try:
-            with open(filepath, encoding=encoding) as file:
-                for line in file:
-                    match_input = input_regex.match(line)
-                    match_package = package_regex.match(line)
-                    if match_input:
-                        included_files.add(match_input.group(1))
-                    if match_package:
-                        packages.add(match_package.group(1))
-                    if begin_regex.match(line):
-                        break
-                done_reading = True
-        except UnicodeDecodeError:
-            # The current encoding is not correct. Try the next one.
-            continue
-        if done_reading:
-            break
-
-    # Search for packages in all files till we find the beginning of the
-    # document and therefore the end of the preamble
-    included_files = [
-        included_file
-        if included_file.endswith('.tex') else '{}.tex'.format(included_file)
-        for included_file in included_files
+        return []
+    with open(filepath, 'rb') as tex_file:
+        content = tex_file.read()
+    return [
+        name for command, _, name, _ in scan_tex(content)['references']
+        if command == 'include'
     ]
-    match_begin = False
-    while included_files and not match_begin:
-        filepath = expand_name(included_files.pop())
-        if not isfile(filepath):
-            if not ignore_nonexistent_files:
-                print('<p class="warning">Warning: Cannot open ' +
-                      '{} to check for packages.</p>'.format(filepath))
-            continue
-
-        done_reading = False
-        for encoding in encodings:
-            try:
-                with open(filepath, encoding=encoding) as file:
-                    for line in file:
-                        match_package = package_regex.match(line)
-                        match_begin = begin_regex.match(line)
-                        if match_package:
-                            packages.add(match_package.group(1))
-                        if match_begin:
-                            break
-                    done_reading = True
-            except UnicodeDecodeError:
-                # The current encoding is not correct. Try the next one.
-                continue
-            if done_reading:
-                break
-
-    # Split package definitions of the form 'package1, package2' into
-    # 'package1', 'package2'
-    package_set = set()
-    for package in packages:
-        package_set.update(package.strip() for package in package.split(','))
-    return package_set
 
 
 def find_tex_directives(texfile, ignore_root_loops=False):
@@ -303,24 +421,15 @@ def find_tex_directives(texfile, ignore_root_loops=False):
     if not texfile:
         return {}
     root_chain = [texfile]
-    directive_regex = compile(r'%\s*!T[E|e]X\s+([\w-]+)\s*=\s*(.+)')
     directives = {}
     while True:
-        for encoding in encodings:
-            try:
-                lines = [
-                    line
-                    for (line_number,
-                         line) in enumerate(open(texfile, encoding=encoding))
-                    if line_number < 20
-                ]
-                break
-            except UnicodeDecodeError:
-                continue
+        # Directives only appear in the first lines of a file
+        with open(texfile, 'rb') as tex_file:
+            lines = [tex_file.readline() for _ in range(DIRECTIVE_LINES)]
 
         new_directives = {
-            directive.group(1): directive.group(2).rstrip()
-            for directive in [directive_regex.match(line) for line in lines]
+            decode(directive.group(1)): decode(directive.group(2)).rstrip()
+            for directive in [DIRECTIVE.match(line) for line in lines]
             if directive
         }
         directives.update(new_directives)
@@ -25,7 +25,11 @@ class Preferences(object):
             >>> preferences = Preferences()
             >>> keys = ['latexViewer', 'latexEngine', 'latexUselatexmk',
             ...         'latexVerbose', 'latexDebug', 'latexAutoView',
-            ...         'latexKeepLogWin', 'latexEngineOptions']
+            ...         'latexKeepLogWin', 'latexEngineOptions',
+            ...         'latexFlushInterval', 'latexCollapsePasses',
+            ...         'latexFailFast', 'latexIdleTimeout', 'latexTimeout',
+            ...         'latexRerun', 'latexPreambleFormat', 'latexFocusBuild',
+            ...         'latexBuildDirectory']
             >>> all([key in preferences.prefs for key in keys])
             True
 
@@ -35,12 +39,21 @@ class Preferences(object):
 
         self.default_values = {
             'latexAutoView': True,
+            'latexBuildDirectory': "",
+            'latexCollapsePasses': False,
             'latexEngine': "pdflatex",
             'latexEngineOptions': "",
+            'latexFailFast': False,
+            'latexFlushInterval': 50,
+            'latexFocusBuild': False,
+            'latexIdleTimeout': 300,
             'latexVerbose': False,
             'latexUselatexmk': True,
             'latexViewer': "TextMate",
             'latexKeepLogWin': True,
+            'latexPreambleFormat': False,
+            'latexRerun': False,
+            'latexTimeout': 3600,
             'latexDebug': False,
         }
         self.prefs = self.default_values.copy()
@@ -82,10 +95,19 @@ class Preferences(object):
             >>> preferences = Preferences()
             >>> print(preferences.defaults()) # doctest:+NORMALIZE_WHITESPACE
             { latexAutoView = 1;
+              latexBuildDirectory = "";
+              latexCollapsePasses = 0;
               latexDebug = 0;
               latexEngine = pdflatex;
               latexEngineOptions = "";
+              latexFailFast = 0;
+              latexFlushInterval = 50;
+              latexFocusBuild = 0;
+              latexIdleTimeout = 300;
               latexKeepLogWin = 1;
+              latexPreambleFormat = 0;
+              latexRerun = 0;
+              latexTimeout = 3600;
               latexUselatexmk = 1;
               latexVerbose = 0;
               latexViewer = TextMate; }
@@ -0,0 +1,26 @@
+-- Setup ----------------------------------------------------------------------
+
+  $ cd "$TESTDIR"
+  $ source ../../lib/setup_cram.sh
+  $ export PYTHONPATH="$BUNDLE_DIR/Support/lib/Python"
+
+-- Tests ----------------------------------------------------------------------
+
+The databases of the TeX trees should return the same files as `kpsewhich`.
+The script prints the result of every lookup, that does not match the output
+of `kpsewhich`, or that did not find the file at all.
+
+  $ python -c "
+  > from kpathsea import Database, run_kpsewhich
+  > database = Database(run_kpsewhich(['-all', 'ls-R']))
+  > for program, name in [('pdflatex', 'article.cls'),
+  >                       ('pdflatex', 'amsmath.sty'),
+  >                       ('pdflatex', 'graphicx.sty'),
+  >                       ('xelatex', 'fontspec.sty'),
+  >                       ('lualatex', 'luaotfload.sty'),
+  >                       ('bibtex', 'plain.bst')]:
+  >     expected = run_kpsewhich(['-progname=' + program, name])
+  >     location = database.find(name, program)
+  >     if not expected or [location] != expected:
+  >         print(name, location, expected)
+  > "
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# -----------------------------------------------------------------------------
+#           Measure the throughput of the log parsers
+#
+# This script feeds log files from `Tests/Log` repeatedly into the parser
+# classes of `parsing.py` and reports the number of processed lines per second.
+# To compare the single pass pattern dispatch with the old behaviour, which
+# tried one pattern after another, use the option `-sequential`. The option
+# `-mmap` reads the log files via the memory mapped reader of `logreader.py`.
+# -----------------------------------------------------------------------------
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from os import sys, path
+
+BUNDLE_DIRECTORY = path.dirname(path.dirname(path.dirname(
+    path.abspath(__file__))))
+sys.path.insert(1, path.join(BUNDLE_DIRECTORY, 'Support', 'lib', 'Python'))
+
+from argparse import ArgumentParser
+from io import open
+from os import close, devnull, remove
+from tempfile import mkstemp
+from timeit import default_timer
+
+from logreader import MappedLog
+from parsing import (BibTexParser, BiberParser, ChkTexParser, LaTexMkParser,
+                     LaTexParser, MakeGlossariesParser, MakeIndexParser,
+                     TexParser)
+
+# -- Global Variables ---------------------------------------------------------
+
+# The parser classes together with the log files we use to test them
+BENCHMARKS = [
+    (BibTexParser, 'bibtex.log'),
+    (BiberParser, 'biber.log'),
+    (ChkTexParser, 'chktex.log'),
+    (LaTexMkParser, 'latexmk_external_bibliography_biber.log'),
+    (LaTexParser, 'latex.log'),
+    (MakeGlossariesParser, 'makeglossaries.log'),
+    (MakeIndexParser, 'makeindex.log'),
+]
+
+# -- Functions ----------------------------------------------------------------
+
+
+def create_parser(parser_class, stream, filename):
+    """Create a parser of type ``parser_class`` reading from ``stream``."""
+    if parser_class in {ChkTexParser, LaTexMkParser, LaTexParser}:
+        return parser_class(stream, False, filename)
+    return parser_class(stream, False)
+
+
+def benchmark(parser_class, logfile, repetitions, mapped=False):
+    """Parse ``logfile`` repeated ``repetitions`` times with ``parser_class``.
+
+    If ``mapped`` is ``True``, then the parser reads the log via ``MappedLog``.
+
+    The function returns the number of lines and the time in seconds it took
+    to parse them.
+
+    Returns: ``(int, float)``
+
+    """
+    with open(path.join(BUNDLE_DIRECTORY, 'Tests', 'Log', logfile),
+              encoding='utf-8') as log:
+        content = log.read()
+    descriptor, filepath = mkstemp(suffix='.log')
+    close(descriptor)
+    with open(filepath, 'w', encoding='utf-8') as log:
+        for _ in range(repetitions):
+            log.write(content)
+    lines = content.count('\n') * repetitions
+
+    stdout = sys.stdout
+    with (MappedLog(filepath) if mapped else
+          open(filepath, encoding='utf-8')) as log, \
+            open(devnull, 'w') as sys.stdout:
+        start = default_timer()
+        # Parsers stop at the end of a run. We therefore start new parsers
+        # until one of them reaches the end of the file.
+        done = True
+        while done:
+            parser = create_parser(parser_class, log, logfile)
+            parser.parse_stream()
+            done = parser.done
+        duration = default_timer() - start
+    sys.stdout = stdout
+    remove(filepath)
+    return lines, duration
+
+
+# -- Main ---------------------------------------------------------------------
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the log parsers.')
+    parser.add_argument('-repetitions',
+                        type=int,
+                        default=500,
+                        help='How often we repeat each log file.')
+    parser.add_argument('-sequential',
+                        action='store_true',
+                        default=False,
+                        help='Try one pattern after another for each line.')
+    parser.add_argument('-mmap',
+                        action='store_true',
+                        default=False,
+                        help='Read the log files via a memory map.')
+    arguments = parser.parse_args()
+
+    TexParser.combine_patterns = not arguments.sequential
+
+    print('{:<22} {:>10} {:>10} {:>14}'.format('Parser', 'Lines', 'Seconds',
+                                               'Lines/Second'))
+    for parser_class, logfile in BENCHMARKS:
+        lines, duration = benchmark(parser_class, logfile,
+                                    arguments.repetitions, arguments.mmap)
+        print('{:<22} {:>10} {:>10.3f} {:>14.0f}'.format(
+            parser_class.__name__, lines, duration, lines / duration))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# -----------------------------------------------------------------------------
+#           Compare the file detection of `LaTexParser` on pathological lines
+#
+# Older versions of `LaTexParser` searched every statement for opened files
+# using the regular expression in `FILE_PATTERN`. On long statements
+# containing many opening parentheses this search backtracks heavily. This
+# script compares the time the regular expression and the linear scanner of
+# `filestack.py` need for such statements of increasing length.
+# -----------------------------------------------------------------------------
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from os import sys, path
+
+BUNDLE_DIRECTORY = path.dirname(path.dirname(path.dirname(
+    path.abspath(__file__))))
+sys.path.insert(1, path.join(BUNDLE_DIRECTORY, 'Support', 'lib', 'Python'))
+
+from argparse import ArgumentParser
+from re import compile
+from timeit import default_timer
+
+from filestack import FileStack
+
+# -- Global Variables ---------------------------------------------------------
+
+# The regular expression older versions of `LaTexParser` used
+FILE_PATTERN = compile('.*?\\(\\.\\/([^\\)]*?\\.(tex|thesis)( |$))')
+
+# Statements containing the given fragment repeatedly
+PATHOLOGICAL_LINES = [
+    ('unclosed paths', '(./chapter '),
+    ('nested packages', '(/usr/local/texlive/texmf-dist/tex/latex/a.sty '),
+    ('box content', '[]\\T1/lmr/m/n/10 (see (figure '),
+]
+
+# -- Functions ----------------------------------------------------------------
+
+
+def measure(function, line, repetitions):
+    """Return the time in seconds ``function`` needs to process ``line``.
+
+    Returns: ``float``
+
+    """
+    start = default_timer()
+    for _ in range(repetitions):
+        function(line)
+    return (default_timer() - start) / repetitions
+
+
+# -- Main ---------------------------------------------------------------------
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='Compare the file detection on pathological lines.')
+    parser.add_argument('-repetitions',
+                        type=int,
+                        default=5,
+                        help='How often we process each line.')
+    parser.add_argument('-lengths',
+                        type=int,
+                        nargs='+',
+                        default=[1000, 4000, 16000],
+                        help='The lengths of the lines in characters.')
+    arguments = parser.parse_args()
+
+    print('{:<18} {:>10} {:>14} {:>14}'.format('Line', 'Length',
+                                               'Regex (ms)', 'Scanner (ms)'))
+    for name, fragment in PATHOLOGICAL_LINES:
+        for length in arguments.lengths:
+            line = (fragment * (length // len(fragment) + 1))[:length]
+            regex = measure(FILE_PATTERN.match, line, arguments.repetitions)
+            scanner = measure(lambda line: FileStack('thesis.tex').scan(line),
+                              line, arguments.repetitions)
+            print('{:<18} {:>10} {:>14.3f} {:>14.3f}'.format(
+                name, length, regex * 1000, scanner * 1000))
@@ -0,0 +1,578 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# -----------------------------------------------------------------------------
+#           Generate large synthetic log files for the log parsers
+#
+# The log files in `Tests/Log` are only a few kilobytes large. This script
+# recombines and mutates the messages of these files to create realistic logs
+# of (almost) arbitrary size: LaTeX logs containing many (deeply nested) files,
+# box warnings and references, multi-run latexmk logs and logs of bibtex,
+# makeglossaries and chktex. For a fixed seed the output is always the same.
+#
+# Example:
+#
+#     python Tests/bin/generate_log.py latexmk 100 /tmp/latexmk_100MB.log
+# -----------------------------------------------------------------------------
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from argparse import ArgumentParser
+from bisect import bisect
+from io import open
+from random import Random
+
+# -- Global Variables ---------------------------------------------------------
+
+# TeX breaks lines after this number of characters
+MAX_LINE_LENGTH = 79
+
+# The maximum nesting depth of included files
+MAX_DEPTH = 6
+
+# The number of bytes of a latexmk log we reserve for a single run of pdflatex
+RUN_SIZE = 1 << 24
+
+WORDS = ('system kernel scheduler interrupt latency memory partition device '
+         'driver thread process Grüße real-time embedded operating priority '
+         'inversion semaphore mutex deadline preemption timer').split()
+
+PACKAGES = ('amsmath amssymb biblatex booktabs caption etoolbox fontenc '
+            'geometry graphicx hyperref inputenc kvoptions listings '
+            'microtype siunitx tikz xcolor').split()
+
+MACROS = 'blubber foo textbff citep autoref includegrahpics'.split()
+
+LATEX_HEADER = """\
+This is pdfTeX, Version 3.14159265-2.6-1.40.15 (TeX Live 2014) (preloaded \
+format=pdflatex)
+ restricted \\write18 enabled.
+entering extended mode
+(./{job}.tex
+LaTeX2e <2014/05/01>
+Babel <3.9k> and hyphenation patterns for 78 languages loaded.
+(/usr/local/texlive/2014/texmf-dist/tex/latex/base/report.cls
+Document Class: report 2007/10/19 v1.4h Standard LaTeX document class
+(/usr/local/texlive/2014/texmf-dist/tex/latex/base/size10.clo))
+"""
+
+LATEX_TRAILER = """\
+
+LaTeX Warning: There were undefined references.
+
+LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right.
+
+ )</usr/local/texlive/2014/texmf-dist/fonts/type1/public/amsfonts/cm/cmbx12.pfb\
+></usr/local/texlive/2014/texmf-dist/fonts/type1/public/amsfonts/cm/cmr10.pfb>
+Output written on {job}.pdf ({pages} pages, {size} bytes).
+Transcript written on {job}.log.
+"""
+
+LATEXMK_HEADER = """\
+Latexmk: This is Latexmk, John Collins, 10 Nov 2013, version: 4.39.
+**** Report bugs etc to John Collins <collins at phys.psu.edu>. ****
+"""
+
+LATEXMK_RULE = """\
+Latexmk: applying rule '{rule}'...
+Rule '{rule}': File changes, etc:
+   Changed files, or newly in use since previous run(s):
+      '{job}.aux'
+------------
+Run number {run} of rule '{rule}'
+------------
+------------
+Running '{command}'
+------------
+"""
+
+LATEXMK_TRAILER = """\
+Latexmk: All targets ({job}.pdf) are up-to-date
+"""
+
+BIBTEX_HEADER = """\
+This is BibTeX, Version 0.99d (TeX Live 2014)
+The top-level auxiliary file: {job}.aux
+The style file: alpha.bst
+"""
+
+MAKEINDEX_RUN = """\
+makeindex  -s "{job}.ist" -t "{job}.{log}" -o "{job}.{output}" \
+"{job}.{input}"
+This is makeindex, version 2.15 [TeX Live 2014] (kpathsea + Thai support).
+Scanning style file ./{job}.ist.............................done \
+(29 attributes redefined, 0 ignored).
+Scanning input file {job}.{input}....done ({entries} entries accepted, \
+0 rejected).
+Sorting entries...done ({comparisons} comparisons).
+Generating output file {job}.{output}....done ({lines} lines written, \
+0 warnings).
+Output written in {job}.{output}.
+Transcript written in {job}.{log}.
+"""
+
+XINDY_RUN = """\
+xindy  -L english  -I xindy -M "{job}" -t "{job}.{log}" -o "{job}.{output}" \
+"{job}.{input}"
+Opening logfile "{job}.{log}" (done)
+Reading indexstyle...
+Loading module "lang/english/latin9-lang.xdy"...
+Finished loading module "lang/english/latin9-lang.xdy".
+Loading module "{job}.xdy"...
+Finished loading module "{job}.xdy".
+Finished reading indexstyle.
+Finalizing indexstyle... (done)
+
+Reading raw-index "/var/folders/hx/T/oZOEAOjoQV"...
+Finished reading raw-index.
+
+Processing index... [10%] [20%] [30%] [40%] [50%] [60%] [70%] [80%] [90%] \
+[100%]
+Finished processing index.
+
+Writing markup... [10%] [20%] [30%] [40%] [50%] [60%] [70%] [80%] [90%] [100%]
+Markup written into file "{job}.{output}".
+"""
+
+# The glossary types of the makeglossaries log together with the extensions
+# of their log, output and input files
+GLOSSARY_TYPES = [
+    ('main', 'glg', 'gls', 'glo'),
+    ('acronym', 'alg', 'acr', 'acn'),
+    ('symbols', 'slg', 'sls', 'slo'),
+]
+
+CHKTEX_HEADER = """\
+ChkTeX v1.7.2 - Copyright 1995-96 Jens T. Berger Thielemann.
+Compiled with POSIX extended regex support.
+"""
+
+CHKTEX_MESSAGES = [
+    ('Warning', 1, 'Command terminated with space.', '\\makeglossaries',
+     '{}^'),
+    ('Warning', 8, 'Wrong length of dash may have been used.',
+     'pages 10-20 of the {word}', '{}^'),
+    ('Warning', 24, 'Delete this space to maintain correct pagereferences.',
+     'The {word} \\label{{sec:{word}}}', '{}^'),
+    ('Warning', 36, 'You should put a space in front of parenthesis.',
+     'the {word}(see below)', '{}^'),
+    ('Error', 14, 'Could not find argument for command.',
+     '\\verb*!{word}!', '{}^^^^^'),
+]
+
+# -- Functions ----------------------------------------------------------------
+
+
+def wrap(text):
+    """Break the lines of ``text`` after ``MAX_LINE_LENGTH`` characters.
+
+    Returns: ``str``
+
+    Examples:
+
+        >>> [len(line) for line in wrap('a' * 200).split('\\n')]
+        [79, 79, 42]
+
+    """
+    lines = []
+    for line in text.split('\n'):
+        while len(line) > MAX_LINE_LENGTH:
+            lines.append(line[:MAX_LINE_LENGTH])
+            line = line[MAX_LINE_LENGTH:]
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def choose(rng, table):
+    """Pick an item of ``table``, a list of ``(weight, item)`` tuples.
+
+    Returns: ``object``
+
+    """
+    totals = []
+    total = 0
+    for weight, _ in table:
+        total += weight
+        totals.append(total)
+    return table[bisect(totals, rng.random() * total)][1]
+
+
+def words(rng, minimum, maximum):
+    """Return between ``minimum`` and ``maximum`` random words.
+
+    Returns: ``str``
+
+    """
+    return ' '.join(rng.choice(WORDS)
+                    for _ in range(rng.randint(minimum, maximum)))
+
+
+# -- Classes ------------------------------------------------------------------
+
+
+class LogWriter(object):
+    """Write UTF-8 encoded text to a file and count the written bytes."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.stream.write(data)
+        self.size += len(data)
+
+
+class LaTexLog(object):
+    """Write the output of a single pdflatex run.
+
+    The document consists of chapters in separate files. Each file includes
+    other files up to a depth of ``MAX_DEPTH``. Between the includes TeX
+    reports loaded packages, pages, figures, box warnings, references,
+    citations and a few errors.
+
+    """
+
+    def __init__(self, writer, rng, job):
+        self.writer = writer
+        self.rng = rng
+        self.job = job
+        self.page = 1
+        self.figure = 0
+        self.messages = [
+            (6, self.package),
+            (3, self.page_number),
+            (1, self.figure_include),
+            (2, self.reference),
+            (2, self.citation),
+            (4, self.underfull),
+            (2, self.overfull),
+            (0.5, self.font_warning),
+            (0.5, self.package_warning),
+            (0.3, self.pdftex_warning),
+            (0.2, self.file_line_error),
+            (0.1, self.old_style_error),
+        ]
+
+    def write(self, size):
+        """Write a log containing roughly ``size`` bytes."""
+        end = self.writer.size + size
+        self.writer.write(LATEX_HEADER.format(job=self.job))
+        chapter = 0
+        while self.writer.size < end:
+            chapter += 1
+            self.write_file('chapters/chapter{}'.format(chapter),
+                            self.rng.randint(0, MAX_DEPTH), end)
+        self.writer.write(
+            LATEX_TRAILER.format(job=self.job,
+                                 pages=self.page,
+                                 size=self.writer.size))
+
+    def write_file(self, name, depth, end):
+        """Write the messages for the file ``name`` and its includes."""
+        rng = self.rng
+        self.filename = './{}.tex'.format(name)
+        self.line = rng.randint(1, 20)
+        self.writer.write('({}\n'.format(self.filename))
+        for section in range(rng.randint(5, 40)):
+            if self.writer.size >= end:
+                break
+            if depth and rng.random() < 0.1:
+                self.write_file('{}/section{}'.format(name, section),
+                                depth - 1, end)
+                self.filename = './{}.tex'.format(name)
+            self.line += rng.randint(1, 30)
+            choose(rng, self.messages)()
+        self.writer.write(')\n')
+
+    def package(self):
+        package = self.rng.choice(PACKAGES)
+        self.writer.write(
+            '(/usr/local/texlive/2014/texmf-dist/tex/latex/{0}/{0}.sty)\n'.
+            format(package))
+
+    def page_number(self):
+        self.page += 1
+        self.writer.write('[{}]\n'.format(self.page))
+
+    def figure_include(self):
+        self.figure += 1
+        self.writer.write(
+            '<Figures/figure_{0}.pdf, id={1}, 240.9pt x 338.26375pt>\n'
+            '<use Figures/figure_{0}.pdf>\n'.format(self.figure,
+                                                    self.figure * 7))
+
+    def reference(self):
+        self.writer.write(
+            wrap("\nLaTeX Warning: Reference `figure:{}' on page {} undefined "
+                 "on input line {}.\n\n".format(
+                     self.rng.choice(WORDS), self.page, self.line)))
+
+    def citation(self):
+        self.writer.write(
+            wrap("\nLaTeX Warning: Citation `{}_{}' on page {} undefined on "
+                 "input line {}.\n\n".format(
+                     self.rng.choice(WORDS), self.rng.randint(1990, 2014),
+                     self.page, self.line)))
+
+    def underfull(self):
+        self.writer.write(
+            wrap('\nUnderfull \\hbox (badness {}) in paragraph at lines '
+                 '{}--{}\n[]\\T1/lmr/m/n/10 {}\n []\n\n'.format(
+                     self.rng.randint(1000, 10000), self.line,
+                     self.line + 1, words(self.rng, 3, 30))))
+
+    def overfull(self):
+        self.writer.write(
+            wrap('\nOverfull \\hbox ({:.5f}pt too wide) in paragraph at lines '
+                 '{}--{}\n[]\\T1/lmr/m/n/10 {}|\n []\n\n'.format(
+                     self.rng.random() * 50, self.line, self.line + 1,
+                     words(self.rng, 3, 30))))
+
+    def font_warning(self):
+        self.writer.write(
+            "\nLaTeX Font Warning: Font shape `OT1/cmss/m/n' in size <{}> not "
+            "available\n".format(self.rng.randint(4, 6)))
+
+    def package_warning(self):
+        self.writer.write(
+            wrap("\nPackage rerunfilecheck Warning: File `{}.out' has changed."
+                 "\n(rerunfilecheck)                Rerun to get outlines "
+                 "right\n(rerunfilecheck)                or use package "
+                 "`bookmark'.\n\n".format(self.job)))
+
+    def pdftex_warning(self):
+        self.writer.write(
+            wrap('\npdfTeX warning: pdflatex (file ./Figures/figure_{}.pdf): '
+                 'PDF inclusion: found PDF version <1.6>, but at most version '
+                 '<1.5> allowed\n'.format(self.figure)))
+
+    def file_line_error(self):
+        macro = self.rng.choice(MACROS)
+        self.writer.write(
+            '{}:{}: Undefined control sequence.\nl.{} \\{}\n\n'.format(
+                self.filename, self.line, self.line, macro))
+
+    def old_style_error(self):
+        self.writer.write(
+            '! Undefined control sequence.\nl.{} \\{}\n\n'.format(
+                self.line, self.rng.choice(MACROS)))
+
+
+# -- Generators ---------------------------------------------------------------
+
+
+def latex_log(writer, size, rng):
+    """Write the log of a single pdflatex run."""
+    LaTexLog(writer, rng, 'thesis').write(size)
+
+
+def bibtex_log(writer, size, rng, job='thesis'):
+    """Write the log of a bibtex run."""
+    end = writer.size + size
+    writer.write(BIBTEX_HEADER.format(job=job))
+    warnings = 0
+    database = 0
+    while writer.size < end:
+        if rng.random() < 0.05:
+            database += 1
+            writer.write('Database file #{}: references{}.bib\n'.format(
+                database, database))
+        key = '{}_{}'.format(rng.choice(WORDS), rng.randint(1990, 2014))
+        line = rng.randint(1, 5000)
+        message = choose(rng, [
+            (3, 'Warning--empty journal in {key}\n'),
+            (3, 'Warning--I didn\'t find a database entry for "{key}"\n'),
+            (2, 'Warning--to sort, need author or key in {key}\n'),
+            (2, '--line {line} of file references.bib\n'
+                'Warning--entry type for "{key}" isn\'t style-file defined\n'),
+            (0.2, "I was expecting a `,' or a `}}'---line {line} of file "
+                  "references.bib\n"),
+            (0.2, 'Too many commas in name 1 of "S.R.~Arridge, S.R.~Grindrod, '
+                  'A.D.~Linney" for entry {key}\n'),
+        ])
+        if message.startswith('Warning') or message.startswith('--'):
+            warnings += 1
+        writer.write(wrap(message.format(key=key, line=line)))
+    writer.write('(There were {} warnings)\n'.format(warnings))
+
+
+def makeindex_log(writer, rng, job='thesis'):
+    """Write the output of a makeindex run for the index of ``job``."""
+    entries = rng.randint(1, 2000)
+    writer.write(
+        MAKEINDEX_RUN.format(job=job,
+                             log='ilg',
+                             output='ind',
+                             input='idx',
+                             entries=entries,
+                             comparisons=entries * 11,
+                             lines=entries * 3))
+
+
+def latexmk_log(writer, size, rng):
+    """Write the log of a latexmk call running pdflatex several times.
+
+    Between the runs of pdflatex latexmk calls bibtex and makeindex.
+
+    """
+    job = 'thesis'
+    runs = max(3, size // RUN_SIZE)
+    writer.write(LATEXMK_HEADER)
+    for run in range(1, runs + 1):
+        writer.write(
+            LATEXMK_RULE.format(rule='pdflatex',
+                                job=job,
+                                run=run,
+                                command='pdflatex  -recorder  "{}.tex"'.format(
+                                    job)))
+        LaTexLog(writer, rng, job).write(size // runs)
+        writer.write("Latexmk: Log file says output to '{}.pdf'\n".format(job))
+        if run % 3 == 1:
+            rule = 'bibtex {}'.format(job)
+            writer.write(
+                LATEXMK_RULE.format(rule=rule,
+                                    job=job,
+                                    run=run // 3 + 1,
+                                    command='bibtex  "{}"'.format(job)))
+            bibtex_log(writer, rng.randint(1 << 10, 1 << 14), rng, job)
+        if run % 3 == 2:
+            rule = 'makeindex {}.idx'.format(job)
+            writer.write(
+                LATEXMK_RULE.format(rule=rule,
+                                    job=job,
+                                    run=run // 3 + 1,
+                                    command='makeindex  -o "{0}.ind" '
+                                    '"{0}.idx"'.format(job)))
+            makeindex_log(writer, rng, job)
+    writer.write(LATEXMK_TRAILER.format(job=job))
+
+
+def makeglossaries_log(writer, size, rng):
+    """Write the output of repeated makeglossaries runs."""
+    job = 'thesis'
+    end = writer.size + size
+    while writer.size < end:
+        writer.write('makeglossaries version 2.14 (2014-03-06)\n')
+        types = GLOSSARY_TYPES[:rng.randint(1, len(GLOSSARY_TYPES))]
+        for name, log, output, input in types:
+            writer.write("added glossary type '{}' ({},{},{})\n".format(
+                name, log, output, input))
+        for name, log, output, input in types:
+            if rng.random() < 0.5:
+                entries = rng.randint(1, 500)
+                writer.write(
+                    MAKEINDEX_RUN.format(job=job,
+                                         log=log,
+                                         output=output,
+                                         input=input,
+                                         entries=entries,
+                                         comparisons=entries * 7,
+                                         lines=entries * 6))
+            else:
+                writer.write(
+                    XINDY_RUN.format(job=job,
+                                     log=log,
+                                     output=output,
+                                     input=input))
+
+
+def chktex_log(writer, size, rng):
+    """Write the output of chktex for a large document."""
+    end = writer.size + size
+    writer.write(CHKTEX_HEADER)
+    counts = {'Error': 0, 'Warning': 0}
+    while writer.size < end:
+        kind, number, message, source, caret = rng.choice(CHKTEX_MESSAGES)
+        counts[kind] += 1
+        indentation = ' ' * rng.randint(0, 12)
+        source = source.format(word=rng.choice(WORDS))
+        writer.write('{} {} in chapters/chapter{}.tex line {}: {}\n'
+                     '{}{}\n{}\n'.format(
+                         kind, number, rng.randint(1, 50),
+                         rng.randint(1, 3000), message, indentation, source,
+                         caret.format(' ' * (len(indentation) +
+                                             rng.randint(0, len(source))))))
+        if kind == 'Error':
+            writer.write('\n')
+    writer.write('{} errors printed; {} warnings printed; No user suppressed '
+                 'warnings; No line suppressed warnings.\n\n'.format(
+                     counts['Error'], counts['Warning']))
+
+
+# The available kinds of logs
+GENERATORS = {
+    'bibtex': bibtex_log,
+    'chktex': chktex_log,
+    'latex': latex_log,
+    'latexmk': latexmk_log,
+    'makeglossaries': makeglossaries_log,
+}
+
+
+def generate(kind, filepath, size, seed=0):
+    """Write a synthetic log of type ``kind`` to ``filepath``.
+
+    Arguments:
+
+        kind
+
+            One of the keys of ``GENERATORS``.
+
+        filepath
+
+            The location of the generated log.
+
+        size
+
+            The approximate size of the log in bytes.
+
+        seed
+
+            The seed of the random number generator.
+
+    Returns: ``int``
+
+        The actual size of the generated log in bytes.
+
+    Examples:
+
+        >>> from os import close, remove
+        >>> from tempfile import mkstemp
+        >>> descriptor, filepath = mkstemp(suffix='.log')
+        >>> close(descriptor)
+        >>> 10000 <= generate('latex', filepath, 10000) < 20000
+        True
+        >>> remove(filepath)
+
+    """
+    with open(filepath, 'wb') as log:
+        writer = LogWriter(log)
+        GENERATORS[kind](writer, size, Random(seed))
+    return writer.size
+
+
+# -- Main ---------------------------------------------------------------------
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Generate a synthetic log file.')
+    parser.add_argument('kind',
+                        choices=sorted(GENERATORS),
+                        help='The program that produced the log.')
+    parser.add_argument('size',
+                        type=float,
+                        help='The size of the log in megabytes.')
+    parser.add_argument('filepath', help='The location of the log.')
+    parser.add_argument('-seed',
+                        type=int,
+                        default=0,
+                        help='The seed for the random number generator.')
+    arguments = parser.parse_args()
+
+    size = generate(arguments.kind, arguments.filepath,
+                    int(arguments.size * (1 << 20)), arguments.seed)
+    print('Wrote {} bytes to {}'.format(size, arguments.filepath))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# -----------------------------------------------------------------------------
+#           Count the write system calls of the log parsers
+#
+# This script feeds log files from `Tests/Log` repeatedly into the parser
+# classes of `parsing.py` and counts the number of `write` system calls the
+# HTML output produces. It compares the output written directly to standard
+# output with the output batched by `BufferedOutput`.
+# -----------------------------------------------------------------------------
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from os import sys, path
+
+BUNDLE_DIRECTORY = path.dirname(path.dirname(path.dirname(
+    path.abspath(__file__))))
+sys.path.insert(1, path.join(BUNDLE_DIRECTORY, 'Support', 'lib', 'Python'))
+
+from argparse import ArgumentParser
+from io import BufferedWriter, FileIO, TextIOWrapper
+from os import devnull
+from timeit import default_timer
+
+from events import BufferedOutput
+from logreader import MappedLog
+from parsing import LaTexMkParser, LaTexParser
+
+# -- Global Variables ---------------------------------------------------------
+
+# The parser classes together with the log files we use to test them
+BENCHMARKS = [
+    (LaTexMkParser, 'latexmk_external_bibliography_biber.log'),
+    (LaTexParser, 'latex.log'),
+]
+
+# -- Classes ------------------------------------------------------------------
+
+
+class CountingFile(FileIO):
+    """A raw file that counts the calls of ``write``."""
+
+    def __init__(self, *arguments):
+        super(CountingFile, self).__init__(*arguments)
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super(CountingFile, self).write(data)
+
+
+# -- Functions ----------------------------------------------------------------
+
+
+def benchmark(parser_class, logfile, repetitions, interval):
+    """Parse ``logfile`` ``repetitions`` times and count the writes.
+
+    If ``interval`` is ``None``, then the parser writes directly to the
+    output stream. Otherwise we use a ``BufferedOutput`` with the given
+    interval.
+
+    Returns: ``(int, float)``
+
+    """
+    raw = CountingFile(devnull, 'w')
+    stream = TextIOWrapper(BufferedWriter(raw), encoding='utf-8')
+    output = stream if interval is None else BufferedOutput(stream, interval)
+    filepath = path.join(BUNDLE_DIRECTORY, 'Tests', 'Log', logfile)
+
+    stdout = sys.stdout
+    sys.stdout = output
+    start = default_timer()
+    for _ in range(repetitions):
+        with MappedLog(filepath) as log:
+            parser_class(log, True, logfile).parse_stream()
+    output.flush()
+    if interval is not None:
+        output.close()
+    duration = default_timer() - start
+    sys.stdout = stdout
+    stream.close()
+    return raw.writes, duration
+
+
+# -- Main ---------------------------------------------------------------------
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='Count the write system calls of the log parsers.')
+    parser.add_argument('-repetitions',
+                        type=int,
+                        default=200,
+                        help='How often we parse each log file.')
+    parser.add_argument('-interval',
+                        type=float,
+                        default=50,
+                        help='The flush interval in milliseconds.')
+    arguments = parser.parse_args()
+
+    print('{:<16} {:<10} {:>10} {:>10}'.format('Parser', 'Output', 'Writes',
+                                               'Seconds'))
+    for parser_class, logfile in BENCHMARKS:
+        for name, interval in [('direct', None),
+                               ('buffered', arguments.interval / 1000)]:
+            writes, duration = benchmark(parser_class, logfile,
+                                         arguments.repetitions, interval)
+            print('{:<16} {:<10} {:>10} {:>10.3f}'.format(
+                parser_class.__name__, name, writes, duration))
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# -----------------------------------------------------------------------------
+#           Measure how the log parsers scale with the size of the log
+#
+# This script generates synthetic logs (see `generate_log.py`) of the given
+# sizes and parses them with the parser classes of `parsing.py`. For every
+# parser and size it reports the throughput and the peak resident set size
+# of the process that parsed the log. For every parser it also reports how
+# long each pattern of the parser takes to match a statement of the log.
+#
+# Every measurement runs in a new process, so the peak memory usage of one
+# measurement does not influence the next one. The script does not need a
+# network connection or a TeX distribution.
+#
+# Use `-save` to store the results as baseline and `-baseline` to compare a
+# later run against the stored results:
+#
+#     python Tests/bin/scale_benchmark.py -sizes 1 100 -save baseline.json
+#     python Tests/bin/scale_benchmark.py -sizes 1 100 -baseline baseline.json
+#
+# If the throughput drops or the memory usage grows by more than the given
+# tolerance, then the script exits with status 1.
+# -----------------------------------------------------------------------------
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from os import sys, path
+
+BUNDLE_DIRECTORY = path.dirname(path.dirname(path.dirname(
+    path.abspath(__file__))))
+sys.path.insert(1, path.join(BUNDLE_DIRECTORY, 'Support', 'lib', 'Python'))
+
+from argparse import ArgumentParser, SUPPRESS
+from codecs import getwriter
+from io import open
+from json import dumps, load, loads
+from os import devnull, makedirs
+from platform import python_version
+from resource import getrusage, RUSAGE_SELF
+from shutil import rmtree
+from subprocess import check_output
+from tempfile import mkdtemp
+from timeit import default_timer
+
+from benchmark import create_parser
+from events import EventList
+from generate_log import generate
+from logreader import MappedLog
+from parsing import (BibTexParser, ChkTexParser, LaTexMkParser, LaTexParser,
+                     MakeGlossariesParser)
+
+# -- Global Variables ---------------------------------------------------------
+
+# The parser classes together with the kind of log we generate for them
+BENCHMARKS = [
+    (BibTexParser, 'bibtex'),
+    (ChkTexParser, 'chktex'),
+    (LaTexMkParser, 'latexmk'),
+    (LaTexParser, 'latex'),
+    (MakeGlossariesParser, 'makeglossaries'),
+]
+
+PARSERS = {
+    parser_class.__name__: parser_class
+    for parser_class, _ in BENCHMARKS
+}
+
+MEGABYTE = 1 << 20
+
+# The number of places in the log where we take statements for the pattern
+# measurements
+SAMPLE_BLOCKS = 100
+
+# -- Functions ----------------------------------------------------------------
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in megabytes.
+
+    Returns: ``float``
+
+    """
+    rss = getrusage(RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / MEGABYTE if sys.platform == 'darwin' else rss / 1024
+
+
+def measure(parser_name, filepath, mapped):
+    """Parse the log at ``filepath`` and measure time and memory usage.
+
+    This function runs in a separate process.
+
+    Returns: ``{str: object}``
+
+    """
+    parser_class = PARSERS[parser_name]
+    idle_rss = peak_rss()
+    stdout = sys.stdout
+    with (MappedLog(filepath) if mapped else
+          open(filepath, encoding='utf-8')) as log, \
+            getwriter('utf-8')(open(devnull, 'wb')) as sys.stdout:
+        start = default_timer()
+        # Parsers stop at the end of a run. We therefore start new parsers
+        # until one of them reaches the end of the file.
+        done = True
+        while done:
+            parser = create_parser(parser_class, log, 'thesis.tex')
+            parser.parse_stream()
+            done = parser.done
+        duration = default_timer() - start
+    sys.stdout = stdout
+    return {
+        'seconds': duration,
+        'idle_rss': idle_rss,
+        'peak_rss': peak_rss(),
+    }
+
+
+def count_lines(filepath):
+    """Return the number of lines of the file at ``filepath``.
+
+    Returns: ``int``
+
+    """
+    lines = 0
+    with open(filepath, 'rb') as log:
+        for chunk in iter(lambda: log.read(MEGABYTE), b''):
+            lines += chunk.count(b'\n')
+    return lines
+
+
+def sample_statements(filepath, count):
+    """Read about ``count`` statements spread evenly over the whole log.
+
+    Returns: ``[str]``
+
+    """
+    statements = []
+    with MappedLog(filepath) as log:
+        for block in range(SAMPLE_BLOCKS):
+            # Start at the beginning of a line
+            log.seek(block * log.end // SAMPLE_BLOCKS)
+            if block:
+                log.read_raw_line()
+            for _ in range(count // SAMPLE_BLOCKS):
+                statement = log.read_statement()
+                if not statement:
+                    break
+                statements.append(statement)
+    return statements
+
+
+def pattern_costs(parser_class, filepath, count):
+    """Measure how long each pattern of ``parser_class`` takes per statement.
+
+    Returns: ``[(str, int, float)]``
+
+        A list containing the pattern, the number of matching statements and
+        the time in nanoseconds the pattern needs to match a single statement.
+
+    """
+    statements = sample_statements(filepath, count)
+    with MappedLog(filepath) as log:
+        parser = create_parser(parser_class, log, 'thesis.tex')
+    parser.sink = EventList()
+    costs = []
+    for regex, _ in parser.patterns:
+        match = regex.match
+        start = default_timer()
+        hits = sum(1 for statement in statements if match(statement))
+        duration = default_timer() - start
+        costs.append((regex.pattern, hits, duration * 1e9 / len(statements)))
+    return costs
+
+
+def change(value, baseline):
+    """Return the relative change of ``value`` compared to ``baseline``.
+
+    Returns: ``float``
+
+    Examples:
+
+        >>> change(110, 100)
+        0.1
+
+    """
+    return (value - baseline) / baseline if baseline else 0.0
+
+
+def format_change(value, baseline):
+    """Format the change of ``value`` relative to ``baseline`` in percent."""
+    return '{:+.1f}%'.format(100 * change(value, baseline))
+
+
+def run(arguments, directory):
+    """Generate the logs, run the measurements and print the results.
+
+    Returns: ``{str: object}``
+
+    """
+    results = {'python': python_version(), 'throughput': {}, 'patterns': {}}
+    baseline = None
+    if arguments.baseline:
+        with open(arguments.baseline, encoding='utf-8') as baseline_file:
+            baseline = load(baseline_file)
+        if baseline['python'] != results['python']:
+            print('Warning: The baseline uses Python {}\n'.format(
+                baseline['python']))
+    regressions = []
+
+    print('{:<22} {:>8} {:>9} {:>9} {:>12} {:>10} {:>10}'.format(
+        'Parser', 'MB', 'Seconds', 'MB/s', 'Lines/s', 'Peak RSS', 'Idle RSS'))
+    for parser_class, kind in BENCHMARKS:
+        name = parser_class.__name__
+        if arguments.parsers and name not in arguments.parsers:
+            continue
+        for size in arguments.sizes:
+            filepath = path.join(
+                directory, '{}_{}MB_{}.log'.format(kind, size, arguments.seed))
+            if not path.exists(filepath):
+                generate(kind, filepath, int(size * MEGABYTE), arguments.seed)
+            megabytes = path.getsize(filepath) / MEGABYTE
+            lines = count_lines(filepath)
+            result = loads(
+                check_output([
+                    sys.executable, __file__, '-measure', name, filepath
+                ] + (['-mmap'] if arguments.mmap else [])).decode('utf-8'))
+            result['megabytes_per_second'] = megabytes / result['seconds']
+            result['lines_per_second'] = lines / result['seconds']
+            key = '{} {}'.format(name, size)
+            results['throughput'][key] = result
+            print('{:<22} {:>8.1f} {:>9.3f} {:>9.2f} {:>12.0f} {:>10.1f} '
+                  '{:>10.1f}'.format(name, megabytes, result['seconds'],
+                                     result['megabytes_per_second'],
+                                     result['lines_per_second'],
+                                     result['peak_rss'], result['idle_rss']))
+
+            previous = baseline and baseline['throughput'].get(key)
+            if previous:
+                speed = change(result['megabytes_per_second'],
+                               previous['megabytes_per_second'])
+                memory = change(result['peak_rss'], previous['peak_rss'])
+                print('{:<22} {:>8} {:>9} {:>9} {:>12} {:>10}'.format(
+                    '  (baseline)', '', '', format_change(
+                        result['megabytes_per_second'],
+                        previous['megabytes_per_second']), '',
+                    format_change(result['peak_rss'], previous['peak_rss'])))
+                if speed < -arguments.tolerance:
+                    regressions.append('{}: throughput {:+.1f}%'.format(
+                        key, 100 * speed))
+                if memory > arguments.tolerance:
+                    regressions.append('{}: peak RSS {:+.1f}%'.format(
+                        key, 100 * memory))
+
+        # The cost of a pattern does not depend on the size of the log
+        costs = pattern_costs(parser_class, filepath, arguments.statements)
+        results['patterns'][name] = {
+            pattern: nanoseconds
+            for pattern, _, nanoseconds in costs
+        }
+        previous = (baseline['patterns'].get(name, {})
+                    if baseline else {})
+        print('\n  {:<56} {:>8} {:>12}'.format('Pattern', 'Hits',
+                                               'ns/Statement'))
+        for pattern, hits, nanoseconds in costs:
+            comparison = (format_change(nanoseconds, previous[pattern])
+                          if pattern in previous else '')
+            print('  {:<56} {:>8} {:>12.0f} {:>8}'.format(
+                # Escape characters outside of ASCII, since the output
+                # might not support them
+                pattern.encode('ascii', 'backslashreplace').decode('ascii')
+                [:56], hits, nanoseconds, comparison).rstrip())
+        print('')
+
+    if regressions:
+        print('Regressions compared to {}:'.format(arguments.baseline))
+        for regression in regressions:
+            print('  {}'.format(regression))
+    results['regressions'] = regressions
+    return results
+
+
+# -- Main ---------------------------------------------------------------------
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='Measure how the log parsers scale with the log size.')
+    parser.add_argument('-sizes',
+                        type=float,
+                        nargs='+',
+                        default=[1, 10],
+                        help='The sizes of the generated logs in megabytes.')
+    parser.add_argument('-parsers',
+                        nargs='+',
+                        choices=sorted(PARSERS),
+                        help='Only measure the given parser classes.')
+    parser.add_argument('-mmap',
+                        action='store_true',
+                        default=False,
+                        help='Read the log files via a memory map.')
+    parser.add_argument('-seed',
+                        type=int,
+                        default=0,
+                        help='The seed used to generate the logs.')
+    parser.add_argument('-statements',
+                        type=int,
+                        default=20000,
+                        help='The number of statements used to measure the '
+                        'cost of the patterns.')
+    parser.add_argument('-directory',
+                        help='Store the generated logs in this directory and '
+                        'reuse them in later runs.')
+    parser.add_argument('-save', help='Store the results in this JSON file.')
+    parser.add_argument('-baseline',
+                        help='Compare the results with this JSON file.')
+    parser.add_argument('-tolerance',
+                        type=float,
+                        default=10,
+                        help='The change in percent we still accept compared '
+                        'to the baseline.')
+    parser.add_argument('-measure', nargs=2, help=SUPPRESS)
+    arguments = parser.parse_args()
+    arguments.tolerance /= 100
+
+    if arguments.measure:
+        parser_name, filepath = arguments.measure
+        print(dumps(measure(parser_name, filepath, arguments.mmap)))
+        sys.exit(0)
+
+    directory = arguments.directory or mkdtemp()
+    if not path.isdir(directory):
+        makedirs(directory)
+    try:
+        results = run(arguments, directory)
+    finally:
+        if not arguments.directory:
+            rmtree(directory)
+
+    if arguments.save:
+        with open(arguments.save, 'wb') as results_file:
+            results_file.write(
+                dumps(results, indent=2, sort_keys=True).encode('utf-8'))
+    sys.exit(1 if results['regressions'] else 0)
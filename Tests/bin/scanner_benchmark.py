@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# -----------------------------------------------------------------------------
+#           Compare the line based and the byte based preamble scanner
+#
+# Older versions of `tex.py` decoded every tex file line by line, once for
+# every encoding they tried, and read the first lines of a file again for
+# every `%!TEX root` directive. This script generates a synthetic document
+# with a large preamble, a large body and many files included in the
+# preamble. It then compares the time the line based functions — copied
+# into this script — and the current functions of `tex.py` and the project
+# graph need to find the directives and the packages of the document. The
+# option `-latency` adds a delay to every file we open to simulate a network
+# file system.
+# -----------------------------------------------------------------------------
+
+# -- Imports ------------------------------------------------------------------
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from os import sys, path
+
+BUNDLE_DIRECTORY = path.dirname(path.dirname(path.dirname(
+    path.abspath(__file__))))
+sys.path.insert(1, path.join(BUNDLE_DIRECTORY, 'Support', 'lib', 'Python'))
+
+from argparse import ArgumentParser
+import io
+import project
+import tex
+
+from os import chdir, devnull, getcwd, mkdir
+from re import compile
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import sleep
+from timeit import default_timer
+
+from project import ProjectGraph
+from tex import encodings, find_tex_directives
+
+# -- Functions ----------------------------------------------------------------
+
+
+def delay(function, latency):
+    """Return a version of ``function`` that waits ``latency`` seconds before
+    it calls ``function``.
+
+    Returns: ``function``
+
+    """
+    def delayed(*arguments, **keywords):
+        sleep(latency)
+        return function(*arguments, **keywords)
+
+    return delayed
+
+
+open = io.open
+
+
+def graph_packages(texfile):
+    """Return the packages of ``texfile`` via a project graph we do not
+    store, so every call reads all files of the project.
+
+    Returns: ``{str}``
+
+    """
+    graph = ProjectGraph(texfile, devnull)
+    graph.update()
+    return graph.packages()
+
+
+def legacy_directives(texfile):
+    """Return the directives of ``texfile`` like older versions of
+    ``find_tex_directives``.
+
+    Returns: ``{str: str}``
+
+    """
+    directive_regex = compile(r'%\s*!T[E|e]X\s+([\w-]+)\s*=\s*(.+)')
+    for encoding in encodings:
+        try:
+            lines = [
+                line for (line_number,
+                          line) in enumerate(open(texfile, encoding=encoding))
+                if line_number < 20
+            ]
+            break
+        except UnicodeDecodeError:
+            continue
+    return {
+        directive.group(1): directive.group(2).rstrip()
+        for directive in [directive_regex.match(line) for line in lines]
+        if directive
+    }
+
+
+def legacy_packages(filepath):
+    """Return the packages of ``filepath`` like older versions of the
+    bundle, before the project graph existed.
+
+    Returns: ``{str}``
+
+    """
+    input_regex = compile(r'[^%]*?\\input\{([^}#]+)\}')
+    package_regex = compile(
+        r'[^%]*?\\usepackage(?:\[[^\]]+\])?\{([^}#]+)\}')
+    begin_regex = compile(r'[^%]*?\\begin\{document\}')
+    included_files, packages = [], set()
+    for encoding in encodings:
+        try:
+            with open(filepath, encoding=encoding) as file:
+                for line in file:
+                    match_input = input_regex.match(line)
+                    match_package = package_regex.match(line)
+                    if match_input:
+                        included_files.append(match_input.group(1))
+                    if match_package:
+                        packages.add(match_package.group(1))
+                    if begin_regex.match(line):
+                        break
+            break
+        except UnicodeDecodeError:
+            continue
+    for included_file in included_files:
+        with open('{}.tex'.format(included_file), encoding='utf-8') as file:
+            for line in file:
+                match_package = package_regex.match(line)
+                if match_package:
+                    packages.add(match_package.group(1))
+                if begin_regex.match(line):
+                    break
+    package_set = set()
+    for package in packages:
+        package_set.update(package.strip() for package in package.split(','))
+    return package_set
+
+
+def generate(directory, inputs, packages, body_lines):
+    """Generate a document in ``directory``.
+
+    The document loads ``packages`` packages in its preamble and in each of
+    the ``inputs`` files it includes there. Its body contains ``body_lines``
+    lines.
+
+    Returns: ``str``
+
+        The name of the master file.
+
+    """
+    mkdir(path.join(directory, 'preamble'))
+    for number in range(inputs):
+        with open(path.join(directory, 'preamble', '{}.tex'.format(number)),
+                  'w',
+                  encoding='utf-8') as tex_file:
+            tex_file.write('%!TEX root = ../thesis.tex\n')
+            for package in range(packages):
+                tex_file.write('\\usepackage{{p{}x{}}}\n'.format(
+                    number, package))
+    with open(path.join(directory, 'thesis.tex'), 'w',
+              encoding='utf-8') as tex_file:
+        tex_file.write('%!TEX TS-program = pdflatex\n')
+        tex_file.write('\\documentclass{book}\n')
+        for package in range(packages):
+            tex_file.write('\\usepackage{{package{}}} % Größe\n'.format(
+                package))
+        for number in range(inputs):
+            tex_file.write('\\input{{preamble/{}}}\n'.format(number))
+        tex_file.write('\\begin{document}\n')
+        for line in range(body_lines):
+            tex_file.write('Zeile {} mit Umlauten: äöü ß.\n'.format(line))
+        tex_file.write('\\end{document}\n')
+    return 'thesis.tex'
+
+
+def measure(function, argument, repetitions):
+    """Return the time in seconds ``function`` needs for ``argument``.
+
+    Returns: ``float``
+
+    """
+    start = default_timer()
+    for _ in range(repetitions):
+        function(argument)
+    return (default_timer() - start) / repetitions
+
+
+# -- Main ---------------------------------------------------------------------
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='Compare the line based and the byte based scanner.')
+    parser.add_argument('-repetitions',
+                        type=int,
+                        default=5,
+                        help='How often we scan the document.')
+    parser.add_argument('-inputs',
+                        type=int,
+                        default=100,
+                        help='The number of files the preamble includes.')
+    parser.add_argument('-packages',
+                        type=int,
+                        default=50,
+                        help='The number of packages in every file.')
+    parser.add_argument('-body',
+                        type=int,
+                        nargs='+',
+                        default=[1000, 100000, 1000000],
+                        help='The number of lines in the body.')
+    parser.add_argument('-latency',
+                        type=float,
+                        default=0,
+                        help='The time in ms it takes to open a file.')
+    arguments = parser.parse_args()
+    if arguments.latency:
+        open = tex.open = project.open = delay(io.open,
+                                               arguments.latency / 1000)
+
+    directory = getcwd()
+    print('{:<12} {:>10} {:>14} {:>14}'.format('Scan', 'Body', 'Lines (ms)',
+                                               'Bytes (ms)'))
+    for body_lines in arguments.body:
+        chdir(mkdtemp())
+        master = generate('.', arguments.inputs, arguments.packages,
+                          body_lines)
+        assert legacy_packages(master) == graph_packages(master)
+        assert legacy_directives(master) == find_tex_directives(master)
+        for name, legacy, current in [
+            ('directives', legacy_directives, find_tex_directives),
+            ('packages', legacy_packages, graph_packages),
+        ]:
+            print('{:<12} {:>10} {:>14.3f} {:>14.3f}'.format(
+                name, body_lines,
+                measure(legacy, master, arguments.repetitions) * 1000,
+                measure(current, master, arguments.repetitions) * 1000))
+        rmtree(getcwd())
+        chdir(directory)